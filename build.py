@@ -22,7 +22,11 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 '''
 
-from pybuilder.core import init, use_plugin, Author
+import os
+import sys
+
+from pybuilder.core import init, task, use_plugin, Author
+from pybuilder.errors import BuildFailedException
 
 use_plugin("filter_resources")
 
@@ -52,6 +56,7 @@ def initialize(project):
     project.port_to_run_on = "8080"
 
     project.build_depends_on("mock")
+    project.build_depends_on("numpy")
 
     project.depends_on("flask")
     project.depends_on("simplejson")
@@ -78,6 +83,9 @@ def initialize(project):
     project.set_property("coverage_threshold_warn", 99)
     project.set_property("coverage_break_build", True)
 
+    project.set_property('dir_source_benchmark_python', 'src/benchmark/python')
+    project.set_property('formatting_benchmark_threshold', 0.25)
+
     project.set_property('distutils_classifiers', [
         'Development Status :: 4 - Beta',
         'Environment :: Web Environment',
@@ -97,6 +105,25 @@ def initialize(project):
     ])
 
 
+@task('benchmark_formatting', description='Fails when the formatting micro-benchmark regressed against its baseline')
+def benchmark_formatting(project, logger):
+    sys.path[0:0] = [project.expand_path('$dir_source_main_python'), project.expand_path('$dir_source_benchmark_python')]
+    import formatting_benchmarks
+
+    results = formatting_benchmarks.run_benchmarks()
+    formatting_benchmarks.print_results(results, logger.info)
+    baseline_file = formatting_benchmarks.DEFAULT_BASELINE
+    if not os.path.exists(baseline_file):
+        # the baseline is not committed, every build agent measures its own
+        formatting_benchmarks.write_baseline(results, baseline_file)
+        logger.warn('No formatting benchmark baseline at {0}, wrote the results as the baseline'.format(baseline_file))
+        return
+    regressions = formatting_benchmarks.find_regressions(results, formatting_benchmarks.load_baseline(baseline_file),
+                                                         project.get_property('formatting_benchmark_threshold'))
+    if regressions:
+        raise BuildFailedException('Formatting benchmark regressed: {0}'.format('; '.join(regressions)))
+
+
 @init(environments='teamcity')
 def set_properties_for_teamcity_builds(project):
     import os
@@ -0,0 +1,194 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from __future__ import absolute_import, print_function
+import argparse
+import os
+import platform
+import shutil
+import simplejson as json
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from fakelivestatus import FakeLivestatusServer
+
+'''
+    Measures perform_query, format_answer and the complete /query endpoint against a
+    fake livestatus server. Every benchmark is run for each row count, the results
+    are printed and written as JSON to compare them across commits.
+'''
+
+BENCHMARK_COLUMNS = 'host_name description state plugin_output perf_data last_check acknowledged'
+SERVICES_PER_HOST = 10
+CONFIGURATION = '''[livestatus-service]
+livestatus_socket={socket_path}
+log_file={log_file}
+log_level=WARNING
+admins=
+'''
+
+
+def query_for(rows):
+    return 'GET services\nColumns: {0}\nLimit: {1}'.format(BENCHMARK_COLUMNS, rows)
+
+
+def percentile(sorted_samples, percent):
+    index = int(round(percent / 100.0 * (len(sorted_samples) - 1)))
+    return sorted_samples[index]
+
+
+def summarize(name, rows, samples, elapsed=None, concurrency=1):
+    samples = sorted(samples)
+    elapsed = elapsed if elapsed is not None else sum(samples)
+    return {'benchmark': name,
+            'rows': rows,
+            'iterations': len(samples),
+            'concurrency': concurrency,
+            'p50_seconds': percentile(samples, 50),
+            'p95_seconds': percentile(samples, 95),
+            'p99_seconds': percentile(samples, 99),
+            'max_seconds': samples[-1],
+            'queries_per_second': len(samples) / elapsed,
+            'rows_per_second': len(samples) * rows / elapsed}
+
+
+def time_calls(function, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.time()
+        function()
+        samples.append(time.time() - start)
+    return samples
+
+
+def benchmark_perform_query(socket_path, rows, iterations):
+    from livestatus_service.livestatus import perform_query
+    query = query_for(rows)
+    return summarize('perform_query', rows, time_calls(lambda: perform_query(query, socket_path), iterations))
+
+
+def benchmark_format_answer(socket_path, rows, iterations):
+    from livestatus_service.livestatus import LivestatusSocket, format_answer
+    query = query_for(rows)
+    answer = LivestatusSocket(socket_path).send_query_and_receive_json_answer(query)
+    return summarize('format_answer', rows, time_calls(lambda: format_answer(query, answer, None), iterations))
+
+
+def benchmark_query_endpoint(rows, iterations, concurrency):
+    from livestatus_service.webapp import application
+    query = query_for(rows).replace('\n', '\\n')
+    samples = []
+    lock = threading.Lock()
+
+    def run_client():
+        client = application.test_client()
+        for _ in range(iterations):
+            start = time.time()
+            response = client.get('/query', query_string={'q': query})
+            seconds = time.time() - start
+            if response.status_code != 200:
+                raise RuntimeError('/query answered {0}: {1}'.format(response.status_code, response.data[:200]))
+            with lock:
+                samples.append(seconds)
+
+    start = time.time()
+    clients = [threading.Thread(target=run_client) for _ in range(concurrency)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    return summarize('query_endpoint', rows, samples, time.time() - start, concurrency)
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.STDOUT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(arguments, working_directory):
+    import livestatus_service
+    from livestatus_service.configuration import Configuration
+
+    socket_path = os.path.join(working_directory, 'live')
+    configuration_file = os.path.join(working_directory, 'livestatus.cfg')
+    with open(configuration_file, 'w') as configuration:
+        configuration.write(CONFIGURATION.format(socket_path=socket_path,
+                                                 log_file=os.path.join(working_directory, 'livestatus.log')))
+    livestatus_service.initialize(configuration_file)
+    Configuration.DEFAULT_CONFIGURATION_FILE = configuration_file
+
+    hosts = max(arguments.rows) // SERVICES_PER_HOST + 1
+    results = []
+    with FakeLivestatusServer(socket_path, hosts, SERVICES_PER_HOST, arguments.latency):
+        for rows in arguments.rows:
+            for result in (benchmark_perform_query(socket_path, rows, arguments.iterations),
+                           benchmark_format_answer(socket_path, rows, arguments.iterations),
+                           benchmark_query_endpoint(rows, arguments.iterations, arguments.concurrency)):
+                print('{benchmark:>15} {rows:>7} rows: p50 {p50_seconds:.4f}s p95 {p95_seconds:.4f}s '
+                      'p99 {p99_seconds:.4f}s {rows_per_second:>12.0f} rows/s'.format(**result))
+                results.append(result)
+    livestatus_service.shutdown_logging()
+    return results
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description='Benchmarks perform_query, format_answer and /query against a fake livestatus')
+    parser.add_argument('--rows', type=lambda value: [int(rows) for rows in value.split(',')],
+                        default=[1000, 10000, 100000], help='comma separated row counts (default: %(default)s)')
+    parser.add_argument('--iterations', type=int, default=10, help='queries per benchmark and client (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=4, help='concurrent clients of /query (default: %(default)s)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the fake livestatus waits before answering')
+    parser.add_argument('--output', default=None, help='JSON result file (default: target/benchmarks/<commit>.json)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    working_directory = tempfile.mkdtemp(prefix='livestatus-benchmark-')
+    try:
+        results = run_benchmarks(arguments, working_directory)
+    finally:
+        shutil.rmtree(working_directory)
+
+    commit = current_commit()
+    output = arguments.output or os.path.join('target', 'benchmarks', '{0}.json'.format(commit or int(time.time())))
+    if os.path.dirname(output) and not os.path.isdir(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    with open(output, 'w') as output_file:
+        json.dump({'commit': commit,
+                   'timestamp': time.time(),
+                   'python': platform.python_version(),
+                   'latency': arguments.latency,
+                   'results': results}, output_file, indent=4)
+    print('Results written to {0}'.format(output))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
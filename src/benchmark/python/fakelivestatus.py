@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from __future__ import absolute_import
+import os
+import random
+import simplejson as json
+import threading
+import time
+try:  # pragma: no cover
+    import SocketServer as socketserver
+except ImportError:  # pragma: no cover
+    import socketserver
+
+'''
+    A fake livestatus server on a UNIX socket answering queries for the hosts and services
+    tables with generated rows. Supports Columns, Limit, ColumnHeaders, ResponseHeader: fixed16
+    and KeepAlive. Filters and Stats are ignored, every query is answered with all rows up to the limit.
+'''
+
+HOST_COLUMNS = ['name', 'alias', 'address', 'state', 'state_type', 'plugin_output', 'perf_data',
+                'last_check', 'next_check', 'check_interval', 'acknowledged', 'notifications_enabled',
+                'scheduled_downtime_depth', 'num_services', 'contacts', 'groups']
+SERVICE_COLUMNS = ['host_name', 'description', 'state', 'state_type', 'plugin_output', 'long_plugin_output',
+                   'perf_data', 'last_check', 'next_check', 'check_interval', 'acknowledged',
+                   'notifications_enabled', 'scheduled_downtime_depth', 'contacts', 'groups']
+STATES = ['OK', 'WARNING', 'CRITICAL', 'UNKNOWN']
+# the generated rows do not depend on the time they are generated at, so every run measures the same data
+GENERATED_AT = 1500000000
+SERVICE_DESCRIPTIONS = ['ping', 'ssh', 'http', 'disk /', 'disk /var', 'load', 'memory', 'swap', 'ntp', 'procs']
+
+
+def generate_hosts(hosts, services_per_host, seed=42):
+    generator = random.Random(seed)
+    now = GENERATED_AT
+    rows = []
+    for index in range(hosts):
+        state = generator.choice([0] * 18 + [1, 2])
+        rows.append(['host{0:06d}'.format(index),
+                     'Host {0} in rack {1}'.format(index, index % 40),
+                     '10.{0}.{1}.{2}'.format(index // 65536 % 256, index // 256 % 256, index % 256),
+                     state,
+                     1,
+                     'PING {0} - Packet loss = 0%, RTA = {1:.2f} ms'.format('OK' if state == 0 else 'CRITICAL', generator.uniform(0.1, 30)),
+                     'rta={0:.3f}ms;3000.000;5000.000;0; pl=0%;80;100;;'.format(generator.uniform(0.1, 30)),
+                     now - generator.randint(0, 300),
+                     now + generator.randint(0, 300),
+                     5,
+                     0,
+                     1,
+                     0,
+                     services_per_host,
+                     ['admin', 'team{0}'.format(index % 12)],
+                     ['all-hosts', 'location-{0}'.format(index % 7)]])
+    return rows
+
+
+def generate_services(hosts, services_per_host, seed=42):
+    generator = random.Random(seed)
+    now = GENERATED_AT
+    rows = []
+    for host_index in range(hosts):
+        for service_index in range(services_per_host):
+            state = generator.choice([0] * 16 + [1, 2, 3])
+            description = SERVICE_DESCRIPTIONS[service_index % len(SERVICE_DESCRIPTIONS)]
+            if service_index >= len(SERVICE_DESCRIPTIONS):
+                description = '{0} {1}'.format(description, service_index)
+            usage = generator.uniform(0, 100)
+            rows.append(['host{0:06d}'.format(host_index),
+                         description,
+                         state,
+                         1,
+                         u'{0} - {1} usage {2:.1f}% – checked by nrpe'.format(STATES[state], description, usage),
+                         u'' if state == 0 else u'Details:\\nüsage above threshold\\nsee runbook',
+                         'usage={0:.2f}%;80;90;0;100 time={1:.4f}s;;;0;'.format(usage, generator.uniform(0, 2)),
+                         now - generator.randint(0, 300),
+                         now + generator.randint(0, 300),
+                         1,
+                         int(state != 0 and generator.random() < 0.3),
+                         1,
+                         0,
+                         ['admin', 'team{0}'.format(host_index % 12)],
+                         ['all-services', description.split()[0]]])
+    return rows
+
+
+class FakeLivestatusServer(object):
+    """
+    Serves generated tables of hosts x services_per_host rows. latency seconds are waited
+    before every answer. Every connection is handled in a thread of its own.
+    """
+
+    def __init__(self, socket_path, hosts=1000, services_per_host=10, latency=0.0):
+        self.socket_path = socket_path
+        self.latency = latency
+        self.tables = {'hosts': (HOST_COLUMNS, generate_hosts(hosts, services_per_host)),
+                       'services': (SERVICE_COLUMNS, generate_services(hosts, services_per_host))}
+        self.queries = 0
+        self._answers = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.stop()
+
+    def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        fake_server = self
+
+        class QueryHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                fake_server._handle_connection(self.rfile, self.wfile)
+
+        self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, QueryHandler)
+        self._server.daemon_threads = True
+        self._server.request_queue_size = 128
+        thread = threading.Thread(target=self._server.serve_forever, name='fake-livestatus')
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def _handle_connection(self, rfile, wfile):
+        while True:
+            query_lines = []
+            while True:
+                line = rfile.readline()
+                if not line or not line.strip():
+                    break
+                query_lines.append(line.decode('utf-8').rstrip('\n'))
+            if not query_lines:
+                return
+            headers = self._parse(query_lines)
+            if self.latency:
+                time.sleep(self.latency)
+            with self._lock:
+                self.queries += 1
+            answer = self._answer(headers)
+            if headers.get('ResponseHeader') == 'fixed16':
+                wfile.write('{0:3d} {1:11d}\n'.format(200, len(answer)).encode('ascii'))
+            wfile.write(answer)
+            wfile.flush()
+            if headers.get('KeepAlive') != 'on' or not line:
+                return
+
+    @staticmethod
+    def _parse(query_lines):
+        headers = {'table': query_lines[0].split()[1] if query_lines[0].startswith('GET ') else None}
+        for query_line in query_lines[1:]:
+            name, _, value = query_line.partition(':')
+            headers[name.strip()] = value.strip()
+        return headers
+
+    def _answer(self, headers):
+        if headers['table'] not in self.tables:
+            return b'[]\n'
+        key = (headers['table'], headers.get('Columns'), headers.get('Limit'), headers.get('ColumnHeaders'))
+        answer = self._answers.get(key)
+        if answer is None:
+            answer = self._answers[key] = self._render(headers)
+        return answer
+
+    def _render(self, headers):
+        columns, rows = self.tables[headers['table']]
+        if headers.get('Limit'):
+            rows = rows[:int(headers['Limit'])]
+        if headers.get('Columns'):
+            selected_columns = headers['Columns'].split()
+            indexes = [columns.index(column) for column in selected_columns if column in columns]
+            rows = [[row[index] for index in indexes] for row in rows]
+            header_rows = [selected_columns] if headers.get('ColumnHeaders') == 'on' else []
+        else:
+            header_rows = [columns]
+        return (json.dumps(header_rows + rows) + '\n').encode('utf-8')
@@ -0,0 +1,228 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from __future__ import absolute_import, print_function
+import argparse
+import gc
+import os
+import simplejson as json
+import sys
+import time
+try:  # pragma: no cover
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+from fakelivestatus import HOST_COLUMNS, SERVICE_COLUMNS, generate_hosts, generate_services
+
+'''
+    Micro-benchmark of the formatting pipeline (format_answer and the JSON dump of perform_query)
+    on fixed datasets. Reports ns per row of every phase and the bytes allocated per run. The
+    timings are compared with a baseline relative to a reference measured in the same run, as
+    absolute timings differ between machines.
+'''
+
+DATASET_ROWS = 10000
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'formatting_baseline.json')
+DEFAULT_THRESHOLD = 0.25
+COMPARED_MEASUREMENTS = ('relative', 'rows_relative', 'dump_relative', 'allocated_bytes')
+UNICODE_OUTPUTS = [u'CRITICAL - Festplatte /dätën zu 97% gefüllt – bitte aufräumen',
+                   u'OK - 応答時間 0.12 秒, すべてのチェックが正常です',
+                   u'WARNING - Загрузка процессора 85% на узле',
+                   u'UNKNOWN - ⚠ ψ Ω ∑ ≠ ∞ – 🚀 deployment läuft']
+
+
+def _columns_line(columns):
+    return 'Columns: {0}'.format(' '.join(columns))
+
+
+def _select(rows, all_columns, columns):
+    indexes = [all_columns.index(column) for column in columns]
+    return [[row[index] for index in indexes] for row in rows]
+
+
+def create_datasets(rows=DATASET_ROWS):
+    """Returns (name, query, answer, key) tuples, the answers are in the json format of livestatus"""
+    services = generate_services(rows // 10, 10)
+    hosts = generate_hosts(rows, 10)
+    narrow_service_columns = ['host_name', 'state']
+    narrow_host_columns = ['name', 'state']
+    unicode_columns = ['host_name', 'description', 'plugin_output', 'long_plugin_output']
+    unicode_services = [[host_name, description, UNICODE_OUTPUTS[index % len(UNICODE_OUTPUTS)], u'\n'.join(UNICODE_OUTPUTS)]
+                        for index, (host_name, description) in enumerate(_select(services, SERVICE_COLUMNS, ['host_name', 'description']))]
+    return [('wide_unkeyed', 'GET services', [SERVICE_COLUMNS] + services, None),
+            ('wide_keyed', 'GET hosts', [HOST_COLUMNS] + hosts, 'name'),
+            ('narrow_unkeyed', 'GET services\n' + _columns_line(narrow_service_columns),
+             _select(services, SERVICE_COLUMNS, narrow_service_columns), None),
+            ('narrow_keyed', 'GET hosts\n' + _columns_line(narrow_host_columns),
+             _select(hosts, HOST_COLUMNS, narrow_host_columns), 'name'),
+            ('unicode_unkeyed', 'GET services\n' + _columns_line(unicode_columns), unicode_services, None)]
+
+
+def format_and_dump(query, answer, key):
+    from livestatus_service.livestatus import format_answer
+    return json.dumps(format_answer(query, answer, key), sort_keys=False, indent=4)
+
+
+def best_of(function, repeats, number=1):
+    """Seconds per call of the fastest repeat, it is the least disturbed by the rest of the machine"""
+    best = None
+    for _ in range(repeats):
+        start = time.time()
+        for _ in range(number):
+            function()
+        elapsed = (time.time() - start) / number
+        best = min(best, elapsed) if best is not None else elapsed
+    return best
+
+
+def measure_phases(query, answer, key, repeats):
+    """
+    Times the phases of format_answer and the JSON dump separately. The reference is the dump
+    of the unformatted rows, it scales with the machine like the phases do.
+    """
+    from livestatus_service.livestatus import (determine_columns_to_show_from_query, determine_columns_to_show_from_answer,
+                                               NoColumnsSpecifiedException, _list_of_rows, _dictionary_of_rows)
+
+    def determine_columns():
+        # like format_answer, the columns come from the answer when the query does not specify them
+        try:
+            return determine_columns_to_show_from_query(query)
+        except NoColumnsSpecifiedException:
+            return determine_columns_to_show_from_answer(answer)
+    columns = determine_columns()
+    rows = answer[1:] if columns is answer[0] else answer
+    if key is None:
+        rows_function_name, format_rows = '_list_of_rows', lambda: _list_of_rows(rows, columns)
+    else:
+        rows_function_name, format_rows = '_dictionary_of_rows', lambda: _dictionary_of_rows(rows, columns, key)
+    formatted_answer = format_rows()
+    row_count = len(rows)
+
+    columns_seconds = best_of(determine_columns, repeats, number=1000)
+    rows_seconds = best_of(format_rows, repeats)
+    dump_seconds = best_of(lambda: json.dumps(formatted_answer, sort_keys=False, indent=4), repeats)
+    reference_seconds = best_of(lambda: json.dumps(rows, sort_keys=False, indent=4), repeats)
+    return {'rows': row_count,
+            'rows_function': rows_function_name,
+            'columns_ns': columns_seconds * 1e9,
+            'rows_ns_per_row': rows_seconds * 1e9 / row_count,
+            'dump_ns_per_row': dump_seconds * 1e9 / row_count,
+            'reference_ns_per_row': reference_seconds * 1e9 / row_count}
+
+
+def measure_allocated_bytes(query, answer, key):
+    """Peak of the memory allocated while formatting and dumping the answer once"""
+    if tracemalloc is None:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        format_and_dump(query, answer, key)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def run_benchmarks(repeats=5, rows=DATASET_ROWS):
+    results = {}
+    for name, query, answer, key in create_datasets(rows):
+        result = measure_phases(query, answer, key, repeats)
+        result['ns_per_row'] = result['rows_ns_per_row'] + result['dump_ns_per_row']
+        reference = result['reference_ns_per_row']
+        result['relative'] = result['ns_per_row'] / reference
+        result['rows_relative'] = result['rows_ns_per_row'] / reference
+        result['dump_relative'] = result['dump_ns_per_row'] / reference
+        result['allocated_bytes'] = measure_allocated_bytes(query, answer, key)
+        results[name] = result
+    return results
+
+
+def find_regressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Returns a message for every timing relative to the reference or allocated_bytes
+    exceeding the baseline by more than threshold
+    """
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        for measurement in COMPARED_MEASUREMENTS:
+            current, previous = results[name].get(measurement), baseline[name].get(measurement)
+            if not current or not previous:
+                continue
+            if current > previous * (1 + threshold):
+                regressions.append('{0} {1}: {2:.2f} exceeds the baseline {3:.2f} by more than {4:.0%}'.format(
+                    name, measurement, current, previous, threshold))
+    return regressions
+
+
+def load_baseline(baseline_file):
+    with open(baseline_file) as baseline:
+        return json.load(baseline)
+
+
+def write_baseline(results, baseline_file):
+    with open(baseline_file, 'w') as baseline:
+        json.dump(results, baseline, indent=4, sort_keys=True)
+
+
+def print_results(results, print_function=print):
+    for name in sorted(results):
+        print_function('{0:>16}: {ns_per_row:8.0f} ns/row, {relative:.2f} x reference (columns {columns_ns:.0f} ns, '
+                       '{rows_function} {rows_ns_per_row:.0f} ns/row, dump {dump_ns_per_row:.0f} ns/row, '
+                       'reference {reference_ns_per_row:.0f} ns/row), {1} bytes allocated'.format(
+                           name, results[name]['allocated_bytes'], **results[name]))
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description='Formatting micro-benchmark')
+    parser.add_argument('--repeats', type=int, default=5, help='runs per dataset, the fastest counts (default: %(default)s)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline file (default: %(default)s)')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed regression against the baseline as a fraction (default: %(default)s)')
+    parser.add_argument('--write-baseline', action='store_true', help='store the results as the new baseline')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    results = run_benchmarks(arguments.repeats)
+    print_results(results)
+    if arguments.write_baseline:
+        write_baseline(results, arguments.baseline)
+        print('Baseline written to {0}'.format(arguments.baseline))
+        return 0
+    if not os.path.exists(arguments.baseline):
+        print('No baseline at {0}, run with --write-baseline to create one'.format(arguments.baseline))
+        return 0
+    regressions = find_regressions(results, load_baseline(arguments.baseline), arguments.threshold)
+    for regression in regressions:
+        print('Regression: {0}'.format(regression))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
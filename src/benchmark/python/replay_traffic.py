@@ -0,0 +1,188 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from __future__ import absolute_import, print_function
+import argparse
+import base64
+import simplejson as json
+import sys
+import threading
+import time
+try:  # pragma: no cover
+    import Queue as queue
+    from urllib import urlencode
+    from urllib2 import Request, urlopen, HTTPError, URLError
+except ImportError:  # pragma: no cover
+    import queue
+    from urllib.parse import urlencode
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError, URLError
+
+from benchmarks import percentile
+from livestatus_service.traffic import read_recording
+
+'''
+    Replays a traffic recording of livestatus-service against a running instance, either
+    at the recorded pace sped up by a factor or as fast as a fixed number of clients can go.
+    Reports throughput, the latency distribution and the error rate.
+'''
+
+ENDPOINTS = {'perform_query': ('/query', {}),
+             'perform_command': ('/cmd', {}),
+             'submit_command_job': ('/cmd', {'async': '1'}),
+             'perform_mass_command': ('/masscmd', {})}
+QUERY_ENDPOINTS = ('perform_query',)
+
+
+def build_request(base_url, recorded_request, password=''):
+    path, parameters = ENDPOINTS[recorded_request['endpoint']]
+    parameters = dict(parameters, q=recorded_request['q'])
+    for name in ('key', 'handler'):
+        if recorded_request[name] is not None:
+            parameters[name] = recorded_request[name]
+    for name, value in recorded_request['parameters'].items():
+        if value is not None:
+            parameters[name] = value
+    http_request = Request('{0}{1}?{2}'.format(base_url.rstrip('/'), path, urlencode(parameters)))
+    if recorded_request['auth'] is not None:
+        credentials = '{0}:{1}'.format(recorded_request['auth'], password).encode('utf-8')
+        http_request.add_header('Authorization', 'Basic {0}'.format(base64.b64encode(credentials).decode('ascii')))
+    return http_request
+
+
+def is_error(status, body):
+    """Failures are answered with 4xx and 5xx, 'Error :' bodies with 200 come from older versions"""
+    return status >= 400 or body.startswith(b'Error :')
+
+
+class Replay(object):
+
+    def __init__(self, base_url, recorded_requests, concurrency, speed=None, password='', timeout=60.0):
+        self.base_url = base_url
+        self.recorded_requests = recorded_requests
+        self.concurrency = concurrency
+        self.speed = speed
+        self.password = password
+        self.timeout = timeout
+        self.latencies = []
+        self.errors = {}
+        self.lag = 0.0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=concurrency * 2)
+
+    def run(self):
+        workers = [threading.Thread(target=self._send_requests) for _ in range(self.concurrency)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        start = time.time()
+        self._schedule(start)
+        for _ in workers:
+            self._queue.put(None)
+        for worker in workers:
+            worker.join()
+        return self.report(time.time() - start)
+
+    def _schedule(self, start):
+        """Without a speed the queue paces the requests, the workers take the next one as soon as they are free"""
+        first_timestamp = None
+        for recorded_request in self.recorded_requests:
+            if self.speed:
+                if first_timestamp is None:
+                    first_timestamp = recorded_request['timestamp']
+                due = start + (recorded_request['timestamp'] - first_timestamp) / self.speed
+                delay = due - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    self.lag = max(self.lag, -delay)
+            self._queue.put(recorded_request)
+
+    def _send_requests(self):
+        while True:
+            recorded_request = self._queue.get()
+            if recorded_request is None:
+                return
+            http_request = build_request(self.base_url, recorded_request, self.password)
+            start = time.time()
+            try:
+                response = urlopen(http_request, timeout=self.timeout)
+                status, body = response.getcode(), response.read()
+            except HTTPError as error:
+                status, body = error.code, error.read()
+            except (URLError, EnvironmentError) as error:
+                status, body = None, str(error).encode('utf-8')
+            latency = time.time() - start
+            with self._lock:
+                self.latencies.append(latency)
+                if status is None or is_error(status, body):
+                    error_name = str(status) if status is not None else 'connection'
+                    self.errors[error_name] = self.errors.get(error_name, 0) + 1
+
+    def report(self, elapsed):
+        latencies = sorted(self.latencies) or [0.0]
+        errors = sum(self.errors.values())
+        return {'requests': len(self.latencies),
+                'elapsed_seconds': elapsed,
+                'requests_per_second': len(self.latencies) / elapsed if elapsed else 0.0,
+                'p50_seconds': percentile(latencies, 50),
+                'p95_seconds': percentile(latencies, 95),
+                'p99_seconds': percentile(latencies, 99),
+                'max_seconds': latencies[-1],
+                'errors': self.errors,
+                'error_rate': float(errors) / len(self.latencies) if self.latencies else 0.0,
+                'max_lag_seconds': self.lag}
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description='Replays a traffic recording against livestatus-service')
+    parser.add_argument('recording', help='file written by the traffic_recording option')
+    parser.add_argument('--url', default='http://localhost:8080', help='livestatus-service base URL (default: %(default)s)')
+    parser.add_argument('--speed', type=float, default=None,
+                        help='replay at the recorded pace times this factor, e.g. 1 or 10 (default: as fast as possible)')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent clients (default: %(default)s)')
+    parser.add_argument('--password', default='', help='password sent with the recorded users')
+    parser.add_argument('--include-commands', action='store_true',
+                        help='replay commands too, by default only queries are replayed')
+    parser.add_argument('--output', default=None, help='JSON result file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    recorded_requests = [recorded_request for recorded_request in read_recording(arguments.recording)
+                         if recorded_request['endpoint'] in ENDPOINTS and
+                         (arguments.include_commands or recorded_request['endpoint'] in QUERY_ENDPOINTS)]
+    result = Replay(arguments.url, recorded_requests, arguments.concurrency, arguments.speed, arguments.password).run()
+    print('{requests} requests in {elapsed_seconds:.1f}s ({requests_per_second:.1f}/s), '
+          'p50 {p50_seconds:.4f}s p95 {p95_seconds:.4f}s p99 {p99_seconds:.4f}s max {max_seconds:.4f}s, '
+          'error rate {error_rate:.2%} {errors}, max lag {max_lag_seconds:.3f}s'.format(**result))
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(result, output_file, indent=4)
+    return 1 if result['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -26,6 +26,11 @@ import multiprocessing
 import socket
 import os
 import time
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+import simplejson as json
 
 
 def _listen_and_respond(path, response, queue):
@@ -70,3 +75,53 @@ class LiveSocket(object):
 
     def stop_listening(self):
         self._process.terminate()
+
+
+def _listen_and_echo(path, latency, queue):
+    try:
+        os.unlink(path)
+    except OSError:
+        if os.path.exists(path):
+            raise
+
+    class EchoHandler(socketserver.BaseRequestHandler):
+        def handle(self):
+            chunks = []
+            while True:
+                data = self.request.recv(8192)
+                if not data:
+                    break
+                chunks.append(data)
+            request = b''.join(chunks).decode('utf-8')
+            if request.startswith('GET '):
+                time.sleep(latency)
+                filter_value = request.split('Filter: name = ', 1)[1].splitlines()[0]
+                self.request.sendall(json.dumps([[filter_value]]).encode('utf-8'))
+            else:
+                for line in request.splitlines():
+                    queue.put(line)
+
+    server = socketserver.ThreadingUnixStreamServer(path, EchoHandler)
+    server.daemon_threads = True
+    server.request_queue_size = 128
+    server.serve_forever()
+
+
+class EchoLiveSocket(LiveSocket):
+    """
+    Answers every query with its filter value as the only row, after waiting latency seconds,
+    and puts every received command line on the incoming queue. Connections are served concurrently.
+    """
+
+    def __init__(self, path, latency=0.0):
+        super(EchoLiveSocket, self).__init__(path, None)
+        self.latency = latency
+
+    def start_listening(self):
+        self.incoming = multiprocessing.Queue()
+        self._process = multiprocessing.Process(target=_listen_and_echo, args=(self.path, self.latency, self.incoming))
+        self._process.start()
+        while not os.path.exists(self.path):
+            time.sleep(0.01)
+        # the socket is bound before it listens
+        time.sleep(0.1)
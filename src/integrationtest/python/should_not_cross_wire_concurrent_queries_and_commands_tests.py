@@ -0,0 +1,57 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+import unittest
+
+from mock import patch
+
+from liveserver import LiveServer
+from livesocket import EchoLiveSocket
+from stress import stress_configuration, run_threads, run_processes, received_commands
+
+THREADS = 16
+PROCESSES = 4
+REQUESTS = 25
+
+
+class Test(unittest.TestCase):
+    @patch('livestatus_service.webapp.get_current_configuration')
+    @patch('livestatus_service.dispatcher.get_current_configuration')
+    def test(self, get_config, get_webapp_config):
+        get_config.return_value = get_webapp_config.return_value = stress_configuration()
+        with LiveServer() as liveserver:
+            with EchoLiveSocket('./livestatus_stress_socket') as livesocket:
+                results = run_threads(liveserver.url, THREADS, REQUESTS) + run_processes(liveserver.url, PROCESSES, REQUESTS)
+
+                self.assertEqual([cross_wired for result in results for cross_wired in result], [])
+                expected_commands = set('DISABLE_HOST_NOTIFICATIONS;{0}{1}-{2}'.format(prefix, client, request)
+                                        for prefix, clients in (('thread', THREADS), ('process', PROCESSES))
+                                        for client in range(clients)
+                                        for request in range(REQUESTS))
+                commands = received_commands(livesocket, len(expected_commands))
+                self.assertEqual(sorted(command.split('] ', 1)[1] for command in commands), sorted(expected_commands))
+
+
+if __name__ == '__main__':
+    unittest.main()
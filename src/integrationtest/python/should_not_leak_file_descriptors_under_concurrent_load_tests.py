@@ -0,0 +1,63 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+import os
+import time
+import unittest
+
+from mock import patch
+
+from liveserver import LiveServer
+from livesocket import EchoLiveSocket
+from stress import stress_configuration, run_threads, count_open_file_descriptors
+
+THREADS = 8
+REQUESTS = 50
+# sockets of connections the server is just closing
+TOLERATED_DESCRIPTORS = 4
+
+
+class Test(unittest.TestCase):
+    @unittest.skipUnless(os.path.isdir('/proc/self/fd'), 'needs /proc to count file descriptors')
+    @patch('livestatus_service.webapp.get_current_configuration')
+    @patch('livestatus_service.dispatcher.get_current_configuration')
+    def test(self, get_config, get_webapp_config):
+        get_config.return_value = get_webapp_config.return_value = stress_configuration()
+        with LiveServer() as liveserver:
+            with EchoLiveSocket('./livestatus_stress_socket'):
+                run_threads(liveserver.url, THREADS, 2)
+                time.sleep(0.5)
+                open_before_load = count_open_file_descriptors(liveserver._process.pid)
+
+                run_threads(liveserver.url, THREADS, REQUESTS)
+                time.sleep(0.5)
+                open_after_load = count_open_file_descriptors(liveserver._process.pid)
+
+                self.assertTrue(open_after_load <= open_before_load + TOLERATED_DESCRIPTORS,
+                                '{0} file descriptors open before, {1} after {2} requests'.format(
+                                    open_before_load, open_after_load, THREADS * REQUESTS * 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
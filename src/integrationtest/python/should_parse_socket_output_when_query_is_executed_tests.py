@@ -53,11 +53,13 @@ expected_api_call_response = '''[
 
 
 class Test(unittest.TestCase):
+    @patch('livestatus_service.webapp.get_current_configuration')
     @patch('livestatus_service.dispatcher.get_current_configuration')
-    def test(self, get_config):
+    def test(self, get_config, get_webapp_config):
         mock_configuration = PropertyMock()
         mock_configuration.livestatus_socket = './livestatus_socket'
-        get_config.return_value = mock_configuration
+        mock_configuration.query_max_age = {}
+        get_config.return_value = get_webapp_config.return_value = mock_configuration
         socket_response = '[["host_name","notifications_enabled"],["devica01", 1], ["tuvdbs05",1], ["tuvdbs06",1]]'
 
         with LiveServer() as liveserver:
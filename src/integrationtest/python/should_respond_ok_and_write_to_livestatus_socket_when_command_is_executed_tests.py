@@ -46,6 +46,9 @@ class Test(unittest.TestCase):
     def test(self, get_config):
         mock_configuration = PropertyMock()
         mock_configuration.livestatus_socket = './livestatus_socket'
+        mock_configuration.admins = ['admin']
+        mock_configuration.command_dedup_window = 0
+        mock_configuration.command_journal = None
         get_config.return_value = mock_configuration
         with LiveServer() as liveserver:
             with LiveSocket('./livestatus_socket', '{}') as livesocket:
@@ -55,7 +58,7 @@ class Test(unittest.TestCase):
                               }
                 data = urlencode(parameters)
                 binary_data = data.encode('utf-8')
-                request = Request(url, binary_data)
+                request = Request(url, binary_data, {'Authorization': 'Basic YWRtaW46c2VjcmV0'})
                 response = urlopen(request)
                 self.assertEqual(response.read(), b'OK\n')
                 written_to_socket = livesocket.incoming.get()
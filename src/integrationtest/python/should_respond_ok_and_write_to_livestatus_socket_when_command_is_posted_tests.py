@@ -25,9 +25,9 @@ THE SOFTWARE.
 from __future__ import print_function
 import unittest
 try:
-    from urllib2 import urlopen
+    from urllib2 import urlopen, Request
 except:
-    from urllib.request import urlopen
+    from urllib.request import urlopen, Request
 from mock import patch, PropertyMock
 
 from liveserver import LiveServer
@@ -39,10 +39,15 @@ class Test(unittest.TestCase):
     def test(self, get_config):
         mock_configuration = PropertyMock()
         mock_configuration.livestatus_socket = './livestatus_socket'
+        mock_configuration.admins = ['admin']
+        mock_configuration.command_dedup_window = 0
+        mock_configuration.command_journal = None
         get_config.return_value = mock_configuration
         with LiveServer() as liveserver:
             with LiveSocket('./livestatus_socket', '{}') as livesocket:
-                result = urlopen('{0}cmd?q=DISABLE_HOST_NOTIFICATIONS;devica01'.format(liveserver.url))
+                request = Request('{0}cmd?q=DISABLE_HOST_NOTIFICATIONS;devica01'.format(liveserver.url),
+                                  headers={'Authorization': 'Basic YWRtaW46c2VjcmV0'})
+                result = urlopen(request)
                 self.assertEqual(result.read(), b'OK\n')
                 written_to_socket = livesocket.incoming.get()
                 self.assertTrue('DISABLE_HOST_NOTIFICATIONS;devica01' in written_to_socket)
@@ -0,0 +1,56 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+import unittest
+
+from mock import patch
+
+from liveserver import LiveServer
+from livesocket import EchoLiveSocket
+from stress import stress_configuration, measure_query_throughput
+
+LIVESTATUS_LATENCY = 0.02
+THREADS = 8
+REQUESTS = 40
+# far below the ideal speedup of 8, the service must at least overlap waiting for livestatus
+MINIMUM_SPEEDUP = 2.5
+
+
+class Test(unittest.TestCase):
+    @patch('livestatus_service.webapp.get_current_configuration')
+    @patch('livestatus_service.dispatcher.get_current_configuration')
+    def test(self, get_config, get_webapp_config):
+        get_config.return_value = get_webapp_config.return_value = stress_configuration()
+        with LiveServer() as liveserver:
+            with EchoLiveSocket('./livestatus_stress_socket', latency=LIVESTATUS_LATENCY):
+                single_thread_throughput = measure_query_throughput(liveserver.url, 1, REQUESTS)
+                multi_thread_throughput = measure_query_throughput(liveserver.url, THREADS, REQUESTS)
+
+                self.assertTrue(multi_thread_throughput >= MINIMUM_SPEEDUP * single_thread_throughput,
+                                '{0:.1f} queries/s with one thread, {1:.1f} queries/s with {2}'.format(
+                                    single_thread_throughput, multi_thread_throughput, THREADS))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+import base64
+import multiprocessing
+import os
+import threading
+import time
+try:
+    from urllib import urlencode
+    from urllib2 import urlopen, Request
+except ImportError:
+    from urllib.parse import urlencode
+    from urllib.request import urlopen, Request
+import simplejson as json
+
+from livestatus_service.configuration import Configuration
+
+STRESS_CONFIGURATION_FILE = 'src/integrationtest/resources/livestatus_service_stresstest.cfg'
+ADMIN_AUTHORIZATION = 'Basic {0}'.format(base64.b64encode(b'admin:secret').decode('ascii'))
+
+
+def stress_configuration():
+    return Configuration(STRESS_CONFIGURATION_FILE)
+
+
+def query_host(url, host_name):
+    query = 'GET hosts\\nColumns: name\\nFilter: name = {0}'.format(host_name)
+    response = urlopen('{0}query?{1}'.format(url, urlencode({'q': query})))
+    return json.loads(response.read().decode('utf-8'))
+
+
+def disable_notifications(url, host_name):
+    data = urlencode({'q': 'DISABLE_HOST_NOTIFICATIONS;{0}'.format(host_name)}).encode('utf-8')
+    request = Request('{0}cmd'.format(url), data, {'Authorization': ADMIN_AUTHORIZATION})
+    return urlopen(request).read()
+
+
+def run_client(url, client_name, requests):
+    """Returns the requests whose answers did not belong to them"""
+    cross_wired = []
+    for request_number in range(requests):
+        host_name = '{0}-{1}'.format(client_name, request_number)
+        answer = query_host(url, host_name)
+        if answer != [{'name': host_name}]:
+            cross_wired.append((host_name, answer))
+        answer = disable_notifications(url, host_name)
+        if answer != b'OK\n':
+            cross_wired.append((host_name, answer))
+    return cross_wired
+
+
+def _run_process_client(arguments):
+    return run_client(*arguments)
+
+
+def run_threads(url, threads, requests, client_prefix='thread', target=run_client):
+    results = [None] * threads
+
+    def run(index):
+        results[index] = target(url, '{0}{1}'.format(client_prefix, index), requests)
+
+    workers = [threading.Thread(target=run, args=(index,)) for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+
+def run_processes(url, processes, requests):
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(_run_process_client, [(url, 'process{0}'.format(index), requests) for index in range(processes)])
+    finally:
+        pool.close()
+        pool.join()
+
+
+def run_queries(url, client_name, requests):
+    for request_number in range(requests):
+        query_host(url, '{0}-{1}'.format(client_name, request_number))
+    return requests
+
+
+def measure_query_throughput(url, threads, requests):
+    start = time.time()
+    run_threads(url, threads, requests, target=run_queries)
+    return threads * requests / (time.time() - start)
+
+
+def received_commands(livesocket, expected_commands, timeout=10):
+    commands = []
+    deadline = time.time() + timeout
+    while len(commands) < expected_commands and time.time() < deadline:
+        line = livesocket.incoming.get(timeout=max(deadline - time.time(), 0.01))
+        if line:
+            commands.append(line)
+    return commands
+
+
+def count_open_file_descriptors(pid):
+    return len(os.listdir('/proc/{0}/fd'.format(pid)))
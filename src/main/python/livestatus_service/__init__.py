@@ -23,9 +23,26 @@ THE SOFTWARE.
 '''
 
 from __future__ import absolute_import
+import atexit
 import logging
+try:  # pragma: no cover
+    from logging.handlers import QueueHandler, QueueListener
+except ImportError:  # pragma: no cover
+    QueueHandler = QueueListener = None
+try:  # pragma: no cover
+    import Queue as queue
+except ImportError:  # pragma: no cover
+    import queue
 
 from .configuration import Configuration
+from .metrics import REGISTRY
+from .slow_queries import SLOW_QUERY_LOG
+from .profiling import REQUEST_PROFILER
+from .tracing import SPAN_EXPORTER
+from .traffic import TRAFFIC_RECORDER
+from .changes import CHANGE_FEED
+from .snapshot import SNAPSHOTS
+from .shared_cache import SHARED_CACHE
 
 '''
     Livestatus-service wraps a MK-livestatus UNIX socket as a Flask application.
@@ -35,28 +52,77 @@ from .configuration import Configuration
 __version__ = "${version}"
 
 
+_LOGGING_HANDLERS = []
+_LOG_LISTENER = None
+
+
 def initialize(config_file):
     current_configuration = Configuration(config_file)
-    initialize_logging(current_configuration.log_file)
-
+    initialize_logging(current_configuration.log_file, current_configuration.log_level)
+    REGISTRY.use_directory(current_configuration.metrics_directory)
+    SLOW_QUERY_LOG.configure(current_configuration.slow_query_threshold,
+                             current_configuration.slow_query_log_interval,
+                             current_configuration.slow_query_fingerprints)
+    REQUEST_PROFILER.configure(current_configuration.profile_directory,
+                               current_configuration.profile_sample_rate,
+                               current_configuration.profile_retention)
+    SPAN_EXPORTER.configure(current_configuration.trace_export, current_configuration.trace_batch_size)
+    TRAFFIC_RECORDER.configure(current_configuration.traffic_recording)
+    CHANGE_FEED.configure(current_configuration.change_feed_subscribers)
+    SNAPSHOTS.configure(current_configuration.snapshot_tables,
+                        current_configuration.livestatus_socket,
+                        current_configuration.snapshot_refresh_interval,
+                        current_configuration.snapshot_reload_interval)
+    SHARED_CACHE.configure(current_configuration.shared_cache,
+                           current_configuration.shared_cache_size,
+                           current_configuration.shared_cache_ttl,
+                           current_configuration.shared_cache_auth_ttl,
+                           current_configuration.shared_cache_max_stale)
+
+
+def initialize_logging(log_file, log_level=logging.INFO):
+    """
+    Log records are only put on a queue by the request threads, a listener thread writes
+    them to the log file and the console. Without QueueHandler (python 2) the handlers
+    write synchronously. Initializing again replaces the handlers of the previous call.
+    """
+    global _LOG_LISTENER
+    shutdown_logging()
 
-def initialize_logging(log_file):
     formatter = logging.Formatter("%(asctime)s [%(name)s] %(levelname)s: %(message)s")
 
     log_file_handler = logging.FileHandler(log_file)
-    log_file_handler.setLevel(logging.DEBUG)
     log_file_handler.setFormatter(formatter)
 
     console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.DEBUG)
     console_handler.setFormatter(formatter)
 
-    livestatus_logger = logging.getLogger("livestatus")
-    livestatus_logger.setLevel(logging.DEBUG)
-    livestatus_logger.addHandler(log_file_handler)
-    livestatus_logger.addHandler(console_handler)
+    if QueueHandler is None:
+        handlers = [log_file_handler, console_handler]
+    else:
+        log_queue = queue.Queue()
+        _LOG_LISTENER = QueueListener(log_queue, log_file_handler, console_handler)
+        _LOG_LISTENER.start()
+        handlers = [QueueHandler(log_queue)]
 
+    livestatus_logger = logging.getLogger("livestatus")
+    livestatus_logger.setLevel(log_level)
     werkzeug_logger = logging.getLogger("werkzeug")
-    werkzeug_logger.setLevel(logging.INFO)
-    werkzeug_logger.addHandler(log_file_handler)
-    werkzeug_logger.addHandler(console_handler)
+    werkzeug_logger.setLevel(max(log_level, logging.INFO))
+    for handler in handlers:
+        livestatus_logger.addHandler(handler)
+        werkzeug_logger.addHandler(handler)
+    _LOGGING_HANDLERS.extend(set(handlers + [log_file_handler, console_handler]))
+
+
+@atexit.register
+def shutdown_logging():
+    global _LOG_LISTENER
+    if _LOG_LISTENER is not None:
+        _LOG_LISTENER.stop()
+        _LOG_LISTENER = None
+    for handler in _LOGGING_HANDLERS:
+        logging.getLogger("livestatus").removeHandler(handler)
+        logging.getLogger("werkzeug").removeHandler(handler)
+        handler.close()
+    del _LOGGING_HANDLERS[:]
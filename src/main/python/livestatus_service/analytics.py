@@ -0,0 +1,171 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from __future__ import absolute_import
+import collections
+import heapq
+import itertools
+import logging
+try:  # pragma: no cover
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+'''
+    Aggregates of a table computed in the service: percentiles, histograms, group counts and the top rows.
+    Only the needed columns are fetched and turned into columns, the numeric aggregates are computed with
+    numpy if it is installed and in pure python otherwise. Only the aggregates are returned.
+'''
+
+LOGGER = logging.getLogger('livestatus.analytics')
+
+DEFAULT_PERCENTS = [50.0, 90.0, 95.0, 99.0]
+FORBIDDEN_HEADERS = ('Columns:', 'ColumnHeaders:', 'Stats', 'OutputFormat:')
+
+
+class Analysis(object):
+
+    def __init__(self, percentiles=None, percents=None, histogram=None, bins=10, group_by=None, top=None, top_n=10,
+                 top_columns=None):
+        self.percentiles = percentiles or []
+        self.percents = percents or DEFAULT_PERCENTS
+        self.histogram = histogram or []
+        self.bins = bins
+        self.group_by = group_by or []
+        self.top = top
+        self.top_n = top_n
+        self.top_columns = top_columns or []
+        if not (self.percentiles or self.histogram or self.group_by or self.top):
+            raise ValueError('Nothing to analyse, ask for percentiles, a histogram, group_by or top.')
+
+    @property
+    def columns(self):
+        columns = []
+        for column in itertools.chain(self.percentiles, self.histogram, self.group_by, [self.top] if self.top else [],
+                                      self.top_columns):
+            if column not in columns:
+                columns.append(column)
+        return columns
+
+    def query(self, query):
+        """The query selects the table and rows, the analysis the columns"""
+        if not query.startswith('GET '):
+            raise ValueError('The query must be a GET query.')
+        for query_line in query.splitlines()[1:]:
+            if query_line.startswith(FORBIDDEN_HEADERS):
+                raise ValueError('The columns of an analysis are given by its parameters, not by {0}'.format(query_line))
+        return '{0}\nColumns: {1}'.format(query.rstrip('\n'), ' '.join(self.columns))
+
+    def compute(self, answer):
+        columns = self.columns
+        values = dict(zip(columns, zip(*answer))) if answer else dict((column, ()) for column in columns)
+        result = {'rows': len(answer)}
+        if self.percentiles:
+            result['percentiles'] = dict((column, percentiles(_numeric(column, values[column]), self.percents))
+                                         for column in self.percentiles)
+        if self.histogram:
+            result['histograms'] = dict((column, histogram(_numeric(column, values[column]), self.bins))
+                                        for column in self.histogram)
+        if self.group_by:
+            result['groups'] = group_counts([values[column] for column in self.group_by], self.group_by)
+        if self.top:
+            shown_columns = [self.top] + [column for column in self.top_columns if column != self.top]
+            result['top'] = [dict((column, values[column][index]) for column in shown_columns)
+                             for index in top_indices(_numeric(self.top, values[self.top]), self.top_n)]
+        return result
+
+
+def _numeric(column, values):
+    try:
+        if numpy is not None:
+            return numpy.asarray(values, dtype=float)
+        return [float(value) for value in values]
+    except (TypeError, ValueError):
+        raise ValueError('The column {0} is not numeric.'.format(column))
+
+
+def percentiles(values, percents):
+    """Linear interpolation between the closest ranks like numpy.percentile"""
+    if len(values) == 0:
+        return dict((_percent_label(percent), None) for percent in percents)
+    if numpy is not None:
+        results = numpy.percentile(values, percents).tolist()
+    else:
+        ordered = sorted(values)
+        results = [_interpolated_rank(ordered, percent) for percent in percents]
+    return dict((_percent_label(percent), result) for percent, result in zip(percents, results))
+
+
+def _percent_label(percent):
+    return '{0:g}'.format(percent)
+
+
+def _interpolated_rank(ordered, percent):
+    position = (len(ordered) - 1) * percent / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def histogram(values, bins):
+    """Bins of equal width between the minimum and the maximum, the last bin includes the maximum like numpy.histogram"""
+    if numpy is not None:
+        counts, edges = numpy.histogram(values, bins=bins)
+        return {'edges': edges.tolist(), 'counts': counts.tolist()}
+    lowest, highest = (min(values), max(values)) if len(values) else (0.0, 1.0)
+    if lowest == highest:
+        lowest, highest = lowest - 0.5, highest + 0.5
+    width = (highest - lowest) / bins
+    edges = [lowest + index * width for index in range(bins)] + [highest]
+    counts = [0] * bins
+    for value in values:
+        index = min(int((value - lowest) / width), bins - 1)
+        if value < edges[index]:
+            index -= 1
+        elif index < bins - 1 and value >= edges[index + 1]:
+            index += 1
+        counts[index] += 1
+    return {'edges': edges, 'counts': counts}
+
+
+def group_counts(columns, names):
+    """Rows count once for every element of list columns, e.g. once per group. Largest groups first"""
+    groups = zip(*columns)
+    if any(len(column) and isinstance(column[0], list) for column in columns):
+        element_lists = [column if isinstance(column[0], list) else [(value,) for value in column] for column in columns]
+        groups = itertools.chain.from_iterable(itertools.starmap(itertools.product, zip(*element_lists)))
+    return [dict(list(zip(names, group)) + [('count', count)]) for group, count in collections.Counter(groups).most_common()]
+
+
+def top_indices(values, top_n):
+    """Indices of the largest values, ties in the order of the rows"""
+    if numpy is not None:
+        if len(values) > top_n:
+            threshold = numpy.partition(values, len(values) - top_n)[len(values) - top_n]
+            candidates = numpy.flatnonzero(values >= threshold)
+        else:
+            candidates = numpy.arange(len(values))
+        order = numpy.argsort(-values[candidates], kind='stable')
+        return candidates[order][:top_n].tolist()
+    return heapq.nsmallest(top_n, range(len(values)), key=lambda index: (-values[index], index))
@@ -0,0 +1,250 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from __future__ import absolute_import
+import logging
+import simplejson as json
+import threading
+import time
+try:  # pragma: no cover
+    import Queue as queue
+except ImportError:  # pragma: no cover
+    import queue
+
+from livestatus_service.livestatus import LivestatusSocket, format_answer, determine_columns_to_show_from_query, \
+    NoColumnsSpecifiedException, get_table
+
+'''
+    Change feed of livestatus tables. One watcher per distinct subscription (query, key and user)
+    blocks on livestatus with WaitTrigger: state and fans out the changed rows to all its subscribers.
+'''
+
+LOGGER = logging.getLogger('livestatus.changes')
+
+KEY_COLUMNS = {'hosts': ['name'],
+               'services': ['host_name', 'description'],
+               'hostgroups': ['name'],
+               'servicegroups': ['name'],
+               'contacts': ['name'],
+               'contactgroups': ['name'],
+               'downtimes': ['id'],
+               'comments': ['id']}
+FORBIDDEN_HEADERS = ('WaitTrigger:', 'WaitTimeout:', 'WaitObject:', 'WaitCondition', 'Stats:', 'Limit:')
+
+
+class TooManySubscribersException(RuntimeError):
+    pass
+
+
+def get_key_columns(query, key=None):
+    """The columns identifying the rows of the query, a given key is the only key column"""
+    if key:
+        return [key]
+    table = get_table(query)
+    if table not in KEY_COLUMNS:
+        raise ValueError('The table {0} has no default key, the "key" parameter is mandatory.'.format(table))
+    return KEY_COLUMNS[table]
+
+
+def with_key_columns(query, key_columns):
+    """The key columns are added to the columns of the query because they identify the rows"""
+    for header in FORBIDDEN_HEADERS:
+        if header in query:
+            raise ValueError('The query is not allowed to contain a "{0}" header.'.format(header.rstrip(':')))
+    try:
+        columns = determine_columns_to_show_from_query(query)
+    except NoColumnsSpecifiedException:
+        return query
+    missing_columns = [column for column in key_columns if column not in columns]
+    if not missing_columns:
+        return query
+    query_lines = query.splitlines()
+    for index, query_line in enumerate(query_lines):
+        if query_line.startswith('Columns:'):
+            query_lines[index] = '{0} {1}'.format(query_line, ' '.join(missing_columns))
+    return '\n'.join(query_lines)
+
+
+def diff_rows(previous_rows, current_rows):
+    """Rows are dictionaries by row key, returns the added or changed rows and the keys of the removed rows"""
+    changed = [row for row_key, row in current_rows.items() if previous_rows.get(row_key) != row]
+    removed = [list(row_key) for row_key in previous_rows if row_key not in current_rows]
+    return changed, removed
+
+
+def format_event(event_type, data):
+    return 'event: {0}\ndata: {1}\n\n'.format(event_type, json.dumps(data))
+
+
+class Subscription(object):
+    """Events are queued for the subscriber, a subscriber which does not keep up is closed"""
+    QUEUE_SIZE = 100
+
+    def __init__(self, watch_key):
+        self.watch_key = watch_key
+        self.closed = False
+        self._events = queue.Queue(maxsize=self.QUEUE_SIZE)
+
+    def publish(self, event):
+        try:
+            self._events.put_nowait(event)
+        except queue.Full:
+            LOGGER.warn('Closing subscription to %r, the subscriber does not keep up', self.watch_key[0])
+            self.close()
+
+    def close(self):
+        self.closed = True
+        # wake up a waiting subscriber, the queue may be full
+        try:
+            self._events.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def next_event(self, timeout):
+        """Returns None when the subscription is closed and '' when no event came within the timeout"""
+        if self.closed:
+            return None
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return ''
+
+
+class Watcher(object):
+    WAIT_TIMEOUT = 10.0
+    RETRY_INTERVAL = 5.0
+
+    def __init__(self, query, key_columns, auth, socket_path):
+        self.query = query
+        self.key_columns = key_columns
+        self.auth = auth
+        self.socket_path = socket_path
+        self.subscriptions = []
+        self.rows = None
+        self.stopped = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, subscription):
+        with self._lock:
+            self.subscriptions.append(subscription)
+            if self.rows is not None:
+                subscription.publish(format_event('snapshot', list(self.rows.values())))
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name='change-feed')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def remove(self, subscription):
+        """Returns whether subscriptions are left, the watcher stops without them"""
+        with self._lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+            if not self.subscriptions:
+                self.stopped = True
+            return not self.stopped
+
+    def fetch(self, wait):
+        query = self.query
+        if wait:
+            query = '{0}\nWaitTrigger: state\nWaitTimeout: {1}'.format(query, int(self.WAIT_TIMEOUT * 1000))
+        livestatus_socket = LivestatusSocket(self.socket_path)
+        livestatus_socket.measured = False
+        answer = livestatus_socket.send_query_and_receive_json_answer(query, auth=self.auth)
+        rows = format_answer(self.query, answer, None)
+        return dict((tuple(row.get(column) for column in self.key_columns), row) for row in rows)
+
+    def update(self, rows):
+        with self._lock:
+            if self.rows is None:
+                event = format_event('snapshot', list(rows.values()))
+            else:
+                changed, removed = diff_rows(self.rows, rows)
+                event = format_event('changes', {'changed': changed, 'removed': removed}) if changed or removed else None
+            self.rows = rows
+            if event is not None:
+                # the event is serialized once for all subscribers
+                for subscription in list(self.subscriptions):
+                    subscription.publish(event)
+
+    def _watch(self):
+        while not self.stopped:
+            try:
+                self.update(self.fetch(wait=self.rows is not None))
+            except Exception as exception:
+                LOGGER.warn('Watching %r failed, retrying in %ss: %s', self.query, self.RETRY_INTERVAL, exception)
+                time.sleep(self.RETRY_INTERVAL)
+        LOGGER.debug('Stopped watching %r', self.query)
+
+
+class ChangeFeed(object):
+
+    def __init__(self, max_subscribers=20):
+        self._lock = threading.Lock()
+        self._watchers = {}
+        self.configure(max_subscribers)
+
+    def configure(self, max_subscribers):
+        self.max_subscribers = max_subscribers
+
+    @property
+    def subscribers(self):
+        with self._lock:
+            return sum(len(watcher.subscriptions) for watcher in self._watchers.values())
+
+    def subscribe(self, query, socket_path, key=None, auth=None):
+        key_columns = get_key_columns(query, key)
+        query = with_key_columns(query, key_columns)
+        watch_key = (query, tuple(key_columns), auth, socket_path)
+        subscription = Subscription(watch_key)
+        with self._lock:
+            if sum(len(watcher.subscriptions) for watcher in self._watchers.values()) >= self.max_subscribers:
+                raise TooManySubscribersException(
+                    'The change feed has reached its maximum of {0} subscribers.'.format(self.max_subscribers))
+            watcher = self._watchers.get(watch_key)
+            if watcher is None or watcher.stopped:
+                watcher = self._watchers[watch_key] = Watcher(query, key_columns, auth, socket_path)
+            watcher.add(subscription)
+        return subscription
+
+    def stream(self, subscription, heartbeat_interval=15.0):
+        """Yields the server-sent events of the subscription, comments keep idle connections alive"""
+        try:
+            while True:
+                event = subscription.next_event(heartbeat_interval)
+                if event is None:
+                    return
+                yield event or ': keepalive\n\n'
+        finally:
+            self.unsubscribe(subscription)
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self._lock:
+            watcher = self._watchers.get(subscription.watch_key)
+            if watcher is not None and not watcher.remove(subscription):
+                del self._watchers[subscription.watch_key]
+
+
+CHANGE_FEED = ChangeFeed()
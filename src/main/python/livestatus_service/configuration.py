@@ -23,6 +23,7 @@ THE SOFTWARE.
 '''
 
 from __future__ import absolute_import
+import logging
 try:  # pragma: no cover
     import ConfigParser
     configparser = ConfigParser
@@ -43,14 +44,70 @@ class Configuration(object):
     DEFAULT_CONFIGURATION_FILE = '/etc/livestatus.cfg'
 
     DEFAULT_LOG_FILE = '/var/log/livestatus-service.log'
+    DEFAULT_LOG_LEVEL = 'INFO'
     DEFAULT_LIVESTATUS_SOCKET = '/var/lib/nagios/rw/live'
     DEFAULT_ICINGA_COMMAND_FILE = '/usr/local/icinga/var/rw/icinga.cmd'
     DEFAULT_ADMINS = []
+    DEFAULT_ICINGA_COMMAND_WRITER = 'blocking'
+    DEFAULT_ICINGA_COMMAND_QUEUE_SIZE = 1000
+    DEFAULT_ICINGA_COMMAND_TIMEOUT = 10.0
+    DEFAULT_COMMAND_JOB_QUEUE_SIZE = 10000
+    DEFAULT_COMMAND_JOB_BATCH_SIZE = 100
+    DEFAULT_COMMAND_JOB_RETENTION = 10000
+    DEFAULT_COMMAND_JOURNAL_COMPACT_SIZE = 1048576
+    DEFAULT_COMMAND_JOURNAL_REPLAY_INTERVAL = 5.0
+    DEFAULT_COMMAND_DEDUP_WINDOW = 0.0
+    DEFAULT_COMMAND_DEDUP_IGNORE = 'time,author'
+    DEFAULT_SLOW_QUERY_THRESHOLD = 1.0
+    DEFAULT_SLOW_QUERY_LOG_INTERVAL = 300.0
+    DEFAULT_SLOW_QUERY_FINGERPRINTS = 500
+    DEFAULT_PROFILE_SAMPLE_RATE = 0
+    DEFAULT_PROFILE_RETENTION = 100
+    DEFAULT_TRACE_BATCH_SIZE = 512
+    DEFAULT_CHANGE_FEED_SUBSCRIBERS = 20
+    DEFAULT_SNAPSHOT_REFRESH_INTERVAL = 10.0
+    DEFAULT_SNAPSHOT_RELOAD_INTERVAL = 300.0
+    DEFAULT_SHARED_CACHE_SIZE = 67108864
+    DEFAULT_SHARED_CACHE_TTL = 5.0
+    DEFAULT_SHARED_CACHE_AUTH_TTL = 60.0
+    DEFAULT_SHARED_CACHE_MAX_STALE = 30.0
 
     OPTION_LOG_FILE = 'log_file'
+    OPTION_LOG_LEVEL = 'log_level'
     OPTION_LIVESTATUS_SOCKET = 'livestatus_socket'
     OPTION_ICINGA_COMMAND_FILE = 'icinga_command_file'
     OPTION_ADMINS = 'admins'
+    OPTION_ICINGA_COMMAND_WRITER = 'icinga_command_writer'
+    OPTION_ICINGA_COMMAND_QUEUE_SIZE = 'icinga_command_queue_size'
+    OPTION_ICINGA_COMMAND_TIMEOUT = 'icinga_command_timeout'
+    OPTION_COMMAND_JOB_QUEUE_SIZE = 'command_job_queue_size'
+    OPTION_COMMAND_JOB_BATCH_SIZE = 'command_job_batch_size'
+    OPTION_COMMAND_JOB_RETENTION = 'command_job_retention'
+    OPTION_COMMAND_JOURNAL = 'command_journal'
+    OPTION_COMMAND_JOURNAL_COMPACT_SIZE = 'command_journal_compact_size'
+    OPTION_COMMAND_JOURNAL_REPLAY_INTERVAL = 'command_journal_replay_interval'
+    OPTION_COMMAND_DEDUP_WINDOW = 'command_dedup_window'
+    OPTION_COMMAND_DEDUP_IGNORE = 'command_dedup_ignore'
+    OPTION_METRICS_DIRECTORY = 'metrics_directory'
+    OPTION_SLOW_QUERY_THRESHOLD = 'slow_query_threshold'
+    OPTION_SLOW_QUERY_LOG_INTERVAL = 'slow_query_log_interval'
+    OPTION_SLOW_QUERY_FINGERPRINTS = 'slow_query_fingerprints'
+    OPTION_PROFILE_DIRECTORY = 'profile_directory'
+    OPTION_PROFILE_SAMPLE_RATE = 'profile_sample_rate'
+    OPTION_PROFILE_RETENTION = 'profile_retention'
+    OPTION_TRACE_EXPORT = 'trace_export'
+    OPTION_TRACE_BATCH_SIZE = 'trace_batch_size'
+    OPTION_TRAFFIC_RECORDING = 'traffic_recording'
+    OPTION_CHANGE_FEED_SUBSCRIBERS = 'change_feed_subscribers'
+    OPTION_SNAPSHOT_TABLES = 'snapshot_tables'
+    OPTION_SNAPSHOT_REFRESH_INTERVAL = 'snapshot_refresh_interval'
+    OPTION_SNAPSHOT_RELOAD_INTERVAL = 'snapshot_reload_interval'
+    OPTION_SHARED_CACHE = 'shared_cache'
+    OPTION_SHARED_CACHE_SIZE = 'shared_cache_size'
+    OPTION_SHARED_CACHE_TTL = 'shared_cache_ttl'
+    OPTION_SHARED_CACHE_AUTH_TTL = 'shared_cache_auth_ttl'
+    OPTION_SHARED_CACHE_MAX_STALE = 'shared_cache_max_stale'
+    OPTION_QUERY_MAX_AGE = 'query_max_age'
 
     SECTION = 'livestatus-service'
 
@@ -63,6 +120,15 @@ class Configuration(object):
     def log_file(self):
         return self._get_option(Configuration.OPTION_LOG_FILE, Configuration.DEFAULT_LOG_FILE)
 
+    @property
+    def log_level(self):
+        """Numeric level of the livestatus loggers, configured by name (DEBUG, INFO, WARNING, ...)"""
+        level_name = self._get_option(Configuration.OPTION_LOG_LEVEL, Configuration.DEFAULT_LOG_LEVEL).strip().upper()
+        level = logging.getLevelName(level_name)
+        if not isinstance(level, int):
+            raise ValueError('Unknown log level {0}'.format(level_name))
+        return level
+
     @property
     def livestatus_socket(self):
         return self._get_option(Configuration.OPTION_LIVESTATUS_SOCKET, Configuration.DEFAULT_LIVESTATUS_SOCKET)
@@ -76,6 +142,182 @@ class Configuration(object):
         admins_csv = self._get_option(Configuration.OPTION_ADMINS, Configuration.DEFAULT_ADMINS)
         return admins_csv.split(',')
 
+    @property
+    def icinga_command_writer(self):
+        """'blocking' opens the command file for every command, 'queued' keeps it open and writes from a queue"""
+        return self._get_option(Configuration.OPTION_ICINGA_COMMAND_WRITER, Configuration.DEFAULT_ICINGA_COMMAND_WRITER)
+
+    @property
+    def icinga_command_queue_size(self):
+        return self._get_int_option(Configuration.OPTION_ICINGA_COMMAND_QUEUE_SIZE, Configuration.DEFAULT_ICINGA_COMMAND_QUEUE_SIZE)
+
+    @property
+    def icinga_command_timeout(self):
+        return self._get_float_option(Configuration.OPTION_ICINGA_COMMAND_TIMEOUT, Configuration.DEFAULT_ICINGA_COMMAND_TIMEOUT)
+
+    @property
+    def command_job_queue_size(self):
+        return self._get_int_option(Configuration.OPTION_COMMAND_JOB_QUEUE_SIZE, Configuration.DEFAULT_COMMAND_JOB_QUEUE_SIZE)
+
+    @property
+    def command_job_batch_size(self):
+        return self._get_int_option(Configuration.OPTION_COMMAND_JOB_BATCH_SIZE, Configuration.DEFAULT_COMMAND_JOB_BATCH_SIZE)
+
+    @property
+    def command_job_retention(self):
+        """Number of jobs whose status is kept for polling"""
+        return self._get_int_option(Configuration.OPTION_COMMAND_JOB_RETENTION, Configuration.DEFAULT_COMMAND_JOB_RETENTION)
+
+    @property
+    def command_journal(self):
+        """Path of the journal for commands that could not be delivered, no journal is kept if unset"""
+        return self._get_optional_option(Configuration.OPTION_COMMAND_JOURNAL)
+
+    @property
+    def command_journal_compact_size(self):
+        return self._get_int_option(Configuration.OPTION_COMMAND_JOURNAL_COMPACT_SIZE, Configuration.DEFAULT_COMMAND_JOURNAL_COMPACT_SIZE)
+
+    @property
+    def command_journal_replay_interval(self):
+        return self._get_float_option(Configuration.OPTION_COMMAND_JOURNAL_REPLAY_INTERVAL, Configuration.DEFAULT_COMMAND_JOURNAL_REPLAY_INTERVAL)
+
+    @property
+    def command_dedup_window(self):
+        """Seconds during which identical commands are only performed once, 0 disables de-duplication"""
+        return self._get_float_option(Configuration.OPTION_COMMAND_DEDUP_WINDOW, Configuration.DEFAULT_COMMAND_DEDUP_WINDOW)
+
+    @property
+    def command_dedup_ignore(self):
+        """Kinds of command arguments (time, author, comment) that do not make commands different"""
+        ignore_csv = self._get_option(Configuration.OPTION_COMMAND_DEDUP_IGNORE, Configuration.DEFAULT_COMMAND_DEDUP_IGNORE)
+        return [kind.strip() for kind in ignore_csv.split(',') if kind.strip()]
+
+    @property
+    def metrics_directory(self):
+        """Directory shared by all service processes to aggregate their metrics, metrics are per process if unset"""
+        return self._get_optional_option(Configuration.OPTION_METRICS_DIRECTORY)
+
+    @property
+    def slow_query_threshold(self):
+        """Queries taking at least this many seconds are logged and aggregated by fingerprint"""
+        return self._get_float_option(Configuration.OPTION_SLOW_QUERY_THRESHOLD, Configuration.DEFAULT_SLOW_QUERY_THRESHOLD)
+
+    @property
+    def slow_query_log_interval(self):
+        return self._get_float_option(Configuration.OPTION_SLOW_QUERY_LOG_INTERVAL, Configuration.DEFAULT_SLOW_QUERY_LOG_INTERVAL)
+
+    @property
+    def slow_query_fingerprints(self):
+        return self._get_int_option(Configuration.OPTION_SLOW_QUERY_FINGERPRINTS, Configuration.DEFAULT_SLOW_QUERY_FINGERPRINTS)
+
+    @property
+    def profile_directory(self):
+        """Directory for the profiles of profiled requests, profiling is disabled if unset"""
+        return self._get_optional_option(Configuration.OPTION_PROFILE_DIRECTORY)
+
+    @property
+    def profile_sample_rate(self):
+        """Profile one in this many requests, 0 profiles only requests of admins asking for it"""
+        return self._get_int_option(Configuration.OPTION_PROFILE_SAMPLE_RATE, Configuration.DEFAULT_PROFILE_SAMPLE_RATE)
+
+    @property
+    def profile_retention(self):
+        return self._get_int_option(Configuration.OPTION_PROFILE_RETENTION, Configuration.DEFAULT_PROFILE_RETENTION)
+
+    @property
+    def trace_export(self):
+        """File or UNIX socket of a collector receiving the trace spans as OTLP/JSON, tracing is disabled if unset"""
+        return self._get_optional_option(Configuration.OPTION_TRACE_EXPORT)
+
+    @property
+    def trace_batch_size(self):
+        return self._get_int_option(Configuration.OPTION_TRACE_BATCH_SIZE, Configuration.DEFAULT_TRACE_BATCH_SIZE)
+
+    @property
+    def traffic_recording(self):
+        """File the dispatched requests are appended to for a later replay, nothing is recorded if unset"""
+        return self._get_optional_option(Configuration.OPTION_TRAFFIC_RECORDING)
+
+    @property
+    def change_feed_subscribers(self):
+        """Every subscriber of /changes keeps a worker thread busy, more subscribers are rejected"""
+        return self._get_int_option(Configuration.OPTION_CHANGE_FEED_SUBSCRIBERS, Configuration.DEFAULT_CHANGE_FEED_SUBSCRIBERS)
+
+    @property
+    def snapshot_tables(self):
+        """Tables (hosts, services) kept in memory to answer simple queries, no snapshots if empty"""
+        tables_csv = self._get_optional_option(Configuration.OPTION_SNAPSHOT_TABLES) or ''
+        return [table.strip() for table in tables_csv.split(',') if table.strip()]
+
+    @property
+    def snapshot_refresh_interval(self):
+        """Seconds between fetching the changed rows, snapshots are not used when three refreshes were missed"""
+        return self._get_float_option(Configuration.OPTION_SNAPSHOT_REFRESH_INTERVAL, Configuration.DEFAULT_SNAPSHOT_REFRESH_INTERVAL)
+
+    @property
+    def snapshot_reload_interval(self):
+        """Seconds between complete reloads, picking up changes which did not touch the check or state change times"""
+        return self._get_float_option(Configuration.OPTION_SNAPSHOT_RELOAD_INTERVAL, Configuration.DEFAULT_SNAPSHOT_RELOAD_INTERVAL)
+
+    @property
+    def shared_cache(self):
+        """File mapped by all service processes to share query answers and permissions, e.g. in /dev/shm, no cache if unset"""
+        return self._get_optional_option(Configuration.OPTION_SHARED_CACHE)
+
+    @property
+    def shared_cache_size(self):
+        return self._get_int_option(Configuration.OPTION_SHARED_CACHE_SIZE, Configuration.DEFAULT_SHARED_CACHE_SIZE)
+
+    @property
+    def shared_cache_ttl(self):
+        """Seconds a query answer is served from the shared cache"""
+        return self._get_float_option(Configuration.OPTION_SHARED_CACHE_TTL, Configuration.DEFAULT_SHARED_CACHE_TTL)
+
+    @property
+    def shared_cache_auth_ttl(self):
+        """Seconds a permission of a contact to command a target is served from the shared cache"""
+        return self._get_float_option(Configuration.OPTION_SHARED_CACHE_AUTH_TTL, Configuration.DEFAULT_SHARED_CACHE_AUTH_TTL)
+
+    @property
+    def shared_cache_max_stale(self):
+        """Seconds an expired query answer is still served while it is refreshed in the background"""
+        return self._get_float_option(Configuration.OPTION_SHARED_CACHE_MAX_STALE, Configuration.DEFAULT_SHARED_CACHE_MAX_STALE)
+
+    @property
+    def query_max_age(self):
+        """Seconds clients and proxies may reuse /query answers per table, as 'hosts=30, services=10'"""
+        max_age_csv = self._get_optional_option(Configuration.OPTION_QUERY_MAX_AGE) or ''
+        max_ages = {}
+        for table_max_age in max_age_csv.split(','):
+            if not table_max_age.strip():
+                continue
+            table, separator, max_age = table_max_age.partition('=')
+            if not separator or not max_age.strip().isdigit():
+                raise ValueError('Invalid {0} {1}, expected table=seconds.'.format(Configuration.OPTION_QUERY_MAX_AGE, table_max_age.strip()))
+            max_ages[table.strip()] = int(max_age)
+        return max_ages
+
+    def _get_optional_option(self, option):
+        if not self._config_parser.has_option(Configuration.SECTION, option):
+            return None
+        return self._config_parser.get(Configuration.SECTION, option)
+
+    def _get_int_option(self, option, default_value):
+        if not self._config_parser.has_option(Configuration.SECTION, option):
+            return default_value
+        try:
+            return self._config_parser.getint(Configuration.SECTION, option)
+        except ValueError:
+            raise ValueError("Option '{0}' in section '{1}' must be an integer".format(option, Configuration.SECTION))
+
+    def _get_float_option(self, option, default_value):
+        if not self._config_parser.has_option(Configuration.SECTION, option):
+            return default_value
+        try:
+            return self._config_parser.getfloat(Configuration.SECTION, option)
+        except ValueError:
+            raise ValueError("Option '{0}' in section '{1}' must be a number".format(option, Configuration.SECTION))
+
     def _get_option(self, option, default_value=None):
         if not self._config_parser.has_option(Configuration.SECTION, option):
             if default_value:
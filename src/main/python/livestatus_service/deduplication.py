@@ -0,0 +1,95 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from __future__ import absolute_import
+from collections import deque
+import threading
+import time
+
+'''
+    Recognises commands that were already performed within a time window, so that
+    identical commands sent by several people or bots are only executed once.
+'''
+
+
+class _Claim(object):
+
+    def __init__(self, auth, expiry):
+        self.auth = auth
+        self.expiry = expiry
+        self.succeeded = False
+        self.finished = threading.Event()
+
+
+class CommandDeduplicator(object):
+    """
+    A command is claimed by its first sender. Identical commands are only coalesced with it once
+    its command has succeeded, while it is still being performed they wait for the outcome.
+    """
+
+    def __init__(self):
+        self._claims = {}
+        self._expiries = deque()
+        self._lock = threading.Lock()
+
+    def claim(self, command_key, auth, window):
+        """
+        Returns (False, None) if the command is new and is now claimed for the given contact,
+        otherwise (True, contact) with the contact whose identical command succeeded within the window.
+        """
+        while True:
+            now = time.time()
+            with self._lock:
+                self._expire(now)
+                claim = self._claims.get(command_key)
+                if claim is None:
+                    self._claims[command_key] = _Claim(auth, now + window)
+                    self._expiries.append((now + window, command_key))
+                    return False, None
+                if claim.succeeded:
+                    return True, claim.auth
+            claim.finished.wait(max(claim.expiry - now, 0))
+
+    def confirm(self, command_key):
+        """Marks a claimed command as performed, identical commands are coalesced with it from now on"""
+        with self._lock:
+            claim = self._claims.get(command_key)
+            if claim is not None:
+                claim.succeeded = True
+                claim.finished.set()
+
+    def release(self, command_key):
+        """Forgets a claimed command, e.g. because it could not be performed"""
+        with self._lock:
+            claim = self._claims.pop(command_key, None)
+        if claim is not None:
+            claim.finished.set()
+
+    def _expire(self, now):
+        while self._expiries and self._expiries[0][0] <= now:
+            expiry, command_key = self._expiries.popleft()
+            claim = self._claims.get(command_key)
+            if claim is not None and claim.expiry == expiry:
+                del self._claims[command_key]
+                claim.finished.set()
@@ -0,0 +1,163 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from __future__ import absolute_import
+import logging
+import simplejson as json
+import threading
+import time
+from collections import OrderedDict
+
+from livestatus_service.livestatus import fetch_answer, format_answer, get_table
+from livestatus_service.changes import get_key_columns, with_key_columns
+
+'''
+    Delta queries of the hosts and services tables. Only rows whose last check or state change
+    is not older than the given timestamp are queried, removed rows are found by comparing the
+    current keys with a timeline of the keys seen by earlier delta queries.
+'''
+
+LOGGER = logging.getLogger('livestatus.deltas')
+
+DELTA_TABLES = ('hosts', 'services')
+CHANGE_FILTER = ('Filter: last_check >= {0}\n'
+                 'Filter: last_state_change >= {0}\n'
+                 'Filter: last_hard_state_change >= {0}\n'
+                 'Or: 3')
+
+
+def changed_rows_query(query, since):
+    """Appended filters are combined with the filters of the query by an implicit And"""
+    return '{0}\n{1}'.format(query, CHANGE_FILTER.format(int(since)))
+
+
+def keys_query(query, key_columns):
+    query_lines = [query_line for query_line in query.splitlines() if not query_line.startswith('Columns:')]
+    query_lines.insert(1, 'Columns: {0}'.format(' '.join(key_columns)))
+    return '\n'.join(query_lines)
+
+
+def _row_key(row, key_columns):
+    return tuple(row.get(column) for column in key_columns)
+
+
+class KeyTimeline(object):
+    """When the keys of a query were first seen and when they disappeared"""
+
+    def __init__(self, keys, observed_at):
+        self.tracked_since = observed_at
+        self.observed_at = observed_at
+        self.inserted = dict.fromkeys(keys, observed_at)
+        self.removed = {}
+
+    def observe(self, keys, observed_at, retention):
+        if observed_at < self.observed_at:
+            # a concurrent delta query has already seen a newer state
+            return
+        self.observed_at = observed_at
+        keys = set(keys)
+        for key in keys:
+            if key not in self.inserted:
+                self.inserted[key] = observed_at
+                self.removed.pop(key, None)
+        for key in [key for key in self.inserted if key not in keys]:
+            del self.inserted[key]
+            self.removed[key] = observed_at
+        for key in [key for key, removed_at in self.removed.items() if removed_at < observed_at - retention]:
+            del self.removed[key]
+
+    def covers(self, since, now, retention):
+        return since >= self.tracked_since and since >= now - retention
+
+    def inserted_since(self, key, since):
+        """Keys not observed yet were inserted after the keys were queried"""
+        inserted_at = self.inserted.get(key)
+        return inserted_at is None or inserted_at > since
+
+    def removed_since(self, since):
+        return [list(key) for key, removed_at in self.removed.items() if removed_at >= since]
+
+
+class DeltaTracker(object):
+    """
+    Keeps the key timelines of the most recently used queries. A delta since a time before a
+    timeline was started or beyond the retention is answered with all rows and full set to true.
+    """
+
+    def __init__(self, retention=3600.0, max_queries=20):
+        self.retention = retention
+        self.max_queries = max_queries
+        self._lock = threading.Lock()
+        self._timelines = OrderedDict()
+
+    def perform_delta_query(self, query, socket_path, since, key=None, auth=None):
+        if get_table(query) not in DELTA_TABLES:
+            raise ValueError('Delta queries are only supported for the tables {0}.'.format(', '.join(DELTA_TABLES)))
+        key_columns = get_key_columns(query, key)
+        query = with_key_columns(query, key_columns)
+        timeline_key = (query, auth, socket_path)
+        now = time.time()
+        # livestatus timestamps are seconds, the next delta has to include the current second again
+        high_water_mark = int(now)
+
+        keys = [_row_key(row, key_columns) for row in self._fetch_rows(keys_query(query, key_columns), socket_path, auth)]
+        with self._lock:
+            timeline = self._timelines.pop(timeline_key, None)
+            if timeline is None:
+                # started at the high water mark, so the next delta since it is covered
+                timeline = KeyTimeline(keys, high_water_mark)
+            else:
+                timeline.observe(keys, now, self.retention)
+            self._timelines[timeline_key] = timeline
+            while len(self._timelines) > self.max_queries:
+                self._timelines.popitem(last=False)
+            full = not timeline.covers(since, now, self.retention)
+
+        if full:
+            return self._serialize(high_water_mark, True, self._fetch_rows(query, socket_path, auth), [], [])
+
+        inserted, changed = [], []
+        for row in self._fetch_rows(changed_rows_query(query, since), socket_path, auth):
+            if timeline.inserted_since(_row_key(row, key_columns), since):
+                inserted.append(row)
+            else:
+                changed.append(row)
+        with self._lock:
+            removed = timeline.removed_since(since)
+        return self._serialize(high_water_mark, False, inserted, changed, removed)
+
+    @staticmethod
+    def _fetch_rows(query, socket_path, auth):
+        return format_answer(query, fetch_answer(query, socket_path, auth), None)
+
+    @staticmethod
+    def _serialize(high_water_mark, full, inserted, changed, removed):
+        return json.dumps({'high_water_mark': high_water_mark,
+                           'full': full,
+                           'inserted': inserted,
+                           'changed': changed,
+                           'removed': removed}, sort_keys=False, indent=4)
+
+
+DELTA_TRACKER = DeltaTracker()
@@ -25,10 +25,35 @@ THE SOFTWARE.
 from __future__ import absolute_import
 from livestatus_service.configuration import get_current_configuration
 from livestatus_service.icinga import perform_command as perform_icinga_command
+from livestatus_service.icinga import perform_commands as perform_icinga_commands
+from livestatus_service.icinga import perform_queued_commands as perform_queued_icinga_commands
 from livestatus_service.livestatus import perform_query as perform_livestatus_query
 from livestatus_service.livestatus import perform_command as perform_livestatus_command
-from livestatus_service.external_commands import get_command_group_and_arg
+from livestatus_service.livestatus import perform_commands as perform_livestatus_commands
+from livestatus_service.livestatus import get_table, serialize_answer
+from livestatus_service.icinga import IcingaCommandPipeUnavailableException
+from livestatus_service.livestatus import LivestatusSocketUnavailableException
+from livestatus_service.jobs import get_command_job_executor
+from livestatus_service.journal import get_command_journal
+from livestatus_service.deduplication import CommandDeduplicator
+from livestatus_service.changes import CHANGE_FEED
+from livestatus_service.deltas import DELTA_TRACKER
+from livestatus_service.snapshot import SNAPSHOTS
+from livestatus_service.shared_cache import SHARED_CACHE
+from livestatus_service.joins import join_hosts_with_services, fetch_raw_answer
+from livestatus_service.analytics import Analysis
+from livestatus_service.external_commands import (get_command_group_and_arg,
+                                                  normalize_command,
+                                                  get_template_columns,
+                                                  expand_command_template)
+from livestatus_service.metrics import DISPATCH_SECONDS, table_label, handler_label, outcome_label
+from livestatus_service import server_timing
+from livestatus_service import tracing
+from functools import wraps
+import simplejson as json
 import logging
+import threading
+import time
 
 '''
     Decides how queries and commands are performed based on the 'handler'.
@@ -37,9 +62,40 @@ import logging
 
 LOGGER = logging.getLogger('livestatus.livestatus')
 
+CORE_UNAVAILABLE_EXCEPTIONS = (LivestatusSocketUnavailableException, IcingaCommandPipeUnavailableException)
+
+COMMAND_DEDUPLICATOR = CommandDeduplicator()
+
+REFRESH_TIMEOUT = 60.0
+REFRESH_SLOTS = threading.BoundedSemaphore(4)
+
+
+class PermissionDeniedException(ValueError):
+    pass
 
-def perform_query(query, key=None, auth=None, handler=None):
-    configuration = get_current_configuration()
+
+def _measured(operation):
+    def decorate(perform):
+        @wraps(perform)
+        def perform_measured(query, key=None, auth=None, handler=None, **kwargs):
+            start = time.time()
+            table = table_label(get_table(query))
+            outcome = 'error'
+            try:
+                with tracing.span('dispatcher.{0}'.format(operation), table=table, handler=handler_label(handler)):
+                    result = perform(query, key=key, auth=auth, handler=handler, **kwargs)
+                outcome = outcome_label(result, kwargs.get('dry_run'))
+                return result
+            finally:
+                DISPATCH_SECONDS.observe(time.time() - start, operation=operation, table=table,
+                                         handler=handler_label(handler), outcome=outcome)
+        return perform_measured
+    return decorate
+
+
+@_measured('query')
+def perform_query(query, key=None, auth=None, handler=None, since=None, perf_data=None):
+    configuration = _load_configuration()
 
     # Admins could query everything
     if auth in configuration.admins:
@@ -47,11 +103,95 @@ def perform_query(query, key=None, auth=None, handler=None):
 
     if _is_livestatus_handler(handler):
         socket_path = configuration.livestatus_socket
-        return perform_livestatus_query(query, socket_path, key, auth=auth)
+        if since is not None:
+            if perf_data is not None:
+                raise ValueError('Delta queries can not parse perf_data.')
+            return DELTA_TRACKER.perform_delta_query(query, socket_path, since, key, auth=auth)
+        cache_key = json.dumps(['query', query, key, auth, perf_data])
+        cached_entry = SHARED_CACHE.get_entry(cache_key)
+        if cached_entry is not None:
+            cached_answer, age, fresh = cached_entry
+            server_timing.served_from_cache(age, fresh)
+            if not fresh:
+                _refresh_in_background(cache_key, query, socket_path, key, auth, perf_data)
+            return cached_answer.decode('utf-8')
+        answer = _answer_livestatus_query(query, socket_path, key, auth, perf_data)
+        SHARED_CACHE.put(cache_key, answer.encode('utf-8'), max_stale=SHARED_CACHE.max_stale)
+        return answer
 
     raise ValueError('No handler {0}.'.format(handler))
 
 
+def _answer_livestatus_query(query, socket_path, key, auth, perf_data=None):
+    snapshot_answer = SNAPSHOTS.answer(query, auth)
+    if snapshot_answer is not None:
+        return serialize_answer(query, snapshot_answer, key, perf_data)
+    return perform_livestatus_query(query, socket_path, key, auth=auth, perf_data=perf_data)
+
+
+def _refresh_in_background(cache_key, query, socket_path, key, auth, perf_data=None):
+    """Stale answers are served while one thread of all processes refreshes them, a few threads per process at most"""
+    if not REFRESH_SLOTS.acquire(False):
+        return
+    if not SHARED_CACHE.claim(cache_key, REFRESH_TIMEOUT):
+        REFRESH_SLOTS.release()
+        return
+    refresh = threading.Thread(target=_refresh_cached_answer, args=(cache_key, query, socket_path, key, auth, perf_data),
+                               name='livestatus-cache-refresh')
+    refresh.daemon = True
+    refresh.start()
+
+
+def _refresh_cached_answer(cache_key, query, socket_path, key, auth, perf_data=None):
+    try:
+        answer = _answer_livestatus_query(query, socket_path, key, auth, perf_data)
+        SHARED_CACHE.put(cache_key, answer.encode('utf-8'), max_stale=SHARED_CACHE.max_stale)
+    except Exception as exception:
+        LOGGER.warn('Could not refresh the cached answer of %r: %s', query, exception)
+    finally:
+        SHARED_CACHE.release(cache_key)
+        REFRESH_SLOTS.release()
+
+
+def perform_join_query(host_columns, service_columns, host_filter='', service_filter='', key=None, auth=None, handler=None):
+    configuration = _load_configuration()
+
+    if auth in configuration.admins:
+        auth = None
+
+    if not _is_livestatus_handler(handler):
+        raise ValueError('No handler {0}.'.format(handler))
+    with tracing.span('dispatcher.join', table='hosts'):
+        return join_hosts_with_services(host_columns, service_columns, host_filter, service_filter,
+                                        configuration.livestatus_socket, key, auth)
+
+
+@_measured('analytics')
+def perform_analytics(query, key=None, auth=None, handler=None, **analysis_parameters):
+    """Only the aggregates of the rows are returned, the key is not used"""
+    configuration = _load_configuration()
+
+    if auth in configuration.admins:
+        auth = None
+
+    if not _is_livestatus_handler(handler):
+        raise ValueError('No handler {0}.'.format(handler))
+    analysis = Analysis(**analysis_parameters)
+    answer = fetch_raw_answer(analysis.query(query), configuration.livestatus_socket, auth)
+    return json.dumps(analysis.compute(answer), indent=4)
+
+
+def subscribe_to_changes(query, key=None, auth=None, handler=None):
+    configuration = _load_configuration()
+
+    if auth in configuration.admins:
+        auth = None
+
+    if not _is_livestatus_handler(handler):
+        raise ValueError('No handler {0}.'.format(handler))
+    return CHANGE_FEED.subscribe(query, configuration.livestatus_socket, key, auth)
+
+
 def check_contact_permissions(command, auth):
     cmd_group, param = get_command_group_and_arg(command)
     LOGGER.debug("cmd_group: %s, param: %s", cmd_group, param)
@@ -59,12 +199,37 @@ def check_contact_permissions(command, auth):
     LOGGER.debug("Checking if contact {0} has permissions to execute {1}".format(auth, command))
 
     check_function_name = "check_auth_%s" % cmd_group.lower()
-    if not eval(check_function_name)(auth, param):
-        raise ValueError('{0} is not allowed to run {1} or target is empty'.format(auth, command))
+    start = time.time()
+    with tracing.span(check_function_name, auth=auth, target=param):
+        allowed = _check_permission(check_function_name, auth, param)
+    server_timing.record_phase('auth', time.time() - start)
+    if not allowed:
+        raise PermissionDeniedException('{0} is not allowed to run {1} or target is empty'.format(auth, command))
     else:
         LOGGER.debug("Access allowed")
 
 
+def _check_permission(check_function_name, auth, param):
+    """Permissions, granted or not, are shared by all processes through the shared cache"""
+    cache_key = json.dumps(['auth', check_function_name, auth, param])
+    cached_permission = SHARED_CACHE.get(cache_key, kind='auth')
+    if cached_permission is not None:
+        return cached_permission == b'1'
+    allowed = eval(check_function_name)(auth, param)
+    SHARED_CACHE.put(cache_key, b'1' if allowed else b'0', SHARED_CACHE.auth_ttl)
+    return allowed
+
+
+def check_contact_permissions_in_bulk(commands, auth):
+    """Expanded commands mostly share their targets, so every target is only checked once"""
+    checked_targets = set()
+    for command in commands:
+        target = get_command_group_and_arg(command)
+        if target not in checked_targets:
+            check_contact_permissions(command, auth)
+            checked_targets.add(target)
+
+
 def check_auth_contactgroup_cmds(auth, param):
     # For this table auth is ignored. We check if our contact is in the target contactgroup
     contactgroups = eval(perform_query("GET contactgroups\nColumns: name\nFilter: name = %s\nFilter: members >= %s" % (param, auth), auth=auth))
@@ -117,9 +282,102 @@ def check_auth_global_cmds(auth, param):
     return False
 
 
+@_measured('command')
 def perform_command(command, key=None, auth=None, handler=None):
-    configuration = get_current_configuration()
+    """
+    Identical commands within the configured de-duplication window are only performed once,
+    the later ones are answered with 'COALESCED'.
+    When a command journal is configured, commands which cannot be delivered because icinga is
+    unreachable are journaled and replayed later. The answer is then 'QUEUED' instead of 'OK'.
+    """
+    configuration = _load_configuration()
+
+    if configuration.command_dedup_window > 0:
+        return _perform_deduplicated_command(command, key, auth, handler, configuration)
+    return _perform_journaled_command(command, key, auth, handler, configuration)
+
+
+def _perform_deduplicated_command(command, key, auth, handler, configuration):
+    _validate_handler(handler)
+    command_key = (_handler_name(handler), normalize_command(command, configuration.command_dedup_ignore))
+    duplicate, first_auth = COMMAND_DEDUPLICATOR.claim(command_key, auth, configuration.command_dedup_window)
+    if duplicate:
+        # other contacts may only piggyback on commands they are allowed to run themselves
+        if auth != first_auth and auth not in configuration.admins:
+            check_contact_permissions(command, auth)
+        LOGGER.debug("Coalesced command %s", command)
+        return 'COALESCED'
+    try:
+        result = _perform_journaled_command(command, key, auth, handler, configuration)
+    except BaseException:
+        COMMAND_DEDUPLICATOR.release(command_key)
+        raise
+    COMMAND_DEDUPLICATOR.confirm(command_key)
+    return result
+
+
+def _perform_journaled_command(command, key, auth, handler, configuration):
+    journal = _get_command_journal(configuration)
+    if journal is None:
+        return _perform_command(command, key, auth, handler, configuration)
+
+    _validate_handler(handler)
+    if journal.has_pending_commands():
+        # keep the order, the journal has to be replayed before newer commands are delivered
+        _check_journaled_command(command, auth, configuration)
+        journal.append(command, auth=auth, handler=handler)
+        return 'QUEUED'
+    try:
+        return _perform_command(command, key, auth, handler, configuration)
+    except CORE_UNAVAILABLE_EXCEPTIONS as exception:
+        _check_journaled_command(command, auth, configuration)
+        LOGGER.warn("Journaling command %s: %s", command, exception)
+        journal.append(command, auth=auth, handler=handler)
+        return 'QUEUED'
+
+
+def _check_journaled_command(command, auth, configuration):
+    """
+    Only commands the contact may run are journaled. When icinga is unreachable the
+    permission cannot be checked, so only the commands of admins are journaled then.
+    """
+    command_group, _ = get_command_group_and_arg(command)
+    if auth in configuration.admins:
+        return
+    if not command_group:
+        raise PermissionDeniedException('{0} is not allowed to run {1}'.format(auth, command))
+    try:
+        check_contact_permissions(command, auth)
+    except CORE_UNAVAILABLE_EXCEPTIONS as exception:
+        raise PermissionDeniedException('The permission of {0} to run {1} cannot be checked: {2}'.format(auth, command, exception))
+
+
+def replay_journaled_commands(entries):
+    configuration = _load_configuration()
+
+    replayed = 0
+    for entry in entries:
+        try:
+            _perform_command(entry['command'], None, entry['auth'], entry['handler'], configuration)
+        except CORE_UNAVAILABLE_EXCEPTIONS as exception:
+            LOGGER.warn("Icinga is still unreachable, stopping replay: %s", exception)
+            break
+        except BaseException as exception:
+            LOGGER.error("Dropping journaled command %s: %s", entry['command'], exception)
+        replayed += 1
+    return replayed
+
+
+def _get_command_journal(configuration):
+    journal_path = configuration.command_journal
+    if not journal_path:
+        return None
+    journal = get_command_journal(journal_path, configuration.command_journal_compact_size)
+    journal.start_replaying(replay_journaled_commands, configuration.command_journal_replay_interval)
+    return journal
 
+
+def _perform_command(command, key, auth, handler, configuration):
     LOGGER.debug("admins: %s", configuration.admins)
     # Admins users could run all commands
     if auth not in configuration.admins:
@@ -130,10 +388,144 @@ def perform_command(command, key=None, auth=None, handler=None):
         return perform_livestatus_command(command, socket_path, key, auth=auth)
     elif handler == 'icinga':
         command_file_path = configuration.icinga_command_file
+        if _is_queued_icinga_writer(configuration):
+            return perform_queued_icinga_commands([command], command_file_path,
+                                                  configuration.icinga_command_queue_size,
+                                                  configuration.icinga_command_timeout)
         return perform_icinga_command(command, command_file_path, key, auth=auth)
 
     raise ValueError('No handler {0}.'.format(handler))
 
 
+@_measured('mass_command')
+def perform_mass_command(command_template, key=None, auth=None, handler=None, selector=None, dry_run=False):
+    """
+    Expands the command template (e.g. 'SCHEDULE_FORCED_SVC_CHECK;{host_name};{description};0')
+    with every row selected by the LQL selector and submits the resulting commands as one batch.
+    """
+    if not selector:
+        raise ValueError('A selector is mandatory for mass commands.')
+    configuration = _load_configuration()
+
+    columns = get_template_columns(command_template)
+    if not columns:
+        raise ValueError('The command template {0} does not reference any column.'.format(command_template))
+    rows = json.loads(perform_query(_select_columns(selector, columns), auth=auth))
+    commands = expand_command_template(command_template, rows)
+    LOGGER.debug("Expanded %s to %s commands", command_template, len(commands))
+
+    if dry_run:
+        return json.dumps(commands, indent=4)
+
+    if auth not in configuration.admins:
+        check_contact_permissions_in_bulk(commands, auth)
+    if not commands:
+        return 'OK'
+
+    return submit_commands(commands, handler=handler, auth=auth)
+
+
+def submit_command_job(command, key=None, auth=None, handler=None):
+    """Validates the command and queues it for execution, the permission check happens in the background"""
+    configuration = _load_configuration()
+
+    _validate_handler(handler)
+    cmd_group, _ = get_command_group_and_arg(command)
+    if not cmd_group and auth not in configuration.admins:
+        raise ValueError('Unknown command {0}.'.format(command))
+
+    executor = get_command_job_executor(execute_command_jobs,
+                                        configuration.command_job_queue_size,
+                                        configuration.command_job_batch_size,
+                                        configuration.command_job_retention)
+    job = executor.submit(command, auth=auth, handler=handler)
+    job_status = job.as_dict()
+    job_status['queue_depth'] = executor.queue_depth
+    job_status['queue_size'] = executor.queue_size
+    return json.dumps(job_status, indent=4)
+
+
+def execute_command_jobs(jobs):
+    """Checks the permissions of every job, then submits the permitted commands of each contact and handler at once"""
+    configuration = _load_configuration()
+
+    groups = []
+    jobs_by_group = {}
+    for job in jobs:
+        group = (job.auth, job.handler)
+        if group not in jobs_by_group:
+            groups.append(group)
+            jobs_by_group[group] = []
+        jobs_by_group[group].append(job)
+
+    for auth, handler in groups:
+        permitted_jobs = []
+        for job in jobs_by_group[(auth, handler)]:
+            try:
+                if auth not in configuration.admins:
+                    check_contact_permissions(job.command, auth)
+                permitted_jobs.append(job)
+            except BaseException as exception:
+                job.fail(exception)
+        if not permitted_jobs:
+            continue
+        try:
+            result = submit_commands([job.command for job in permitted_jobs], handler=handler, auth=auth)
+            for job in permitted_jobs:
+                job.succeed(result)
+        except BaseException as exception:
+            for job in permitted_jobs:
+                job.fail(exception)
+
+
+def submit_commands(commands, handler=None, auth=None):
+    configuration = _load_configuration()
+
+    if _is_livestatus_handler(handler):
+        socket_path = configuration.livestatus_socket
+        return perform_livestatus_commands(commands, socket_path, auth=auth)
+    elif handler == 'icinga':
+        command_file_path = configuration.icinga_command_file
+        if _is_queued_icinga_writer(configuration):
+            return perform_queued_icinga_commands(commands, command_file_path,
+                                                  configuration.icinga_command_queue_size,
+                                                  configuration.icinga_command_timeout)
+        return perform_icinga_commands(commands, command_file_path, auth=auth)
+
+    raise ValueError('No handler {0}.'.format(handler))
+
+
+def _select_columns(selector, columns):
+    selector_lines = [selector_line for selector_line in selector.splitlines() if selector_line.strip()]
+    for index, selector_line in enumerate(selector_lines):
+        if selector_line.startswith('Columns:'):
+            selected_columns = selector_line.split('Columns:')[1].split()
+            missing_columns = [column for column in columns if column not in selected_columns]
+            selector_lines[index] = 'Columns: {0}'.format(' '.join(selected_columns + missing_columns))
+            return '\n'.join(selector_lines)
+    selector_lines.append('Columns: {0}'.format(' '.join(columns)))
+    return '\n'.join(selector_lines)
+
+
 def _is_livestatus_handler(handler):
     return handler is None or handler == 'livestatus'
+
+
+def _load_configuration():
+    start = time.time()
+    configuration = get_current_configuration()
+    server_timing.record_phase('config', time.time() - start)
+    return configuration
+
+
+def _handler_name(handler):
+    return 'livestatus' if _is_livestatus_handler(handler) else handler
+
+
+def _validate_handler(handler):
+    if not (_is_livestatus_handler(handler) or handler == 'icinga'):
+        raise ValueError('No handler {0}.'.format(handler))
+
+
+def _is_queued_icinga_writer(configuration):
+    return configuration.icinga_command_writer == 'queued'
@@ -1,3 +1,5 @@
+from string import Formatter
+
 CONTACTGROUP_CMDS = ["DISABLE_CONTACTGROUP_HOST_NOTIFICATIONS", "DISABLE_CONTACTGROUP_SVC_NOTIFICATIONS", "ENABLE_CONTACTGROUP_HOST_NOTIFICATIONS", "ENABLE_CONTACTGROUP_SVC_NOTIFICATIONS"]
 
 CONTACTNAME_CMDS = ["CHANGE_CONTACT_HOST_NOTIFICATION_TIMEPERIOD", "CHANGE_CONTACT_MODATTR", "CHANGE_CONTACT_MODHATTR", "CHANGE_CONTACT_MODSATTR", "CHANGE_CONTACT_SVC_NOTIFICATION_TIMEPERIOD", "CHANGE_CUSTOM_CONTACT_VAR", "DISABLE_CONTACT_HOST_NOTIFICATIONS", "DISABLE_CONTACT_SVC_NOTIFICATIONS", "ENABLE_CONTACT_HOST_NOTIFICATIONS", "ENABLE_CONTACT_SVC_NOTIFICATIONS"]
@@ -18,6 +20,17 @@ GLOBAL_CMDS = ["CHANGE_GLOBAL_HOST_EVENT_HANDLER", "CHANGE_GLOBAL_SVC_EVENT_HAND
 
 COMMAND_GROUPS = ["CONTACTGROUP_CMDS", "CONTACTNAME_CMDS", "HOSTGROUPNAME_CMDS", "SERVICEGROUPNAME_CMDS", "HOSTNAME_CMDS", "COMMENTID_CMDS", "DOWNTIMEID_CMDS", "DISABLED_CMDS", "GLOBAL_CMDS"]
 
+# Positions of arguments (0 being the command name) which do not change what the command does,
+# grouped by the kind of argument so that de-duplication can ignore them selectively
+VOLATILE_COMMAND_ARGUMENTS = {
+    "time": {"SCHEDULE_FORCED_HOST_CHECK": [2], "SCHEDULE_FORCED_HOST_SVC_CHECKS": [2], "SCHEDULE_FORCED_SVC_CHECK": [3],
+             "SCHEDULE_HOST_CHECK": [2], "SCHEDULE_HOST_SVC_CHECKS": [2], "SCHEDULE_SVC_CHECK": [3]},
+    "author": {"ACKNOWLEDGE_HOST_PROBLEM": [5], "ACKNOWLEDGE_SVC_PROBLEM": [6], "ADD_HOST_COMMENT": [3], "ADD_SVC_COMMENT": [4],
+               "SCHEDULE_HOST_DOWNTIME": [7], "SCHEDULE_SVC_DOWNTIME": [8]},
+    "comment": {"ACKNOWLEDGE_HOST_PROBLEM": [6], "ACKNOWLEDGE_SVC_PROBLEM": [7], "ADD_HOST_COMMENT": [4], "ADD_SVC_COMMENT": [5],
+                "SCHEDULE_HOST_DOWNTIME": [8], "SCHEDULE_SVC_DOWNTIME": [9]}
+}
+
 
 def get_command_group_and_arg(command):
     cmd_list = command.split(';')
@@ -26,3 +39,34 @@ def get_command_group_and_arg(command):
     group = "".join(map(lambda k: k if cmd in eval(k) else '', COMMAND_GROUPS))
 
     return group, arg
+
+
+def normalize_command(command, ignored_arguments):
+    """Blanks the volatile arguments of the given kinds (e.g. ['time', 'author']) out of the command"""
+    cmd_list = command.split(';')
+    for kind in ignored_arguments:
+        for position in VOLATILE_COMMAND_ARGUMENTS.get(kind, {}).get(cmd_list[0], []):
+            if position < len(cmd_list):
+                cmd_list[position] = ''
+    return ';'.join(cmd_list)
+
+
+def get_template_columns(command_template):
+    columns = []
+    for _, column, _, _ in Formatter().parse(command_template):
+        if column and column not in columns:
+            columns.append(column)
+    return columns
+
+
+def expand_command_template(command_template, rows):
+    columns = get_template_columns(command_template)
+    commands = []
+    for row in rows:
+        for column in columns:
+            if column not in row:
+                raise ValueError('Cannot expand {0}, column {1} is missing from the selection'.format(command_template, column))
+            if '\n' in u'{0}'.format(row[column]):
+                raise ValueError('Refusing to expand {0}, column {1} contains a newline'.format(command_template, column))
+        commands.append(command_template.format(**row))
+    return commands
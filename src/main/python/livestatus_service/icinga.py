@@ -23,9 +23,18 @@ THE SOFTWARE.
 '''
 
 from __future__ import absolute_import
+import errno
 import logging
+import os
+import select
+import threading
 import time
+try:  # pragma: no cover
+    import Queue as queue
+except ImportError:  # pragma: no cover
+    import queue
 
+from livestatus_service import tracing
 '''
     Wraps the icinga named pipe to expose it to python code. It allows writing
     commands to the file only - queries are not supported.
@@ -34,19 +43,225 @@ import time
 LOGGER = logging.getLogger('livestatus.icinga')
 
 
-def perform_command(command, command_file_path, key=None):
+@tracing.traced('icinga.command')
+def perform_command(command, command_file_path, key=None, auth=None):
     icinga_command_file = IcingaCommandFile(command_file_path)
     icinga_command_file.send_command(command)
     return 'OK'
 
 
+@tracing.traced('icinga.command')
+def perform_commands(commands, command_file_path, key=None, auth=None):
+    icinga_command_file = IcingaCommandFile(command_file_path)
+    icinga_command_file.send_commands(commands)
+    return 'OK'
+
+
+@tracing.traced('icinga.command')
+def perform_queued_commands(commands, command_file_path, queue_size, timeout):
+    pipe_writer = get_command_pipe_writer(command_file_path, queue_size, timeout)
+    pipe_writer.send_commands(commands)
+    return 'OK'
+
+
+_PIPE_WRITERS = {}
+_PIPE_WRITERS_LOCK = threading.Lock()
+
+
+def get_command_pipe_writer(command_file_path, queue_size, timeout):
+    with _PIPE_WRITERS_LOCK:
+        if command_file_path not in _PIPE_WRITERS:
+            _PIPE_WRITERS[command_file_path] = IcingaCommandPipeWriter(command_file_path, queue_size, timeout)
+        return _PIPE_WRITERS[command_file_path]
+
+
+class IcingaCommandPipeUnavailableException(RuntimeError):
+    pass
+
+
+class _PendingWrite(object):
+
+    def __init__(self, data, deadline):
+        self.data = data
+        self.deadline = deadline
+        self.error = None
+        self.done = threading.Event()
+
+
+class IcingaCommandPipeWriter(object):
+    """
+    Keeps the command pipe open in non-blocking mode and writes queued commands from a
+    background thread, so a busy icinga never blocks the request threads. Commands are split
+    into chunks and queued chunks are coalesced into writes of at most PIPE_BUF bytes, which
+    the kernel keeps atomic.
+    """
+    PIPE_BUF = getattr(select, 'PIPE_BUF', 512)
+    REOPEN_INTERVAL = 0.1
+
+    def __init__(self, command_file_path, queue_size, timeout):
+        self.command_file_path = command_file_path
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._carried_over = None
+        self._fd = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def send_commands(self, commands):
+        deadline = time.time() + self.timeout
+        pending_writes = [_PendingWrite(data, deadline) for data in self._split_into_atomic_writes(commands)]
+        self._start_if_necessary()
+        for pending_write in pending_writes:
+            try:
+                self._queue.put(pending_write, timeout=max(0, deadline - time.time()))
+            except queue.Full:
+                raise IcingaCommandPipeUnavailableException(
+                    'The queue for icinga command pipe {0} is full'.format(self.command_file_path))
+        for pending_write in pending_writes:
+            pending_write.done.wait(max(0, deadline - time.time()))
+            if not pending_write.done.is_set():
+                raise IcingaCommandPipeUnavailableException(
+                    'Timed out after {0}s, icinga is not reading command pipe {1}'.format(self.timeout, self.command_file_path))
+            if pending_write.error:
+                raise pending_write.error
+
+    def _split_into_atomic_writes(self, commands):
+        """Splits the commands at command boundaries into chunks of at most PIPE_BUF bytes"""
+        timestamp = str(int(time.time()))
+        chunks = []
+        chunk = b''
+        for command in commands:
+            line = u'[{0}] {1}\n'.format(timestamp, command).encode('utf-8')
+            if len(line) > self.PIPE_BUF:
+                raise ValueError('Command {0} is longer than {1} bytes, it cannot be written atomically.'.format(
+                    command[:50], self.PIPE_BUF))
+            if len(chunk) + len(line) > self.PIPE_BUF:
+                chunks.append(chunk)
+                chunk = b''
+            chunk += line
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _start_if_necessary(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._drain_queue, name='icinga-command-pipe-writer')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _drain_queue(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._write(b''.join(pending_write.data for pending_write in batch),
+                            min(pending_write.deadline for pending_write in batch))
+            except BaseException as exception:
+                LOGGER.error('Could not write %s commands to %s: %s', len(batch), self.command_file_path, exception)
+                for pending_write in batch:
+                    pending_write.error = exception
+            for pending_write in batch:
+                pending_write.done.set()
+
+    def _next_batch(self):
+        batch = []
+        batch_size = 0
+        while True:
+            if self._carried_over is not None:
+                pending_write, self._carried_over = self._carried_over, None
+            elif not batch:
+                pending_write = self._queue.get()
+            else:
+                try:
+                    pending_write = self._queue.get_nowait()
+                except queue.Empty:
+                    return batch
+            if pending_write.deadline < time.time():
+                # the submitter has given up already, writing it now would report a failed command as executed
+                pending_write.error = IcingaCommandPipeUnavailableException('Command expired in the queue')
+                pending_write.done.set()
+                continue
+            if batch and batch_size + len(pending_write.data) > self.PIPE_BUF:
+                self._carried_over = pending_write
+                return batch
+            batch.append(pending_write)
+            batch_size += len(pending_write.data)
+
+    def _write(self, data, deadline):
+        """
+        Writes of at most PIPE_BUF bytes are atomic, they either succeed completely or fail
+        without writing anything, so the data is written again as a whole after EAGAIN or EPIPE.
+        """
+        while True:
+            fd = self._open(deadline)
+            try:
+                written = os.write(fd, data)
+                if written != len(data):
+                    self._close()
+                    raise IcingaCommandPipeUnavailableException(
+                        'Only {0} of {1} bytes were written to icinga command pipe {2}'.format(
+                            written, len(data), self.command_file_path))
+                return
+            except OSError as error:
+                if error.errno == errno.EAGAIN:
+                    self._wait_until_writable(fd, deadline)
+                elif error.errno == errno.EPIPE:
+                    LOGGER.warn('Icinga closed command pipe %s, reopening', self.command_file_path)
+                    self._close()
+                else:
+                    self._close()
+                    raise
+
+    def _open(self, deadline):
+        while self._fd is None:
+            try:
+                self._fd = os.open(self.command_file_path, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as error:
+                if error.errno not in (errno.ENXIO, errno.ENOENT):
+                    raise
+                # ENXIO: nobody has the pipe open for reading, e.g. while icinga reloads
+                if time.time() + self.REOPEN_INTERVAL > deadline:
+                    raise IcingaCommandPipeUnavailableException(
+                        'Icinga is not reading command pipe {0}'.format(self.command_file_path))
+                time.sleep(self.REOPEN_INTERVAL)
+        return self._fd
+
+    def _wait_until_writable(self, fd, deadline):
+        remaining = deadline - time.time()
+        if remaining <= 0 or not select.select([], [fd], [], remaining)[1]:
+            raise IcingaCommandPipeUnavailableException(
+                'Icinga command pipe {0} is full, icinga is not reading it'.format(self.command_file_path))
+
+    def _close(self):
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except OSError:  # pragma: no cover
+                pass
+            self._fd = None
+
+
 class IcingaCommandFile(object):
 
     def __init__(self, command_file_path):
         self.command_file_path = command_file_path
 
+    def _open(self):
+        try:
+            return open(self.command_file_path, 'w')
+        except (IOError, OSError) as error:
+            raise IcingaCommandPipeUnavailableException(
+                'Could not open icinga command file {0}: {1}'.format(self.command_file_path, error))
+
     def send_command(self, command):
-        with open(self.command_file_path, 'w') as command_file:
+        with self._open() as command_file:
             timestamp = str(int(time.time()))
             command_with_timestamp = u'[{0}] {1}\n'.format(timestamp, command)
             command_file.write(command_with_timestamp.encode("utf-8"))
+
+    def send_commands(self, commands):
+        with self._open() as command_file:
+            timestamp = str(int(time.time()))
+            commands_with_timestamp = u''.join(u'[{0}] {1}\n'.format(timestamp, command)
+                                               for command in commands)
+            command_file.write(commands_with_timestamp.encode("utf-8"))
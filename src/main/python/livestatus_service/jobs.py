@@ -0,0 +1,174 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from __future__ import absolute_import
+from collections import deque
+import logging
+import threading
+import time
+import uuid
+try:  # pragma: no cover
+    import Queue as queue
+except ImportError:  # pragma: no cover
+    import queue
+
+'''
+    Runs commands asynchronously. Submitted commands are queued as jobs and executed
+    in batches by a background thread, their status can be polled by job id.
+'''
+
+LOGGER = logging.getLogger('livestatus.jobs')
+
+
+class CommandQueueFullException(RuntimeError):
+    pass
+
+
+class CommandJob(object):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, command, auth=None, handler=None):
+        self.id = uuid.uuid4().hex
+        self.command = command
+        self.auth = auth
+        self.handler = handler
+        self.status = CommandJob.QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+
+    def succeed(self, result):
+        self.result = result
+        self.status = CommandJob.DONE
+        self.finished_at = time.time()
+
+    def fail(self, error):
+        self.error = str(error)
+        self.status = CommandJob.FAILED
+        self.finished_at = time.time()
+
+    def as_dict(self):
+        return {'id': self.id,
+                'command': self.command,
+                'status': self.status,
+                'result': self.result,
+                'error': self.error,
+                'submitted_at': self.submitted_at,
+                'finished_at': self.finished_at}
+
+
+class CommandJobExecutor(object):
+    """
+    Executes queued jobs on a background thread. Up to batch_size jobs are taken from the
+    queue at once and handed to execute_batch, which has to finish every job it is given.
+    """
+
+    def __init__(self, execute_batch, queue_size, batch_size, retained_jobs):
+        self.execute_batch = execute_batch
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._jobs = {}
+        self._job_ids = deque()
+        self._retained_jobs = retained_jobs
+        self._jobs_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def submit(self, command, auth=None, handler=None):
+        job = CommandJob(command, auth=auth, handler=handler)
+        self._start_if_necessary()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise CommandQueueFullException(
+                'The command queue is full ({0} jobs), retry later'.format(self.queue_size))
+        self._remember(job)
+        return job
+
+    def get(self, job_id):
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def _remember(self, job):
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            self._job_ids.append(job.id)
+            while len(self._job_ids) > self._retained_jobs:
+                del self._jobs[self._job_ids.popleft()]
+
+    def _start_if_necessary(self):
+        with self._jobs_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='command-job-executor')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._execute_next_batch()
+
+    def _execute_next_batch(self):
+        batch = [self._queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for job in batch:
+            job.status = CommandJob.RUNNING
+        try:
+            self.execute_batch(batch)
+        except BaseException as exception:
+            LOGGER.error('Executing %s command jobs failed: %s', len(batch), exception)
+            for job in batch:
+                if job.status == CommandJob.RUNNING:
+                    job.fail(exception)
+
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_command_job_executor(execute_batch, queue_size, batch_size, retained_jobs):
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = CommandJobExecutor(execute_batch, queue_size, batch_size, retained_jobs)
+        return _EXECUTOR
+
+
+def find_command_job(job_id):
+    with _EXECUTOR_LOCK:
+        executor = _EXECUTOR
+    if executor is None:
+        return None
+    return executor.get(job_id)
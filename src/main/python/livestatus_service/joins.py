@@ -0,0 +1,123 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from __future__ import absolute_import
+import logging
+import simplejson as json
+import threading
+
+from livestatus_service.livestatus import fetch_answer, format_answer
+from livestatus_service.snapshot import SNAPSHOTS
+
+'''
+    Joins hosts with their services inside the service. Both tables are queried concurrently,
+    the services are hashed by their host and the joined hosts are streamed one per line.
+'''
+
+LOGGER = logging.getLogger('livestatus.joins')
+
+HOST_KEY = 'name'
+SERVICE_KEY = 'host_name'
+NESTED_SERVICES = 'services'
+FILTER_HEADERS = ('Filter:', 'And:', 'Or:', 'Negate:')
+
+
+def join_hosts_with_services(host_columns, service_columns, host_filter, service_filter, socket_path, key=None, auth=None):
+    """Returns the hosts formatted like a query answer, each with the list of its services"""
+    if NESTED_SERVICES in host_columns:
+        raise ValueError('The host column {0} is replaced by the joined services.'.format(NESTED_SERVICES))
+    host_query = build_query('hosts', host_columns, HOST_KEY, host_filter)
+    service_query = build_query('services', service_columns, SERVICE_KEY, service_filter)
+    host_answer, service_answer = fetch_concurrently([host_query, service_query], socket_path, auth)
+
+    services_by_host = {}
+    for service in format_answer(service_query, service_answer, None):
+        host_name = service[SERVICE_KEY] if SERVICE_KEY in service_columns else service.pop(SERVICE_KEY)
+        services_by_host.setdefault(host_name, []).append(service)
+
+    hosts = format_answer(host_query, host_answer, key)
+    for host in (hosts.values() if key is not None else hosts):
+        host_name = host[HOST_KEY] if HOST_KEY in host_columns else host.pop(HOST_KEY)
+        host[NESTED_SERVICES] = services_by_host.get(host_name, [])
+    LOGGER.debug('Joined %s hosts with the services of %s hosts', len(hosts), len(services_by_host))
+    return hosts
+
+
+def build_query(table, columns, join_column, filter_lines=''):
+    """The join column is always fetched, it is removed again from the rows if it was not asked for"""
+    for filter_line in filter_lines.splitlines():
+        if not filter_line.startswith(FILTER_HEADERS):
+            raise ValueError('Only {0} lines may filter the {1}, not {2}.'.format(', '.join(FILTER_HEADERS), table, filter_line))
+    if join_column not in columns:
+        columns = [join_column] + list(columns)
+    query = 'GET {0}\nColumns: {1}'.format(table, ' '.join(columns))
+    if filter_lines:
+        query += '\n' + filter_lines
+    return query
+
+
+def fetch_concurrently(queries, socket_path, auth=None):
+    """Every query but the first is sent from a thread of its own, so livestatus answers them in parallel"""
+    answers = [None] * len(queries)
+    failures = []
+
+    def fetch(index):
+        try:
+            answers[index] = fetch_raw_answer(queries[index], socket_path, auth)
+        except Exception as exception:
+            failures.append(exception)
+
+    threads = [threading.Thread(target=fetch, args=(index,), name='join-query') for index in range(1, len(queries))]
+    for thread in threads:
+        thread.start()
+    fetch(0)
+    for thread in threads:
+        thread.join()
+    if failures:
+        raise failures[0]
+    return answers
+
+
+def fetch_raw_answer(query, socket_path, auth=None):
+    """Answers from the table snapshot if possible, from livestatus otherwise"""
+    snapshot_answer = SNAPSHOTS.answer(query, auth)
+    if snapshot_answer is not None:
+        return snapshot_answer
+    return fetch_answer(query, socket_path, auth)
+
+
+def stream_json(hosts):
+    """Yields the joined hosts as JSON one host per line, the response does not need to be built in memory"""
+    if isinstance(hosts, dict):
+        opening, closing = '{', '}'
+        entries = ('{0}: {1}'.format(json.dumps(key), json.dumps(host)) for key, host in hosts.items())
+    else:
+        opening, closing = '[', ']'
+        entries = (json.dumps(host) for host in hosts)
+    yield opening
+    separator = '\n'
+    for entry in entries:
+        yield separator + entry
+        separator = ',\n'
+    yield '\n{0}\n'.format(closing)
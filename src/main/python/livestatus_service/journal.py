@@ -0,0 +1,276 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from __future__ import absolute_import
+import fcntl
+import logging
+import os
+import threading
+import time
+
+import simplejson as json
+
+'''
+    Append-only on-disk journal for commands which could not be delivered because
+    icinga was unreachable. Journaled commands are replayed in order once icinga is back.
+'''
+
+LOGGER = logging.getLogger('livestatus.journal')
+
+
+class CommandJournal(object):
+    """
+    Commands are appended as JSON lines. The checkpoint file holds the offset up to which
+    the journal has been replayed, so several service processes can share one journal
+    as long as every access happens under the journal lock (an flock on the lock file).
+    Concurrent appends of one process share a single fsync.
+    A compacted journal starts with a header line holding its generation. The checkpoint
+    holds the generation along with the offset, so an offset of a previous generation is
+    never applied to the compacted journal, even when the service dies while compacting.
+    """
+
+    def __init__(self, path, compact_size):
+        self.path = path
+        self.checkpoint_path = path + '.checkpoint'
+        self.lock_path = path + '.lock'
+        self.replay_lock_path = path + '.replay.lock'
+        self.compact_size = compact_size
+        self._thread_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._replay_thread_lock = threading.Lock()
+        self._replay_thread = None
+        self._fd = None
+        self._written = 0
+        self._synced = 0
+
+    def append(self, command, auth=None, handler=None):
+        entry = json.dumps({'command': command, 'auth': auth, 'handler': handler, 'accepted_at': time.time()})
+        with self._locked():
+            fd = self._open()
+            os.write(fd, (entry + '\n').encode('utf-8'))
+            self._written += 1
+            sequence = self._written
+        self._sync(fd, sequence)
+        LOGGER.info('Journaled command %s', command)
+
+    def has_pending_commands(self):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return False
+        _, offset = self._read_position()
+        return size > offset
+
+    def replay(self, submit):
+        """
+        Passes the pending entries to submit(entries) in order. submit returns how many entries
+        it has handled, the journal continues behind them the next time. The journal lock is
+        not held while submitting, so appends do not wait for icinga. Only one thread or process
+        replays at a time, the others return 0 right away.
+        """
+        replay_lock = _JournalLock(self._replay_lock, self.replay_lock_path)
+        if not replay_lock.acquire(blocking=False):
+            return 0
+        try:
+            with self._locked():
+                generation, offset = self._read_position()
+                entries, offsets = self._read_entries(offset)
+            handled = submit(entries) if entries else 0
+            with self._locked():
+                if handled:
+                    offset = offsets[handled - 1]
+                    self._write_checkpoint(generation, offset)
+                    LOGGER.info('Replayed %s journaled commands', handled)
+                if offset >= self.compact_size:
+                    self._compact(generation, offset)
+            return handled
+        finally:
+            replay_lock.release()
+
+    def start_replaying(self, submit, interval):
+        with self._replay_thread_lock:
+            if self._replay_thread is None:
+                self._replay_thread = threading.Thread(target=self._replay_periodically, args=(submit, interval),
+                                                       name='command-journal-replay')
+                self._replay_thread.daemon = True
+                self._replay_thread.start()
+
+    def _replay_periodically(self, submit, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                if self.has_pending_commands():
+                    self.replay(submit)
+            except BaseException as exception:
+                LOGGER.error('Replaying the command journal %s failed: %s', self.path, exception)
+
+    def _locked(self):
+        return _JournalLock(self._thread_lock, self.lock_path)
+
+    def _open(self):
+        try:
+            current_inode = os.stat(self.path).st_ino
+        except OSError:
+            current_inode = None
+        if self._fd is not None and os.fstat(self._fd).st_ino != current_inode:
+            # another process has compacted the journal and replaced the file
+            os.close(self._fd)
+            self._fd = None
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        return self._fd
+
+    def _sync(self, fd, sequence):
+        with self._sync_lock:
+            if self._synced >= sequence:
+                return
+            synced = self._written
+            try:
+                os.fsync(fd)
+            except OSError:
+                # the file was compacted meanwhile, compaction syncs what it has copied
+                pass
+            self._synced = synced
+
+    def _read_position(self):
+        """The generation of the journal and the offset up to which it has been replayed"""
+        generation, header_size = self._read_generation()
+        checkpoint_generation, offset = self._read_checkpoint()
+        if checkpoint_generation != generation:
+            # the journal has been compacted after the checkpoint was written
+            return generation, header_size
+        return generation, max(offset, header_size)
+
+    def _read_generation(self):
+        try:
+            with open(self.path, 'rb') as journal_file:
+                line = journal_file.readline()
+        except IOError:
+            return 0, 0
+        if not line.endswith(b'\n'):
+            return 0, 0
+        header = json.loads(line.decode('utf-8'))
+        if 'generation' not in header:
+            return 0, 0
+        return header['generation'], len(line)
+
+    def _read_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as checkpoint_file:
+                fields = checkpoint_file.read().split()
+        except IOError:
+            return 0, 0
+        if len(fields) == 1:
+            # written before journals had generations
+            return 0, int(fields[0])
+        if len(fields) == 2:
+            return int(fields[0]), int(fields[1])
+        return 0, 0
+
+    def _write_checkpoint(self, generation, offset):
+        _write_atomically(self.checkpoint_path, '{0} {1}'.format(generation, offset).encode('utf-8'))
+
+    def _read_entries(self, offset):
+        entries = []
+        offsets = []
+        try:
+            with open(self.path, 'rb') as journal_file:
+                journal_file.seek(offset)
+                for line in journal_file:
+                    if not line.endswith(b'\n'):
+                        break  # an append in progress
+                    offset += len(line)
+                    entries.append(json.loads(line.decode('utf-8')))
+                    offsets.append(offset)
+        except IOError:
+            pass
+        return entries, offsets
+
+    def _compact(self, generation, offset):
+        with open(self.path, 'rb') as journal_file:
+            journal_file.seek(offset)
+            pending = journal_file.read()
+        header = (json.dumps({'generation': generation + 1}) + '\n').encode('utf-8')
+        # replacing the journal alone invalidates the checkpoint, as it names the previous generation
+        _write_atomically(self.path, header + pending)
+        self._write_checkpoint(generation + 1, len(header))
+        LOGGER.info('Compacted command journal %s, %s bytes left', self.path, len(pending))
+
+
+class _JournalLock(object):
+
+    def __init__(self, thread_lock, lock_path):
+        self.thread_lock = thread_lock
+        self.lock_path = lock_path
+
+    def acquire(self, blocking=True):
+        if not self.thread_lock.acquire(blocking):
+            return False
+        try:
+            self.lock_file = open(self.lock_path, 'a')
+            try:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                self.lock_file.close()
+                if blocking:
+                    raise
+                self.thread_lock.release()
+                return False
+        except BaseException:
+            self.thread_lock.release()
+            raise
+        return True
+
+    def release(self):
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.lock_file.close()
+        self.thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.release()
+
+
+def _write_atomically(path, data):
+    temporary_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(temporary_path, 'wb') as temporary_file:
+        temporary_file.write(data)
+        temporary_file.flush()
+        os.fsync(temporary_file.fileno())
+    os.rename(temporary_path, path)
+
+
+_JOURNALS = {}
+_JOURNALS_LOCK = threading.Lock()
+
+
+def get_command_journal(path, compact_size):
+    with _JOURNALS_LOCK:
+        if path not in _JOURNALS:
+            _JOURNALS[path] = CommandJournal(path, compact_size)
+        return _JOURNALS[path]
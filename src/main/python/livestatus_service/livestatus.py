@@ -28,6 +28,12 @@ import logging
 import socket
 import time
 import os
+
+from livestatus_service.metrics import RECEIVED_BYTES, SENT_BYTES, ROWS, table_label
+from livestatus_service import server_timing
+from livestatus_service import tracing
+from livestatus_service.slow_queries import SLOW_QUERY_LOG
+from livestatus_service.perf_data import format_perf_data
 '''
     Wraps the livestatus UNIX socket to expose it to python code. Provides abstract
     access to the socket and formatting functions to deal with the livestatus
@@ -35,26 +41,39 @@ import os
 '''
 
 LOGGER = logging.getLogger('livestatus.livestatus')
+DEBUG_LOGGED_ROWS = 10
 
 
 class NoColumnsSpecifiedException(BaseException):
     pass
 
 
+class LivestatusSocketUnavailableException(RuntimeError):
+    pass
+
+
 class LivestatusSocket(object):
     BUFFER_SIZE = 8192
 
     def __init__(self, socket_path):
         self.socket_path = socket_path
         self.connected = False
+        self.received_bytes = 0
+        # long waiting queries (WaitTrigger) would distort the phase and byte metrics of the table
+        self.measured = True
         if not os.path.exists(socket_path):
-            raise RuntimeError(
+            raise LivestatusSocketUnavailableException(
                 ('Could not connect to livestatus socket at {0}, ' +
                  'perhaps icinga is not running or mk-livestatus is not installed?').format(socket_path))
 
     def _connect(self):
         self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        self._socket.connect(self.socket_path)
+        try:
+            self._socket.connect(self.socket_path)
+        except socket.error as error:
+            self._socket.close()
+            raise LivestatusSocketUnavailableException(
+                'Could not connect to livestatus socket at {0}: {1}'.format(self.socket_path, error))
         self.connected = True
 
     def connect_if_necessary(self):
@@ -69,50 +88,128 @@ class LivestatusSocket(object):
         self._socket.shutdown(socket.SHUT_WR)
         self._socket.close()
 
+    def send_commands(self, commands):
+        self.connect_if_necessary()
+        timestamp = str(int(time.time()))
+        # livestatus keeps the connection open after a COMMAND, so the whole
+        # batch can be written at once with the commands separated by blank lines
+        batch = "\n".join("COMMAND [{0}] {1}\n".format(timestamp, command)
+                          for command in commands)
+        self._socket.sendall(batch.encode('utf-8'))
+        self._socket.shutdown(socket.SHUT_WR)
+        self._socket.close()
+
     def send_query_and_receive_json_answer(self, query, auth=None):
+        table = table_label(get_table(query))
+        start = time.time()
         self.connect_if_necessary()
+        connected = time.time()
+        self._record_phase('connect', connected - start, table)
 
         if auth:
-            self._socket.send("{0}\nOutputFormat: json\nAuthUser: {1}\n"
-                              .format(query, auth).encode('utf-8'))
+            request = "{0}\nOutputFormat: json\nAuthUser: {1}\n".format(query, auth).encode('utf-8')
         else:
-            self._socket.send("{0}\nOutputFormat: json\n"
-                              .format(query).encode('utf-8'))
+            request = "{0}\nOutputFormat: json\n".format(query).encode('utf-8')
+        self._socket.send(request)
 
         self._socket.shutdown(socket.SHUT_WR)
-        answer = self.receive_json_answer()
+        sent = time.time()
+        self._record_phase('send', sent - connected, table)
+        if self.measured:
+            SENT_BYTES.inc(len(request), table=table)
+        answer = self.receive_json_answer(table)
         self._socket.close()
         return answer
 
-    def receive_json_answer(self):
+    def receive_json_answer(self, table=''):
+        """The phases are disjoint: first_byte is the time livestatus needs to answer, receive the transfer"""
+        start = time.time()
         raw_data = []
         while True:
             data = self._socket.recv(self.BUFFER_SIZE)
             if not data:
                 break
+            if not raw_data:
+                first_byte = time.time()
+                self._record_phase('first_byte', first_byte - start, table)
+                start = first_byte
             raw_data.append(data)
+        received = time.time()
+        self._record_phase('receive', received - start, table)
+        self.received_bytes = sum(len(chunk) for chunk in raw_data)
+        if self.measured:
+            RECEIVED_BYTES.inc(self.received_bytes, table=table)
+            server_timing.count('bytes', self.received_bytes)
         decoded_data = [chunk.decode('utf-8') for chunk in raw_data]
         answer = ''.join(decoded_data)
         answer = json.loads(answer)
+        self._record_phase('parse', time.time() - received, table)
         return answer
 
+    def _record_phase(self, phase, seconds, table):
+        if self.measured:
+            server_timing.record_phase(phase, seconds, table)
+
+
+def perform_query(query, socket_path, key=None, auth=None, perf_data=None):
+    table = table_label(get_table(query))
+    with tracing.span('livestatus.query', table=table):
+        answer = fetch_answer(query, socket_path, auth)
+        return serialize_answer(query, answer, key, perf_data)
 
-def perform_query(query, socket_path, key=None, auth=None):
+
+def serialize_answer(query, answer, key=None, perf_data=None):
+    """Formats and serializes a raw answer, which may come from livestatus or a table snapshot"""
+    table = table_label(get_table(query))
+    start = time.time()
+    formatted_answer = format_answer(query, answer, key)
+    if perf_data is not None:
+        formatted_answer = format_perf_data(formatted_answer, perf_data)
+    formatted = time.time()
+    server_timing.record_phase('format', formatted - start, table)
+
+    serialized_answer = json.dumps(formatted_answer, sort_keys=False, indent=4)
+    server_timing.record_phase('serialize', time.time() - formatted, table)
+    return serialized_answer
+
+
+def fetch_answer(query, socket_path, auth=None):
+    """Returns the unformatted json answer of livestatus, the first row holds the column names if no columns were given"""
+    start = time.time()
     livestatus_socket = LivestatusSocket(socket_path)
     LOGGER.debug("Send query: %s", query)
     answer = livestatus_socket.send_query_and_receive_json_answer(query, auth=auth)
-    LOGGER.debug("Answer from livestatus: %s", answer)
-    formatted_answer = format_answer(query, answer, key)
+    if LOGGER.isEnabledFor(logging.DEBUG):
+        LOGGER.debug("Answer from livestatus (%s rows, first %s shown): %s",
+                     len(answer), DEBUG_LOGGED_ROWS, answer[:DEBUG_LOGGED_ROWS])
+    SLOW_QUERY_LOG.record(query, time.time() - start, len(answer), livestatus_socket.received_bytes)
+    table = table_label(get_table(query))
+    ROWS.inc(len(answer), table=table)
+    server_timing.count('rows', len(answer))
+    return answer
 
-    return json.dumps(formatted_answer, sort_keys=False, indent=4)
 
+def get_table(query):
+    query_words = query.split(None, 2)
+    if len(query_words) > 1 and query_words[0] == 'GET':
+        return query_words[1]
+    return ''
 
+
+@tracing.traced('livestatus.command')
 def perform_command(command, socket_path, key=None, auth=None):
     livestatus_socket = LivestatusSocket(socket_path)
     livestatus_socket.send_command(command)
     return "OK"
 
 
+@tracing.traced('livestatus.command')
+def perform_commands(commands, socket_path, key=None, auth=None):
+    livestatus_socket = LivestatusSocket(socket_path)
+    livestatus_socket.send_commands(commands)
+    return "OK"
+
+
 def format_answer(query, answer, key_to_use):
     """
     Answers come in two different types :
@@ -0,0 +1,295 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from __future__ import absolute_import
+import glob
+import mmap
+import os
+import struct
+import threading
+
+'''
+    Counters and histograms exposed in the Prometheus text format. Values are kept in
+    process memory, or in one memory-mapped file per process when a metrics directory is
+    configured, so that every mod_wsgi process can expose the values of all of them.
+'''
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+INFINITY = float('inf')
+
+
+class _LocalValues(object):
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def increment(self, sample_key, amount):
+        with self._lock:
+            self._values[sample_key] = self._values.get(sample_key, 0.0) + amount
+
+    def collect(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class _MmapValues(object):
+    """
+    Every process appends its samples to its own file as records of
+    (key length, key padded to 8 bytes, double value), the first 8 bytes hold the used size.
+    Readers sum the values of all files in the directory.
+    """
+    INITIAL_SIZE = 64 * 1024
+    FILE_PATTERN = 'metrics_{0}.db'
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def increment(self, sample_key, amount):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+            offset = self._offsets.get(sample_key)
+            if offset is None:
+                offset = self._add(sample_key)
+            value = struct.unpack_from('d', self._mmap, offset)[0]
+            struct.pack_into('d', self._mmap, offset, value + amount)
+
+    def collect(self):
+        values = {}
+        for path in glob.glob(os.path.join(self.directory, self.FILE_PATTERN.format('*'))):
+            for sample_key, value in _read_samples(path):
+                values[sample_key] = values.get(sample_key, 0.0) + value
+        return values
+
+    def _open(self):
+        self._pid = os.getpid()
+        path = os.path.join(self.directory, self.FILE_PATTERN.format(self._pid))
+        self._file = open(path, 'a+b')
+        if os.path.getsize(path) == 0:
+            self._file.write(b'\0' * self.INITIAL_SIZE)
+            self._file.flush()
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+        self._used = struct.unpack_from('i', self._mmap, 0)[0] or 8
+        self._offsets = {}
+        for sample_key, _, value_offset in _iterate_records(self._mmap, self._used):
+            self._offsets[sample_key] = value_offset
+
+    def _add(self, sample_key):
+        encoded_key = sample_key.encode('utf-8')
+        padded_length = len(encoded_key) + (8 - (len(encoded_key) + 4) % 8)
+        record_size = 4 + padded_length + 8
+        while self._used + record_size > len(self._mmap):
+            self._grow()
+        struct.pack_into('i{0}s'.format(padded_length), self._mmap, self._used, len(encoded_key), encoded_key)
+        value_offset = self._used + 4 + padded_length
+        struct.pack_into('d', self._mmap, value_offset, 0.0)
+        self._used += record_size
+        struct.pack_into('i', self._mmap, 0, self._used)
+        self._offsets[sample_key] = value_offset
+        return value_offset
+
+    def _grow(self):
+        size = len(self._mmap)
+        self._mmap.close()
+        self._file.truncate(size * 2)
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+
+
+def _iterate_records(data, used):
+    position = 8
+    while position < used:
+        key_length = struct.unpack_from('i', data, position)[0]
+        padded_length = key_length + (8 - (key_length + 4) % 8)
+        sample_key = bytes(data[position + 4:position + 4 + key_length]).decode('utf-8')
+        value_offset = position + 4 + padded_length
+        yield sample_key, struct.unpack_from('d', data, value_offset)[0], value_offset
+        position = value_offset + 8
+
+
+def _read_samples(path):
+    with open(path, 'rb') as metrics_file:
+        data = metrics_file.read()
+    if len(data) < 8:
+        return []
+    return [(sample_key, value) for sample_key, value, _ in _iterate_records(data, struct.unpack_from('i', data, 0)[0])]
+
+
+class MetricsRegistry(object):
+
+    def __init__(self):
+        self.values = _LocalValues()
+        self._metrics = []
+
+    def use_directory(self, directory):
+        self.values = _MmapValues(directory) if directory else _LocalValues()
+
+    def counter(self, name, documentation, label_names=()):
+        return self._register(Counter(self, name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation, label_names, buckets))
+
+    def exposition(self):
+        values = self.values.collect()
+        lines = []
+        for metric in self._metrics:
+            lines.append('# HELP {0} {1}'.format(metric.name, metric.documentation))
+            lines.append('# TYPE {0} {1}'.format(metric.name, metric.TYPE))
+            lines.extend(metric.samples(values))
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+class _Metric(object):
+
+    def __init__(self, registry, name, documentation, label_names):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._sample_keys = {}
+
+    def _sample_key(self, suffix, labels, extra_label=None):
+        cache_key = (suffix, tuple(labels.get(label_name, '') for label_name in self.label_names), extra_label)
+        sample_key = self._sample_keys.get(cache_key)
+        if sample_key is None:
+            label_pairs = list(zip(self.label_names, cache_key[1]))
+            if extra_label:
+                label_pairs.append(extra_label)
+            sample_key = '{0}{1}{{{2}}}'.format(self.name, suffix, ','.join(
+                '{0}="{1}"'.format(name, _escape(value)) for name, value in label_pairs))
+            self._sample_keys[cache_key] = sample_key
+        return sample_key
+
+
+class Counter(_Metric):
+    TYPE = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.registry.values.increment(self._sample_key('_total', labels), amount)
+
+    def samples(self, values):
+        prefix = self.name + '_total{'
+        return ['{0} {1}'.format(sample_key, _format_value(value))
+                for sample_key, value in sorted(values.items()) if sample_key.startswith(prefix)]
+
+
+class Histogram(_Metric):
+    """Buckets are stored non-cumulative, so one observation only touches one bucket and the sum"""
+    TYPE = 'histogram'
+
+    def __init__(self, registry, name, documentation, label_names, buckets):
+        super(Histogram, self).__init__(registry, name, documentation, label_names)
+        self.buckets = tuple(buckets) + (INFINITY,)
+
+    def observe(self, value, **labels):
+        for upper_bound in self.buckets:
+            if value <= upper_bound:
+                break
+        values = self.registry.values
+        values.increment(self._sample_key('_bucket', labels, ('le', _format_value(upper_bound))), 1)
+        values.increment(self._sample_key('_sum', labels), value)
+
+    def samples(self, values):
+        bucket_prefix = self.name + '_bucket{'
+        counts = {}
+        for sample_key, value in values.items():
+            if sample_key.startswith(bucket_prefix):
+                label_part, upper_bound = sample_key[len(bucket_prefix):-1].rsplit('le="', 1)
+                counts.setdefault(label_part.rstrip(','), {})[upper_bound[:-1]] = value
+        lines = []
+        for label_part in sorted(counts):
+            cumulative_count = 0
+            separator = ',' if label_part else ''
+            for upper_bound in self.buckets:
+                cumulative_count += counts[label_part].get(_format_value(upper_bound), 0)
+                lines.append('{0}_bucket{{{1}{2}le="{3}"}} {4}'.format(
+                    self.name, label_part, separator, _format_value(upper_bound), _format_value(cumulative_count)))
+            lines.append('{0}_count{{{1}}} {2}'.format(self.name, label_part, _format_value(cumulative_count)))
+            lines.append('{0}_sum{{{1}}} {2}'.format(
+                self.name, label_part, _format_value(values.get('{0}_sum{{{1}}}'.format(self.name, label_part), 0))))
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == INFINITY:
+        return '+Inf'
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+LIVESTATUS_TABLES = frozenset(['hosts', 'services', 'hostgroups', 'servicegroups', 'contactgroups', 'contacts',
+                               'servicesbygroup', 'servicesbyhostgroup', 'hostsbygroup', 'commands', 'timeperiods',
+                               'downtimes', 'comments', 'log', 'status', 'columns', 'statehist'])
+OUTCOME_LABELS = {'OK': 'ok', 'QUEUED': 'queued', 'COALESCED': 'coalesced'}
+
+
+def table_label(table):
+    """Label values are kept forever, so values taken from requests are limited to a known set"""
+    if not table or table in LIVESTATUS_TABLES:
+        return table
+    return 'other'
+
+
+def handler_label(handler):
+    if handler is None or handler == 'livestatus':
+        return 'livestatus'
+    return 'icinga' if handler == 'icinga' else 'other'
+
+
+def outcome_label(result, dry_run=False):
+    if dry_run:
+        return 'dry_run'
+    return OUTCOME_LABELS.get(result, 'ok') if isinstance(result, str) else 'ok'
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'livestatus_service_request_seconds', 'Time spent handling HTTP requests.', ('endpoint', 'handler', 'outcome'))
+DISPATCH_SECONDS = REGISTRY.histogram(
+    'livestatus_service_dispatch_seconds', 'Time spent performing queries and commands.', ('operation', 'table', 'handler', 'outcome'))
+PHASE_SECONDS = REGISTRY.histogram(
+    'livestatus_service_phase_seconds', 'Time spent in the phases of a livestatus query.', ('phase', 'table'))
+RECEIVED_BYTES = REGISTRY.counter(
+    'livestatus_service_received_bytes', 'Bytes received from livestatus.', ('table',))
+SENT_BYTES = REGISTRY.counter(
+    'livestatus_service_sent_bytes', 'Bytes sent to livestatus.', ('table',))
+ROWS = REGISTRY.counter(
+    'livestatus_service_rows', 'Rows answered by livestatus.', ('table',))
+SHARED_CACHE_LOOKUPS = REGISTRY.counter(
+    'livestatus_service_shared_cache_lookups', 'Lookups in the shared cache by kind (query, auth) and outcome.', ('kind', 'outcome'))
+SNAPSHOT_QUERIES = REGISTRY.counter(
+    'livestatus_service_snapshot_queries', 'Queries for snapshot tables by outcome (hit, stale, unsupported).', ('table', 'outcome'))
@@ -0,0 +1,140 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from __future__ import absolute_import
+import logging
+import re
+import string
+import threading
+
+'''
+    Parses the Nagios performance data of the perf_data columns into label, value, unit, warn, crit, min
+    and max. The same strings come back with every query, so parsed strings are cached.
+'''
+
+LOGGER = logging.getLogger('livestatus.perf_data')
+
+PERF_DATA_COLUMN = 'perf_data'
+FIELDS = ('label', 'value', 'unit', 'warn', 'crit', 'min', 'max')
+OUTPUTS = ('structured', 'columnar')
+PARSED_CACHE_SIZE = 65536
+
+PERF_DATA_ITEM = re.compile(r"('(?:[^']|'')+'|[^\s'=]+)=(\S+)")
+UNIT_CHARACTERS = string.ascii_letters + '%/'
+
+_PARSED = {}
+_PARSED_LOCK = threading.Lock()
+
+
+def parse_perf_data(perf_data):
+    """Returns a tuple of (label, value, unit, warn, crit, min, max) per metric, items which are no metric are skipped"""
+    return parse_perf_data_batch([perf_data])[0]
+
+
+def parse_perf_data_batch(perf_data_strings):
+    """Parses the strings which are not cached yet in one go and returns the metrics of every string"""
+    results = [_PARSED.get(perf_data) for perf_data in perf_data_strings]
+    unparsed = {}
+    for index, perf_data in enumerate(perf_data_strings):
+        if results[index] is None:
+            metrics = unparsed.get(perf_data)
+            if metrics is None:
+                metrics = unparsed[perf_data] = _parse(perf_data)
+            results[index] = metrics
+    if unparsed:
+        with _PARSED_LOCK:
+            if len(_PARSED) + len(unparsed) > PARSED_CACHE_SIZE:
+                LOGGER.debug('Clearing %s parsed perf_data strings', len(_PARSED))
+                _PARSED.clear()
+            _PARSED.update(unparsed)
+    return results
+
+
+def _parse(perf_data):
+    metrics = [_metric(label, fields) for label, fields in PERF_DATA_ITEM.findall(perf_data or '')]
+    return tuple(metric for metric in metrics if metric is not None)
+
+
+def _metric(label, fields):
+    """value[unit];warn;crit;min;max, splitting is faster than matching every field with the expression"""
+    fields = fields.split(';') + ['', '', '', '']
+    if fields[0] == 'U':
+        value, unit = None, ''
+    else:
+        number = fields[0].rstrip(UNIT_CHARACTERS)
+        value = _number(number)
+        if not isinstance(value, float):
+            return None
+        unit = fields[0][len(number):]
+    if label.startswith("'"):
+        label = label[1:-1].replace("''", "'")
+    return (label, value, unit, _number(fields[1]), _number(fields[2]), _number(fields[3]), _number(fields[4]))
+
+
+def _number(text):
+    """Thresholds may be ranges like 10:20 or @~:5, those are kept as they are"""
+    if not text or text == 'U':
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        return float(text.replace(',', '.'))
+    except ValueError:
+        return text
+
+
+def format_perf_data(formatted_answer, output):
+    """
+    structured replaces the perf_data of every row by a list of its metrics.
+    columnar returns one list per column with one entry per metric, the other columns of the row are repeated.
+    """
+    rows = formatted_answer.values() if isinstance(formatted_answer, dict) else formatted_answer
+    for row in rows:
+        if PERF_DATA_COLUMN not in row:
+            raise ValueError('The query has no {0} column to parse.'.format(PERF_DATA_COLUMN))
+        break
+    if output not in OUTPUTS:
+        raise ValueError('Unknown perf_data output {0}, use one of {1}.'.format(output, ', '.join(OUTPUTS)))
+    rows = list(rows)
+    metrics_of_rows = parse_perf_data_batch([row[PERF_DATA_COLUMN] for row in rows])
+    if output == 'columnar':
+        return _columnar(rows, metrics_of_rows)
+    for row, metrics in zip(rows, metrics_of_rows):
+        row[PERF_DATA_COLUMN] = [dict(zip(FIELDS, metric)) for metric in metrics]
+    return formatted_answer
+
+
+def _columnar(rows, metrics_of_rows):
+    columns = dict((field, []) for field in FIELDS)
+    for row, metrics in zip(rows, metrics_of_rows):
+        if not metrics:
+            continue
+        for name, value in row.items():
+            if name != PERF_DATA_COLUMN:
+                columns.setdefault(name, []).extend([value] * len(metrics))
+        for field, values in zip(FIELDS, zip(*metrics)):
+            columns[field].extend(values)
+    return columns
@@ -0,0 +1,125 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from __future__ import absolute_import
+import cProfile
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+
+'''
+    Runs selected requests under cProfile and keeps the newest pstats files in a
+    directory, from where admins can download them.
+'''
+
+LOGGER = logging.getLogger('livestatus.profiling')
+
+PROFILE_NAME_PATTERN = re.compile(r'^[\w.-]+\.pstats$')
+
+
+class RequestProfiler(object):
+    """
+    Profiles the requests of admins asking for it and, if sample_rate is N > 0, one in N
+    of all requests. Profiling is disabled as long as no directory is configured.
+    """
+
+    def __init__(self, directory=None, sample_rate=0, retained_profiles=100):
+        self.configure(directory, sample_rate, retained_profiles)
+        self._requests = itertools.count(1)
+        self._profiles = itertools.count(1)
+        self._lock = threading.Lock()
+        self._profiling = threading.Lock()
+
+    def configure(self, directory, sample_rate, retained_profiles):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.retained_profiles = retained_profiles
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def should_profile(self, requested_by_admin=False):
+        if not self.enabled:
+            return False
+        if requested_by_admin:
+            return True
+        if self.sample_rate <= 0:
+            return False
+        with self._lock:
+            return next(self._requests) % self.sample_rate == 0
+
+    def run(self, name, function, *args, **kwargs):
+        """
+        Calls function under the profiler, returns its result and the name of the written profile.
+        Only one request is profiled at a time (python 3.12+ refuses concurrent profilers),
+        others are run without profiling and no profile name is returned.
+        """
+        if not self._profiling.acquire(False):
+            return function(*args, **kwargs), None
+        try:
+            profiler = cProfile.Profile()
+            try:
+                result = profiler.runcall(function, *args, **kwargs)
+            finally:
+                profile_name = self._save(profiler, name)
+            return result, profile_name
+        finally:
+            self._profiling.release()
+
+    def list_profiles(self):
+        if not self.enabled:
+            return []
+        return sorted((file_name for file_name in os.listdir(self.directory) if PROFILE_NAME_PATTERN.match(file_name)),
+                      reverse=True)
+
+    def get_profile_path(self, profile_name):
+        if not PROFILE_NAME_PATTERN.match(profile_name) or profile_name not in self.list_profiles():
+            return None
+        return os.path.join(self.directory, profile_name)
+
+    def _save(self, profiler, name):
+        with self._lock:
+            sequence = next(self._profiles)
+        safe_name = re.sub(r'[^\w]', '_', name)
+        profile_name = '{0}-{1}-{2:06d}-{3}.pstats'.format(time.strftime('%Y%m%dT%H%M%S'), os.getpid(), sequence, safe_name)
+        profiler.dump_stats(os.path.join(self.directory, profile_name))
+        LOGGER.info('Wrote profile %s', profile_name)
+        self._rotate()
+        return profile_name
+
+    def _rotate(self):
+        for outdated_profile in self.list_profiles()[self.retained_profiles:]:
+            try:
+                os.remove(os.path.join(self.directory, outdated_profile))
+            except OSError:
+                pass
+
+
+REQUEST_PROFILER = RequestProfiler()
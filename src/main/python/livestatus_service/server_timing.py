@@ -0,0 +1,110 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from __future__ import absolute_import
+import threading
+import time
+
+from livestatus_service.metrics import PHASE_SECONDS
+from livestatus_service import tracing
+
+'''
+    Collects the phases of the current request for the Server-Timing response header.
+    Phases are recorded together with their metrics and as trace spans, outside of a request only the metrics are kept.
+'''
+
+PHASE_DESCRIPTIONS = {'config': 'config load',
+                      'auth': 'auth check',
+                      'connect': 'socket connect',
+                      'send': 'send query',
+                      'first_byte': 'livestatus wait',
+                      'receive': 'receive',
+                      'parse': 'parse',
+                      'snapshot': 'snapshot lookup',
+                      'format': 'format',
+                      'serialize': 'serialise',
+                      'total': 'total'}
+
+_REQUEST = threading.local()
+
+
+class RequestTimings(object):
+
+    def __init__(self):
+        self.started = time.time()
+        self.phases = []
+        self.durations = {}
+        self.counts = {}
+        self.cache_freshness = None
+
+    def record(self, phase, seconds):
+        if phase not in self.durations:
+            self.phases.append(phase)
+            self.durations[phase] = 0.0
+        self.durations[phase] += seconds
+
+    def count(self, name, amount):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def header_value(self):
+        entries = ['{0};desc="{1}";dur={2:.3f}'.format(phase, PHASE_DESCRIPTIONS.get(phase, phase), self.durations[phase] * 1000)
+                   for phase in self.phases]
+        entries.append('total;desc="total";dur={0:.3f}'.format((time.time() - self.started) * 1000))
+        return ', '.join(entries)
+
+
+def start():
+    _REQUEST.timings = RequestTimings()
+
+
+def stop():
+    timings = getattr(_REQUEST, 'timings', None)
+    _REQUEST.timings = None
+    return timings
+
+
+def record_phase(phase, seconds, table=''):
+    PHASE_SECONDS.observe(seconds, phase=phase, table=table)
+    tracing.record_span(phase, seconds, table=table)
+    timings = getattr(_REQUEST, 'timings', None)
+    if timings is not None:
+        timings.record(phase, seconds)
+
+
+def served_from_cache(age, fresh):
+    """Remembers the age of a cached answer and whether it was still fresh for the Age header"""
+    timings = getattr(_REQUEST, 'timings', None)
+    if timings is not None:
+        timings.cache_freshness = (age, fresh)
+
+
+def cache_freshness():
+    timings = getattr(_REQUEST, 'timings', None)
+    return None if timings is None else timings.cache_freshness
+
+
+def count(name, amount):
+    timings = getattr(_REQUEST, 'timings', None)
+    if timings is not None:
+        timings.count(name, amount)
@@ -0,0 +1,266 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from __future__ import absolute_import
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+from livestatus_service.metrics import SHARED_CACHE_LOOKUPS
+
+'''
+    A cache shared by all service processes of a host through a memory-mapped file, usually in
+    /dev/shm. The file holds a set-associative index of the keys and a ring of serialized payloads.
+    Index entries are evicted least recently used within their set, payload space is reused in the
+    order it was written, so an entry is gone when either its index entry was evicted, the ring
+    overwrote its payload or its time to live passed. Expired query answers stay a little longer to be
+    served stale while one process refreshes them.
+'''
+
+LOGGER = logging.getLogger('livestatus.shared_cache')
+
+MAGIC = b'LSCACHE2'
+HEADER = struct.Struct('<8sIIQQ')
+HEADER_SIZE = 64
+ENTRY = struct.Struct('<20sQIdddd')
+WRITTEN_OFFSET = 24
+
+
+class SharedCache(object):
+    """
+    Header: magic, sets, ways, ring size and the total of bytes ever written to the ring.
+    Entry: sha1 of the key, position of the payload in the written bytes, length, time it was stored,
+    expiry, end of the stale window and last use.
+    A payload is intact as long as less than the ring size was written after its position.
+    """
+    SETS = 1024
+    WAYS = 8
+
+    def __init__(self, path=None, size=64 * 1024 * 1024, ttl=5.0, auth_ttl=60.0, max_stale=30.0):
+        self._lock = threading.Lock()
+        self._pid = None
+        self.configure(path, size, ttl, auth_ttl, max_stale)
+
+    def configure(self, path, size, ttl, auth_ttl, max_stale=30.0):
+        index_size = self.SETS * self.WAYS * ENTRY.size
+        if path is not None and size <= HEADER_SIZE + index_size:
+            raise ValueError('The shared cache needs more than {0} bytes.'.format(HEADER_SIZE + index_size))
+        with self._lock:
+            self.path = path
+            self.size = size
+            self.ttl = ttl
+            self.auth_ttl = auth_ttl
+            self.max_stale = max_stale
+            self.data_offset = HEADER_SIZE + index_size
+            self.ring_size = size - self.data_offset
+            self._pid = None
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def get(self, key, kind='query'):
+        """Returns the payload stored for the key or None once it expired"""
+        entry = self.get_entry(key, kind)
+        if entry is None or not entry[2]:
+            return None
+        return entry[0]
+
+    def get_entry(self, key, kind='query'):
+        """Returns the payload, its age and whether it is fresh or None, stale payloads are kept for their max_stale"""
+        if not self.enabled:
+            return None
+        digest = hashlib.sha1(key.encode('utf-8')).digest()
+        try:
+            entry = self._lookup(digest)
+        except EnvironmentError as exception:
+            LOGGER.warn('Could not read the shared cache %s: %s', self.path, exception)
+            entry = None
+        if entry is None:
+            outcome = 'miss'
+        else:
+            outcome = 'hit' if entry[2] else 'stale'
+        SHARED_CACHE_LOOKUPS.inc(kind=kind, outcome=outcome)
+        return entry
+
+    def put(self, key, payload, ttl=None, max_stale=0.0):
+        """Payloads larger than an eighth of the ring are not stored to keep the other entries"""
+        if not self.enabled or len(payload) > self.ring_size // 8:
+            return
+        digest = hashlib.sha1(key.encode('utf-8')).digest()
+        try:
+            self._store(digest, payload, ttl or self.ttl, max_stale)
+        except EnvironmentError as exception:
+            LOGGER.warn('Could not write the shared cache %s: %s', self.path, exception)
+
+    def claim(self, key, seconds):
+        """Returns True for one caller of all processes, the others get False until it is released or the seconds passed"""
+        if not self.enabled:
+            return False
+        digest = self._claim_digest(key)
+        try:
+            with self._locked(fcntl.LOCK_EX):
+                now = time.time()
+                written = self._written()
+                if self._find(digest, written, now) is not None:
+                    return False
+                entry_offset = self._choose_entry(digest, written, now)
+                ENTRY.pack_into(self._mmap, entry_offset, digest, written, 0, now, now + seconds, now + seconds, now)
+                return True
+        except EnvironmentError as exception:
+            LOGGER.warn('Could not write the shared cache %s: %s', self.path, exception)
+            return False
+
+    def release(self, key):
+        if not self.enabled:
+            return
+        digest = self._claim_digest(key)
+        try:
+            with self._locked(fcntl.LOCK_EX):
+                entry_offset = self._find(digest, self._written(), time.time())
+                if entry_offset is not None:
+                    ENTRY.pack_into(self._mmap, entry_offset, digest, 0, 0, 0.0, 0.0, 0.0, 0.0)
+        except EnvironmentError as exception:
+            LOGGER.warn('Could not write the shared cache %s: %s', self.path, exception)
+
+    def _claim_digest(self, key):
+        return hashlib.sha1(('claim\n' + key).encode('utf-8')).digest()
+
+    def _lookup(self, digest):
+        with self._locked(fcntl.LOCK_SH):
+            now = time.time()
+            entry_offset = self._find(digest, self._written(), now)
+            if entry_offset is None:
+                return None
+            _, position, length, stored_at, expires_at, stale_until, _ = ENTRY.unpack_from(self._mmap, entry_offset)
+            ENTRY.pack_into(self._mmap, entry_offset, digest, position, length, stored_at, expires_at, stale_until, now)
+            return self._read(position, length), max(now - stored_at, 0.0), expires_at > now
+
+    def _store(self, digest, payload, ttl, max_stale):
+        with self._locked(fcntl.LOCK_EX):
+            now = time.time()
+            written = self._written()
+            entry_offset = self._choose_entry(digest, written, now)
+            self._write(written, payload)
+            struct.pack_into('<Q', self._mmap, WRITTEN_OFFSET, written + len(payload))
+            ENTRY.pack_into(self._mmap, entry_offset, digest, written, len(payload),
+                            now, now + ttl, now + ttl + max_stale, now)
+
+    def _find(self, digest, written, now):
+        for entry_offset in self._set_offsets(digest):
+            entry_digest, position, _, _, _, stale_until, _ = ENTRY.unpack_from(self._mmap, entry_offset)
+            if entry_digest == digest and self._is_valid(position, stale_until, written, now):
+                return entry_offset
+        return None
+
+    def _choose_entry(self, digest, written, now):
+        least_recently_used = None
+        for entry_offset in self._set_offsets(digest):
+            entry_digest, position, _, _, _, stale_until, last_used = ENTRY.unpack_from(self._mmap, entry_offset)
+            if entry_digest == digest or not self._is_valid(position, stale_until, written, now):
+                return entry_offset
+            if least_recently_used is None or last_used < least_recently_used[1]:
+                least_recently_used = (entry_offset, last_used)
+        return least_recently_used[0]
+
+    def _is_valid(self, position, stale_until, written, now):
+        return stale_until > now and written - position <= self.ring_size
+
+    def _set_offsets(self, digest):
+        first_entry = (struct.unpack('<I', digest[:4])[0] % self.SETS) * self.WAYS
+        return [HEADER_SIZE + (first_entry + way) * ENTRY.size for way in range(self.WAYS)]
+
+    def _written(self):
+        return struct.unpack_from('<Q', self._mmap, WRITTEN_OFFSET)[0]
+
+    def _read(self, position, length):
+        start = position % self.ring_size
+        first_part = min(length, self.ring_size - start)
+        payload = self._mmap[self.data_offset + start:self.data_offset + start + first_part]
+        if first_part < length:
+            payload += self._mmap[self.data_offset:self.data_offset + length - first_part]
+        return payload
+
+    def _write(self, position, payload):
+        start = position % self.ring_size
+        first_part = min(len(payload), self.ring_size - start)
+        self._mmap[self.data_offset + start:self.data_offset + start + first_part] = payload[:first_part]
+        if first_part < len(payload):
+            self._mmap[self.data_offset:self.data_offset + len(payload) - first_part] = payload[first_part:]
+
+    def _locked(self, operation):
+        return _FileLock(self, operation)
+
+    def _open(self):
+        """Every process maps the file itself, the first one or one with another geometry initializes it"""
+        file_descriptor = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(file_descriptor, fcntl.LOCK_EX)
+            expected_header = HEADER.pack(MAGIC, self.SETS, self.WAYS, self.ring_size, 0)[:WRITTEN_OFFSET]
+            if os.fstat(file_descriptor).st_size != self.size:
+                os.ftruncate(file_descriptor, 0)
+                os.ftruncate(file_descriptor, self.size)
+            self._mmap = mmap.mmap(file_descriptor, self.size)
+            if self._mmap[:WRITTEN_OFFSET] != expected_header:
+                LOGGER.info('Initializing the shared cache %s', self.path)
+                self._mmap[:self.data_offset] = b'\0' * self.data_offset
+                self._mmap[:WRITTEN_OFFSET] = expected_header
+            fcntl.flock(file_descriptor, fcntl.LOCK_UN)
+        except EnvironmentError:
+            os.close(file_descriptor)
+            raise
+        self._file_descriptor = file_descriptor
+        self._pid = os.getpid()
+
+
+class _FileLock(object):
+    """flock excludes other processes, the thread lock the other threads sharing the file descriptor"""
+
+    def __init__(self, cache, operation):
+        self.cache = cache
+        self.operation = operation
+
+    def __enter__(self):
+        self.cache._lock.acquire()
+        try:
+            if self.cache._pid != os.getpid():
+                self.cache._open()
+            fcntl.flock(self.cache._file_descriptor, self.operation)
+        except Exception:
+            self.cache._lock.release()
+            raise
+
+    def __exit__(self, exception_type, exception, traceback):
+        try:
+            fcntl.flock(self.cache._file_descriptor, fcntl.LOCK_UN)
+        finally:
+            self.cache._lock.release()
+
+
+SHARED_CACHE = SharedCache()
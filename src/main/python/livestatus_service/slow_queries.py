@@ -0,0 +1,159 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from __future__ import absolute_import
+from collections import deque
+import logging
+import re
+import threading
+import time
+
+'''
+    Aggregates slow livestatus queries by their shape. Queries are normalised into
+    fingerprints with the literal filter values stripped, so that all queries for
+    e.g. "services of host X" end up in one entry.
+'''
+
+LOGGER = logging.getLogger('livestatus.slow_queries')
+
+LITERAL_VALUE_PATTERN = re.compile(
+    r'^((?:Filter|Stats|WaitCondition):\s*\S+\s*(?:=|!=|~|!~|~~|!~~|=~|!=~|<|>|<=|>=))\s.*$')
+NUMERIC_HEADER_PATTERN = re.compile(r'^((?:Limit|Timelimit|WaitTimeout):)\s*\d+\s*$')
+IGNORED_HEADERS = ('AuthUser:', 'OutputFormat:', 'Localtime:')
+
+
+def fingerprint(query):
+    normalised_lines = []
+    for query_line in query.splitlines():
+        query_line = query_line.strip()
+        if not query_line or query_line.startswith(IGNORED_HEADERS):
+            continue
+        query_line = LITERAL_VALUE_PATTERN.sub(r'\1 ?', query_line)
+        query_line = NUMERIC_HEADER_PATTERN.sub(r'\1 ?', query_line)
+        normalised_lines.append(query_line)
+    return '\n'.join(normalised_lines)
+
+
+class _QueryShape(object):
+    SAMPLES = 256
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.latencies = deque(maxlen=self.SAMPLES)
+
+    def record(self, seconds, rows, received_bytes):
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.rows += rows
+        self.bytes += received_bytes
+        self.latencies.append(seconds)
+
+    def summary(self, query_fingerprint):
+        latencies = sorted(self.latencies)
+        return {'fingerprint': query_fingerprint,
+                'count': self.count,
+                'total_seconds': self.total_seconds,
+                'p50_seconds': _percentile(latencies, 0.5),
+                'p95_seconds': _percentile(latencies, 0.95),
+                'max_seconds': self.max_seconds,
+                'rows': self.rows,
+                'bytes': self.bytes}
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class SlowQueryLog(object):
+    """
+    Keeps the statistics of at most max_fingerprints query shapes, the least recently seen
+    shape is dropped first. A background thread, started with the first query, writes the
+    table to the log every log_interval seconds.
+    """
+
+    def __init__(self, threshold=1.0, log_interval=300.0, max_fingerprints=500):
+        self.configure(threshold, log_interval, max_fingerprints)
+        self._shapes = {}
+        self._last_seen = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def configure(self, threshold, log_interval, max_fingerprints):
+        self.threshold = threshold
+        self.log_interval = log_interval
+        self.max_fingerprints = max_fingerprints
+
+    def record(self, query, seconds, rows, received_bytes):
+        if self._thread is None:
+            self._start_logging()
+        if seconds < self.threshold:
+            return
+        query_fingerprint = fingerprint(query)
+        LOGGER.warn('Slow query (%.3fs, %s rows, %s bytes): %r', seconds, rows, received_bytes, query_fingerprint)
+        now = time.time()
+        with self._lock:
+            if query_fingerprint not in self._shapes:
+                if len(self._shapes) >= self.max_fingerprints:
+                    least_recently_seen = min(self._last_seen, key=self._last_seen.get)
+                    del self._shapes[least_recently_seen]
+                    del self._last_seen[least_recently_seen]
+                self._shapes[query_fingerprint] = _QueryShape()
+            self._shapes[query_fingerprint].record(seconds, rows, received_bytes)
+            self._last_seen[query_fingerprint] = now
+
+    def summary(self):
+        with self._lock:
+            summary = [shape.summary(query_fingerprint) for query_fingerprint, shape in self._shapes.items()]
+        return sorted(summary, key=lambda entry: entry['total_seconds'], reverse=True)
+
+    def _start_logging(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._log_periodically, name='slow-query-log')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _log_periodically(self):
+        while True:
+            time.sleep(self.log_interval)
+            try:
+                self.log_summary()
+            except BaseException as exception:
+                LOGGER.error('Logging the slow queries failed: %s', exception)
+
+    def log_summary(self):
+        for entry in self.summary():
+            LOGGER.info('Slow query shape %r: count=%s p50=%.3fs p95=%.3fs max=%.3fs rows=%s bytes=%s',
+                        entry['fingerprint'], entry['count'], entry['p50_seconds'], entry['p95_seconds'],
+                        entry['max_seconds'], entry['rows'], entry['bytes'])
+
+
+SLOW_QUERY_LOG = SlowQueryLog()
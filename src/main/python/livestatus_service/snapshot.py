@@ -0,0 +1,635 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from __future__ import absolute_import
+import logging
+import re
+import threading
+import time
+from array import array
+
+from livestatus_service.livestatus import fetch_answer, get_table
+from livestatus_service.deltas import changed_rows_query
+from livestatus_service.metrics import SNAPSHOT_QUERIES
+from livestatus_service import server_timing
+
+'''
+    Optional in-memory snapshots of the hosts and services tables. A snapshot is loaded completely,
+    then refreshed with the rows checked or changed since the last refresh and reloaded when the core
+    restarts or the reload interval passed. Queries using only the snapshot columns and the headers
+    supported here are answered from the snapshot in the raw livestatus format.
+'''
+
+LOGGER = logging.getLogger('livestatus.snapshot')
+
+SNAPSHOT_COLUMNS = {
+    'hosts': ['name', 'alias', 'display_name', 'address', 'state', 'state_type', 'hard_state', 'has_been_checked',
+              'plugin_output', 'long_plugin_output', 'perf_data', 'last_check', 'next_check', 'check_interval',
+              'last_state_change', 'last_hard_state_change', 'acknowledged', 'notifications_enabled',
+              'active_checks_enabled', 'scheduled_downtime_depth', 'is_flapping', 'num_services', 'num_services_ok',
+              'num_services_warn', 'num_services_crit', 'num_services_unknown', 'groups', 'contacts', 'contact_groups'],
+    'services': ['host_name', 'description', 'display_name', 'state', 'state_type', 'has_been_checked',
+                 'plugin_output', 'long_plugin_output', 'perf_data', 'last_check', 'next_check', 'check_interval',
+                 'last_state_change', 'last_hard_state_change', 'acknowledged', 'notifications_enabled',
+                 'active_checks_enabled', 'scheduled_downtime_depth', 'is_flapping', 'host_state', 'groups',
+                 'host_groups', 'contacts', 'contact_groups', 'host_contacts']}
+AUTH_COLUMNS = {'hosts': ['contacts'], 'services': ['contacts', 'host_contacts']}
+KEY_COLUMNS = {'hosts': ['name'], 'services': ['host_name', 'description']}
+INDEXED_COLUMNS = {'hosts': ['name', 'groups'], 'services': ['host_name', 'groups']}
+AGGREGATIONS = ('sum', 'min', 'max', 'avg')
+UNSUPPORTED_AGGREGATIONS = ('std', 'suminv', 'avginv')
+NUMERIC_TYPES = (int, float, bool)
+
+
+class UnsupportedQueryException(Exception):
+    """The query has to be answered by livestatus"""
+    pass
+
+
+class NumberColumn(object):
+    """Numbers of one type in an array of machine values, integers start with 32 bits"""
+    TYPECODES = {int: 'i', float: 'd'}
+    WIDER_TYPECODES = {'i': 'l'}
+
+    def __init__(self, number_type, typecode=None):
+        self.number_type = number_type
+        self.values = array(typecode or NumberColumn.TYPECODES[number_type])
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def accepts(self, value):
+        return type(value) is self.number_type
+
+    def get(self, slot):
+        return self.values[slot]
+
+    def append(self, value):
+        self.values.append(value)
+
+    def set(self, slot, value):
+        self.values[slot] = value
+
+    def widened(self):
+        """Returns a copy which can hold larger numbers or any value"""
+        wider_typecode = NumberColumn.WIDER_TYPECODES.get(self.values.typecode)
+        if wider_typecode is None:
+            return EncodedColumn(self)
+        column = NumberColumn(self.number_type, wider_typecode)
+        column.values.extend(iter(self.values))
+        return column
+
+
+class EncodedColumn(object):
+    """Distinct values are stored once and referenced by code, lists are stored as tuples"""
+
+    def __init__(self, values=()):
+        self.dictionary = []
+        self.codes = {}
+        self.references = array('i')
+        self.free_codes = []
+        self.slots = array('i')
+        for value in values:
+            self.append(value)
+
+    def __iter__(self):
+        return (self.dictionary[code] for code in self.slots)
+
+    def accepts(self, value):
+        return True
+
+    def get(self, slot):
+        return self.dictionary[self.slots[slot]]
+
+    def append(self, value):
+        self.slots.append(self._encode(value))
+
+    def set(self, slot, value):
+        code = self._encode(value)
+        self._release(self.slots[slot])
+        self.slots[slot] = code
+
+    def _encode(self, value):
+        if isinstance(value, list):
+            value = tuple(value)
+        code = self.codes.get(value)
+        if code is None:
+            if self.free_codes:
+                code = self.free_codes.pop()
+                self.dictionary[code] = value
+            else:
+                code = len(self.dictionary)
+                self.dictionary.append(value)
+                self.references.append(0)
+            self.codes[value] = code
+        self.references[code] += 1
+        return code
+
+    def _release(self, code):
+        self.references[code] -= 1
+        if not self.references[code]:
+            del self.codes[self.dictionary[code]]
+            self.dictionary[code] = None
+            self.free_codes.append(code)
+
+
+def _new_column(values):
+    """Numbers of a single type go to an array, everything else is dictionary encoded"""
+    value_types = set(type(value) for value in values)
+    if len(value_types) == 1:
+        value_type = value_types.pop()
+        if value_type in NumberColumn.TYPECODES:
+            return NumberColumn(value_type)
+    return EncodedColumn()
+
+
+class TableSnapshot(object):
+    """
+    Stores the rows column-wise, a row is a slot in every column. Rows are only materialized
+    for the columns and slots of an answer. Indexes map values of indexed columns to slots.
+    """
+
+    def __init__(self, table, columns=None):
+        self.table = table
+        self.columns = list(columns or SNAPSHOT_COLUMNS[table])
+        self.column_positions = dict((column, position) for position, column in enumerate(self.columns))
+        self.key_positions = [self.column_positions[column] for column in KEY_COLUMNS[table]]
+        self.indexed_columns = INDEXED_COLUMNS[table]
+        self.lock = threading.Lock()
+        self.clear()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def clear(self, rows=()):
+        self.column_values = [_new_column([row[position] for row in rows]) for position in range(len(self.columns))]
+        self.keys = []
+        self.slots = {}
+        self.indexes = dict((column, {}) for column in self.indexed_columns)
+        self.loaded_at = None
+        self.refreshed_at = None
+
+    def row_key(self, row):
+        return tuple(row[position] for position in self.key_positions)
+
+    def load(self, rows, loaded_at):
+        with self.lock:
+            self.clear(rows)
+            self._update(rows)
+            self.loaded_at = self.refreshed_at = loaded_at
+
+    def update(self, rows, refreshed_at):
+        with self.lock:
+            self._update(rows)
+            self.refreshed_at = refreshed_at
+
+    def _update(self, rows):
+        for row in rows:
+            row_key = self.row_key(row)
+            slot = self.slots.get(row_key)
+            new_row = slot is None
+            if new_row:
+                slot = self.slots[row_key] = len(self.keys)
+                self.keys.append(row_key)
+            else:
+                self._change_indexes(slot, self._remove_from_index)
+            for position, value in enumerate(row):
+                self._store(position, slot, value, new_row)
+            self._change_indexes(slot, self._add_to_index)
+
+    def _store(self, position, slot, value, new_row):
+        column = self.column_values[position]
+        if not column.accepts(value):
+            column = self.column_values[position] = EncodedColumn(column)
+        try:
+            if new_row:
+                column.append(value)
+            else:
+                column.set(slot, value)
+        except OverflowError:
+            self.column_values[position] = column.widened()
+            self._store(position, slot, value, new_row)
+
+    def _change_indexes(self, slot, change):
+        for column in self.indexed_columns:
+            value = self.getter(column)(slot)
+            for element in (value if isinstance(value, tuple) else [value]):
+                change(self.indexes[column], element, slot)
+
+    @staticmethod
+    def _add_to_index(index, value, slot):
+        index.setdefault(value, set()).add(slot)
+
+    @staticmethod
+    def _remove_from_index(index, value, slot):
+        slots = index.get(value)
+        if slots is not None:
+            slots.discard(slot)
+            if not slots:
+                del index[value]
+
+    def column(self, column):
+        return self.column_values[self.column_positions[column]]
+
+    def getter(self, column):
+        return self.column(column).get
+
+    def column_type(self, column):
+        column_values = self.column_values[self.column_positions[column]]
+        if isinstance(column_values, NumberColumn):
+            return column_values.number_type
+        for value in column_values.dictionary:
+            if value is not None:
+                return list if isinstance(value, tuple) else type(value)
+        return str
+
+    def select(self, predicates):
+        """Returns the slots of the rows matching all predicates in the order they were loaded, indexes narrow the candidates"""
+        candidates = None
+        for predicate in predicates:
+            if predicate.lookup is not None:
+                column, value = predicate.lookup
+                slots = self.indexes[column].get(value, set())
+                candidates = slots if candidates is None else candidates & slots
+        slots = list(range(len(self.keys))) if candidates is None else sorted(candidates)
+        return _all(predicates, slots)
+
+
+class Predicate(object):
+    """Filters a list of row slots, lookup is the (column, value) of an index containing all matching rows"""
+
+    def __init__(self, function, lookup=None):
+        self.function = function
+        self.lookup = lookup
+
+    def __call__(self, slots):
+        return self.function(slots)
+
+
+def column_filter(column, test):
+    """Tests the values of an array directly, but every distinct value of an encoded column only once"""
+    if isinstance(column, NumberColumn):
+        values = column.values
+        return lambda slots: [slot for slot in slots if test(values[slot])]
+    matching_codes = []
+
+    def filter_encoded(slots):
+        if not matching_codes:
+            matching_codes.append(set(code for code, value in enumerate(column.dictionary)
+                                      if column.references[code] and test(value)))
+        codes, matching = column.slots, matching_codes[0]
+        return [slot for slot in slots if codes[slot] in matching]
+    return filter_encoded
+
+
+def equality_filter(column, value):
+    """Compares the codes of an encoded column with the code of the value"""
+    if isinstance(column, NumberColumn):
+        values = column.values
+        return lambda slots: [slot for slot in slots if values[slot] == value]
+    code, codes = column.codes.get(value), column.slots
+    return lambda slots: [slot for slot in slots if codes[slot] == code] if code is not None else []
+
+
+def _negated(function):
+    def filter_negated(slots):
+        matching = set(function(slots))
+        return [slot for slot in slots if slot not in matching]
+    return filter_negated
+
+
+def _convert_value(value, column_type):
+    if column_type in NUMERIC_TYPES:
+        try:
+            return int(value)
+        except ValueError:
+            try:
+                return float(value)
+            except ValueError:
+                raise UnsupportedQueryException('{0!r} is not a number'.format(value))
+    return value
+
+
+def _list_test(operator, value):
+    if operator == '=' and value == '':
+        return lambda values: not values
+    if operator == '>=':
+        return lambda values: value in values
+    if operator == '<':
+        return lambda values: value not in values
+    if operator == '<=':
+        return lambda values: value.lower() in [element.lower() for element in values]
+    if operator == '>':
+        return lambda values: value.lower() not in [element.lower() for element in values]
+    if operator in ('~', '~~'):
+        expression = re.compile(value, re.IGNORECASE if operator == '~~' else 0)
+        return lambda values: any(expression.search(element) for element in values)
+    raise UnsupportedQueryException('Operator {0} on lists'.format(operator))
+
+
+def _scalar_test(operator, value, column_type):
+    if operator in ('~', '~~'):
+        if column_type in NUMERIC_TYPES:
+            raise UnsupportedQueryException('Regular expression on a number')
+        expression = re.compile(value, re.IGNORECASE if operator == '~~' else 0)
+        return lambda actual: expression.search(actual) is not None
+    if operator == '=~':
+        if column_type in NUMERIC_TYPES:
+            raise UnsupportedQueryException('Case insensitive comparison of a number')
+        value = value.lower()
+        return lambda actual: actual.lower() == value
+    value = _convert_value(value, column_type)
+    comparisons = {'=': lambda actual: actual == value,
+                   '<': lambda actual: actual < value,
+                   '>': lambda actual: actual > value,
+                   '<=': lambda actual: actual <= value,
+                   '>=': lambda actual: actual >= value}
+    if operator not in comparisons:
+        raise UnsupportedQueryException('Operator {0}'.format(operator))
+    return comparisons[operator]
+
+
+def compile_filter(snapshot, definition):
+    """Compiles 'column operator value' of a Filter or Stats header"""
+    parts = definition.split(None, 2)
+    if len(parts) < 2:
+        raise UnsupportedQueryException('Incomplete filter {0!r}'.format(definition))
+    column, operator, value = parts[0], parts[1], parts[2] if len(parts) > 2 else ''
+    if column not in snapshot.column_positions:
+        raise UnsupportedQueryException('Column {0} is not in the snapshot'.format(column))
+    negated = operator.startswith('!')
+    if negated:
+        operator = operator[1:]
+        if operator == '':
+            raise UnsupportedQueryException('Operator !')
+    column_type = snapshot.column_type(column)
+    if column_type is list:
+        function = column_filter(snapshot.column(column), _list_test(operator, value))
+    elif operator == '=':
+        function = equality_filter(snapshot.column(column), _convert_value(value, column_type))
+    else:
+        function = column_filter(snapshot.column(column), _scalar_test(operator, value, column_type))
+    if negated:
+        return Predicate(_negated(function))
+    lookup = None
+    if column in snapshot.indexed_columns:
+        if column_type is list and operator == '>=':
+            lookup = (column, value)
+        elif column_type is not list and operator == '=':
+            lookup = (column, _convert_value(value, column_type))
+    return Predicate(function, lookup)
+
+
+def _combine(stack, header, value):
+    if header.endswith('Negate'):
+        if not stack:
+            raise UnsupportedQueryException('{0} without filter'.format(header))
+        stack.append(Predicate(_negated(stack.pop())))
+        return
+    try:
+        count = int(value)
+    except ValueError:
+        raise UnsupportedQueryException('{0}: {1}'.format(header, value))
+    if count < 1 or count > len(stack):
+        raise UnsupportedQueryException('{0}: {1} with {2} filters'.format(header, count, len(stack)))
+    combined = stack[-count:]
+    del stack[-count:]
+    if header.endswith('And'):
+        stack.append(Predicate(lambda slots: _all(combined, slots)))
+    else:
+        stack.append(Predicate(lambda slots: _any(combined, slots)))
+
+
+def _all(predicates, slots):
+    for predicate in predicates:
+        slots = predicate(slots)
+    return slots
+
+
+def _any(predicates, slots):
+    matching = set()
+    for predicate in predicates:
+        matching.update(predicate(slots))
+    return [slot for slot in slots if slot in matching]
+
+
+class SnapshotQuery(object):
+    """The parsed subset of LQL which can be answered from a snapshot"""
+
+    def __init__(self, snapshot, query):
+        query_lines = [query_line for query_line in query.splitlines() if query_line.strip()]
+        self.snapshot = snapshot
+        self.columns = None
+        self.column_headers = False
+        self.limit = None
+        self.filters = []
+        self.stats = []
+        for query_line in query_lines[1:]:
+            header, separator, value = query_line.partition(':')
+            if not separator:
+                raise UnsupportedQueryException('Line {0!r}'.format(query_line))
+            self._parse(header.strip(), value.strip())
+        if self.columns is None:
+            raise UnsupportedQueryException('Queries without columns return columns missing in the snapshot')
+        if self.stats and (self.column_headers or self.limit is not None):
+            raise UnsupportedQueryException('ColumnHeaders or Limit with Stats')
+
+    def _parse(self, header, value):
+        if header == 'Columns':
+            self.columns = value.split()
+            for column in self.columns:
+                if column not in self.snapshot.column_positions:
+                    raise UnsupportedQueryException('Column {0} is not in the snapshot'.format(column))
+        elif header == 'Filter':
+            self.filters.append(compile_filter(self.snapshot, value))
+        elif header in ('And', 'Or', 'Negate'):
+            _combine(self.filters, header, value)
+        elif header == 'Stats':
+            self.stats.append(self._compile_stats(value))
+        elif header in ('StatsAnd', 'StatsOr', 'StatsNegate'):
+            if any(not isinstance(stats, Predicate) for stats in self.stats):
+                raise UnsupportedQueryException('{0} with aggregations'.format(header))
+            _combine(self.stats, header, value)
+        elif header == 'Limit':
+            try:
+                self.limit = int(value)
+            except ValueError:
+                raise UnsupportedQueryException('Limit: {0}'.format(value))
+        elif header == 'ColumnHeaders':
+            self.column_headers = value == 'on'
+        else:
+            raise UnsupportedQueryException('Header {0}'.format(header))
+
+    def _compile_stats(self, value):
+        parts = value.split()
+        if len(parts) == 2 and parts[0] in UNSUPPORTED_AGGREGATIONS:
+            raise UnsupportedQueryException('Stats: {0}'.format(parts[0]))
+        if len(parts) == 2 and parts[0] in AGGREGATIONS:
+            if parts[1] not in self.snapshot.column_positions:
+                raise UnsupportedQueryException('Column {0} is not in the snapshot'.format(parts[1]))
+            return (parts[0], self.snapshot.getter(parts[1]))
+        return compile_filter(self.snapshot, value)
+
+    def answer(self, auth=None):
+        predicates = list(self.filters)
+        if auth is not None:
+            predicates.append(self._authorized(auth))
+        slots = self.snapshot.select(predicates)
+        getters = [self.snapshot.getter(column) for column in self.columns]
+        if self.stats:
+            return self._aggregate(slots, getters)
+        if self.limit is not None:
+            slots = slots[:self.limit]
+        answer = [[_materialize(get(slot)) for get in getters] for slot in slots]
+        if self.column_headers:
+            answer.insert(0, list(self.columns))
+        return answer
+
+    def _authorized(self, auth):
+        """Like livestatus, the contacts of a host see all of its services"""
+        contact_filters = [Predicate(column_filter(self.snapshot.column(column), lambda contacts: auth in contacts))
+                           for column in AUTH_COLUMNS[self.snapshot.table]]
+        return Predicate(lambda slots: _any(contact_filters, slots))
+
+    def _aggregate(self, slots, getters):
+        groups = {}
+        group_order = []
+        for slot in slots:
+            group = tuple(get(slot) for get in getters)
+            if group not in groups:
+                groups[group] = []
+                group_order.append(group)
+            groups[group].append(slot)
+        if not getters:
+            return [self._compute_stats(groups.get((), []))]
+        return [[_materialize(value) for value in group] + self._compute_stats(groups[group]) for group in group_order]
+
+    def _compute_stats(self, slots):
+        results = []
+        for stats in self.stats:
+            if isinstance(stats, Predicate):
+                results.append(len(stats(slots)))
+                continue
+            aggregation, get = stats
+            values = [get(slot) for slot in slots]
+            if not values:
+                results.append(0)
+            elif aggregation == 'sum':
+                results.append(sum(values))
+            elif aggregation == 'min':
+                results.append(min(values))
+            elif aggregation == 'max':
+                results.append(max(values))
+            else:
+                results.append(float(sum(values)) / len(values))
+        return results
+
+
+def _materialize(value):
+    return list(value) if isinstance(value, tuple) else value
+
+
+class SnapshotStore(object):
+    """
+    Keeps the configured table snapshots of this process up to date from a background thread.
+    Snapshots older than three refresh intervals are not used to answer queries.
+    """
+
+    def __init__(self, tables=None, socket_path=None, refresh_interval=10.0, reload_interval=300.0):
+        self._lock = threading.Lock()
+        self._thread = None
+        self.snapshots = {}
+        self.program_start = None
+        self.configure(tables, socket_path, refresh_interval, reload_interval)
+
+    def configure(self, tables, socket_path, refresh_interval, reload_interval):
+        for table in tables or []:
+            if table not in SNAPSHOT_COLUMNS:
+                raise ValueError('Snapshots are only supported for the tables {0}.'.format(', '.join(sorted(SNAPSHOT_COLUMNS))))
+        with self._lock:
+            self.snapshots = dict((table, TableSnapshot(table)) for table in tables or [])
+            self.socket_path = socket_path
+            self.refresh_interval = refresh_interval
+            self.reload_interval = reload_interval
+            self.program_start = None
+
+    @property
+    def enabled(self):
+        return bool(self.snapshots)
+
+    def answer(self, query, auth=None):
+        """Returns the raw livestatus answer of the query or None if livestatus has to answer it"""
+        table = get_table(query)
+        snapshot = self.snapshots.get(table)
+        if snapshot is None:
+            return None
+        self._start()
+        if snapshot.refreshed_at is None or snapshot.refreshed_at < time.time() - 3 * self.refresh_interval:
+            SNAPSHOT_QUERIES.inc(table=table, outcome='stale')
+            return None
+        start = time.time()
+        try:
+            with snapshot.lock:
+                answer = SnapshotQuery(snapshot, query).answer(auth)
+        except (UnsupportedQueryException, re.error) as exception:
+            LOGGER.debug('Passing query to livestatus: %s', exception)
+            SNAPSHOT_QUERIES.inc(table=table, outcome='unsupported')
+            return None
+        server_timing.record_phase('snapshot', time.time() - start, table)
+        server_timing.count('rows', len(answer))
+        SNAPSHOT_QUERIES.inc(table=table, outcome='hit')
+        return answer
+
+    def refresh(self):
+        program_start = fetch_answer('GET status\nColumns: program_start', self.socket_path)[0][0]
+        core_restarted = program_start != self.program_start
+        self.program_start = program_start
+        for table, snapshot in list(self.snapshots.items()):
+            started = time.time()
+            query = 'GET {0}\nColumns: {1}'.format(table, ' '.join(snapshot.columns))
+            if core_restarted or snapshot.loaded_at is None or snapshot.loaded_at < started - self.reload_interval:
+                snapshot.load(fetch_answer(query, self.socket_path), started)
+                LOGGER.info('Loaded snapshot of %s rows of %s', len(snapshot), table)
+            else:
+                # one second overlap, livestatus timestamps are seconds
+                snapshot.update(fetch_answer(changed_rows_query(query, snapshot.refreshed_at - 1), self.socket_path), started)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._refresh_periodically, name='table-snapshots')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _refresh_periodically(self):
+        while True:
+            try:
+                if self.enabled:
+                    self.refresh()
+            except Exception as exception:
+                LOGGER.warn('Could not refresh the table snapshots: %s', exception)
+            time.sleep(self.refresh_interval)
+
+
+SNAPSHOTS = SnapshotStore()
@@ -0,0 +1,276 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from __future__ import absolute_import
+from contextlib import contextmanager
+from functools import wraps
+import binascii
+import logging
+import os
+import re
+import simplejson as json
+import socket
+import stat
+import threading
+import time
+try:  # pragma: no cover
+    import Queue as queue
+except ImportError:  # pragma: no cover
+    import queue
+
+'''
+    Minimal request tracing. Spans of a request form a tree below the span of the HTTP request,
+    whose trace id is taken from an incoming W3C traceparent header. Finished spans are exported
+    in batches as OTLP/JSON, one batch per line, to a file or to a collector listening on a UNIX socket.
+'''
+
+LOGGER = logging.getLogger('livestatus.tracing')
+
+TRACEPARENT_PATTERN = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_CODE_ERROR = 2
+
+_TRACE = threading.local()
+
+
+def _random_id(length):
+    return binascii.hexlify(os.urandom(length)).decode('ascii')
+
+
+def _now_ns():
+    return int(time.time() * 1e9)
+
+
+class Span(object):
+
+    def __init__(self, trace_id, name, parent_span_id=None, kind=SPAN_KIND_INTERNAL, start_ns=None, **attributes):
+        self.trace_id = trace_id
+        self.span_id = _random_id(8)
+        self.parent_span_id = parent_span_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = _now_ns() if start_ns is None else start_ns
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+
+    def finish(self, end_ns=None):
+        self.end_ns = _now_ns() if end_ns is None else end_ns
+        SPAN_EXPORTER.export(self)
+
+    def as_otlp(self):
+        otlp_span = {'traceId': self.trace_id,
+                     'spanId': self.span_id,
+                     'name': self.name,
+                     'kind': self.kind,
+                     'startTimeUnixNano': str(self.start_ns),
+                     'endTimeUnixNano': str(self.end_ns),
+                     'attributes': [{'key': key, 'value': {'stringValue': str(value)}}
+                                    for key, value in sorted(self.attributes.items())]}
+        if self.parent_span_id:
+            otlp_span['parentSpanId'] = self.parent_span_id
+        if self.error is not None:
+            otlp_span['status'] = {'code': STATUS_CODE_ERROR, 'message': self.error}
+        return otlp_span
+
+
+def start_trace(name, traceparent=None, **attributes):
+    """
+    Starts the span of a request, continuing the trace of the caller if it sent a traceparent.
+    Requests the caller does not sample are not traced at all until finish_trace.
+    """
+    _TRACE.spans = None
+    _TRACE.unsampled = False
+    if not SPAN_EXPORTER.enabled:
+        return None
+    match = TRACEPARENT_PATTERN.match((traceparent or '').strip().lower())
+    if match and not int(match.group(3), 16) & 1:
+        _TRACE.unsampled = True
+        return None
+    trace_id, parent_span_id = (match.group(1), match.group(2)) if match else (_random_id(16), None)
+    root_span = Span(trace_id, name, parent_span_id, kind=SPAN_KIND_SERVER, **attributes)
+    _TRACE.spans = [root_span]
+    return root_span
+
+
+def finish_trace(**attributes):
+    spans = getattr(_TRACE, 'spans', None)
+    _TRACE.spans = None
+    _TRACE.unsampled = False
+    if spans:
+        spans[0].attributes.update(attributes)
+        spans[0].finish()
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Traces the enclosed block as child of the current span. Outside of a traced request
+    (e.g. in background threads) the span starts a trace of its own.
+    """
+    if not SPAN_EXPORTER.enabled or getattr(_TRACE, 'unsampled', False):
+        yield None
+        return
+    spans = getattr(_TRACE, 'spans', None)
+    if spans:
+        current_span = Span(spans[-1].trace_id, name, spans[-1].span_id, **attributes)
+        spans.append(current_span)
+    else:
+        current_span = Span(_random_id(16), name, **attributes)
+        spans = _TRACE.spans = [current_span]
+    try:
+        yield current_span
+    except BaseException as exception:
+        current_span.error = '{0}: {1}'.format(type(exception).__name__, exception)
+        raise
+    finally:
+        spans.pop()
+        if not spans:
+            _TRACE.spans = None
+        current_span.finish()
+
+
+def traced(name):
+    def decorate(function):
+        @wraps(function)
+        def traced_function(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return traced_function
+    return decorate
+
+
+def record_span(name, seconds, **attributes):
+    """Records an already finished block of the given duration as child of the current span"""
+    spans = getattr(_TRACE, 'spans', None)
+    if not spans or not SPAN_EXPORTER.enabled:
+        return
+    end_ns = _now_ns()
+    Span(spans[-1].trace_id, name, spans[-1].span_id, start_ns=end_ns - int(round(seconds * 1e9)), **attributes).finish(end_ns)
+
+
+class SpanExporter(object):
+    """
+    Queues finished spans and writes them from a background thread. Spans are dropped
+    when the queue is full or the destination is unavailable, tracing never blocks requests.
+    """
+    FLUSH_INTERVAL = 1.0
+    QUEUE_SIZE = 10000
+
+    def __init__(self, path=None, batch_size=512):
+        self._queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._socket = None
+        self.dropped_spans = 0
+        self.configure(path, batch_size)
+
+    def configure(self, path, batch_size):
+        self.path = path
+        self.batch_size = batch_size
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def export(self, finished_span):
+        self._start()
+        try:
+            self._queue.put_nowait(finished_span)
+        except queue.Full:
+            self.dropped_spans += 1
+
+    def flush(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._export_batches, name='span-exporter')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _export_batches(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.time() + self.FLUSH_INTERVAL
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            line = json.dumps(self._as_otlp_request(batch)) + '\n'
+            if os.path.exists(self.path) and stat.S_ISSOCK(os.stat(self.path).st_mode):
+                self._send(line.encode('utf-8'))
+            else:
+                with open(self.path, 'a') as trace_file:
+                    trace_file.write(line)
+        except Exception as exception:
+            self.dropped_spans += len(batch)
+            LOGGER.warn('Dropped %s spans, could not export to %s: %s', len(batch), self.path, exception)
+
+    def _send(self, data):
+        if self._socket is None:
+            collector_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                collector_socket.connect(self.path)
+            except socket.error:
+                collector_socket.close()
+                raise
+            self._socket = collector_socket
+        try:
+            self._socket.sendall(data)
+        except socket.error:
+            self._socket.close()
+            self._socket = None
+            raise
+
+    @staticmethod
+    def _as_otlp_request(batch):
+        return {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': 'livestatus-service'}},
+                                        {'key': 'process.pid', 'value': {'intValue': str(os.getpid())}}]},
+            'scopeSpans': [{'scope': {'name': 'livestatus_service'},
+                            'spans': [finished_span.as_otlp() for finished_span in batch]}]}]}
+
+
+SPAN_EXPORTER = SpanExporter()
@@ -0,0 +1,104 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from __future__ import absolute_import
+import logging
+import os
+import simplejson as json
+import threading
+import time
+
+'''
+    Records the requests dispatched by the web application to replay them later.
+    Every request is appended as one JSON line [timestamp, endpoint, q, key, auth, handler, parameters].
+'''
+
+LOGGER = logging.getLogger('livestatus.traffic')
+
+
+class TrafficRecorder(object):
+    """
+    Lines are written with a single os.write on a file opened with O_APPEND so that several
+    processes can record to the same file. Recording failures are logged and never fail requests.
+    """
+
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._fd = None
+        self.recorded_requests = 0
+        self.failed_requests = 0
+        self.configure(path)
+
+    def configure(self, path):
+        with self._lock:
+            self._close()
+            self.path = path
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def record(self, endpoint, query, key=None, auth=None, handler=None, parameters=None):
+        if not self.enabled:
+            return
+        line = json.dumps([round(time.time(), 3), endpoint, query, key, auth, handler, parameters or {}]) + '\n'
+        with self._lock:
+            try:
+                if self._fd is None:
+                    self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+                os.write(self._fd, line.encode('utf-8'))
+                self.recorded_requests += 1
+            except (EnvironmentError, TypeError) as error:
+                self.failed_requests += 1
+                self._close()
+                LOGGER.warn('Could not record request to %s: %s', self.path, error)
+
+    def _close(self):
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except EnvironmentError:
+                pass
+            self._fd = None
+
+
+def read_recording(path):
+    """Yields the recorded requests as dictionaries, incomplete lines of an interrupted recording are skipped"""
+    with open(path) as recording:
+        for line in recording:
+            try:
+                timestamp, endpoint, query, key, auth, handler, parameters = json.loads(line)
+            except ValueError:
+                LOGGER.warn('Skipping incomplete recorded request %r', line[:100])
+                continue
+            yield {'timestamp': timestamp,
+                   'endpoint': endpoint,
+                   'q': query,
+                   'key': key,
+                   'auth': auth,
+                   'handler': handler,
+                   'parameters': parameters}
+
+
+TRAFFIC_RECORDER = TrafficRecorder()
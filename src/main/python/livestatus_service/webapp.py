@@ -24,12 +24,28 @@ THE SOFTWARE.
 
 
 from __future__ import absolute_import
-from flask import Flask, request, render_template
+from flask import Flask, Response, request, render_template
 import logging
 import traceback
 
 from livestatus_service import __version__ as livestatus_version
-from livestatus_service.dispatcher import perform_query, perform_command
+from livestatus_service.dispatcher import perform_query, perform_command, perform_mass_command, submit_command_job, subscribe_to_changes
+from livestatus_service.dispatcher import perform_join_query, perform_analytics
+from livestatus_service.dispatcher import PermissionDeniedException, CORE_UNAVAILABLE_EXCEPTIONS
+from livestatus_service.jobs import find_command_job, CommandQueueFullException
+from livestatus_service.livestatus import get_table
+from livestatus_service.metrics import REGISTRY, REQUEST_SECONDS, handler_label
+from livestatus_service import server_timing
+from livestatus_service import tracing
+from livestatus_service.configuration import get_current_configuration
+from livestatus_service.slow_queries import SLOW_QUERY_LOG
+from livestatus_service.profiling import REQUEST_PROFILER
+from livestatus_service.traffic import TRAFFIC_RECORDER
+from livestatus_service.changes import CHANGE_FEED, TooManySubscribersException
+from livestatus_service.joins import stream_json
+from livestatus_service.perf_data import OUTPUTS as PERF_DATA_OUTPUTS
+import simplejson as json
+import time
 
 '''
     The web application livestatus-service.
@@ -38,10 +54,34 @@ from livestatus_service.dispatcher import perform_query, perform_command
 
 LOGGER = logging.getLogger('livestatus.webapp')
 
+ERROR_STATUSES = ((CommandQueueFullException, 503, '1'),
+                  (TooManySubscribersException, 503, '10'),
+                  (CORE_UNAVAILABLE_EXCEPTIONS, 503, '10'),
+                  (PermissionDeniedException, 403, None),
+                  (ValueError, 400, None))
+
 
 application = Flask(__name__)
 
 
+@application.before_request
+def start_server_timing():
+    server_timing.start()
+    tracing.start_trace('{0} {1}'.format(request.method, request.path), request.headers.get('traceparent'))
+
+
+@application.after_request
+def add_server_timing_headers(response):
+    tracing.finish_trace(status=response.status_code)
+    timings = server_timing.stop()
+    if timings is not None and timings.phases:
+        response.headers['Server-Timing'] = timings.header_value()
+        for name, header in (('rows', 'X-Livestatus-Rows'), ('bytes', 'X-Livestatus-Bytes')):
+            if name in timings.counts:
+                response.headers[header] = str(timings.counts[name])
+    return response
+
+
 def render_application_template(template_name, **template_parameters):
     template_parameters['version'] = livestatus_version
     return render_template(template_name, **template_parameters)
@@ -55,18 +95,157 @@ def handle_index():
 @application.route('/query', methods=['GET'])
 def handle_query():
     LOGGER.debug("Processing query...")
-    return validate_and_dispatch(request, perform_query)
+    response = application.make_response(validate_and_dispatch(
+        request, perform_query, extra_parameters={'since': validate_since, 'perf_data': validate_perf_data}))
+    if response.status_code != 200:
+        return response
+    add_cache_headers(response, get_table(validate_query(get_parameter(request, 'q'))))
+    return response.make_conditional(request)
 
 
 @application.route('/cmd', methods=['GET', 'POST'])
 def handle_command():
     LOGGER.debug("Processing command...")
+    if validate_flag(get_parameter(request, 'async')):
+        return validate_and_dispatch(request, submit_command_job, success_status=202)
     return validate_and_dispatch(request, perform_command)
 
 
-def dispatch_request(query, dispatch_function, **kwargs):
-    result = dispatch_function(query, **kwargs)
-    return '{0}\n'.format(result), 200
+@application.route('/cmd/<job_id>', methods=['GET'])
+def handle_command_status(job_id):
+    job = find_command_job(job_id)
+    if job is None:
+        return 'Error : No such job {0}'.format(job_id), 404
+    return '{0}\n'.format(json.dumps(job.as_dict(), indent=4)), 200
+
+
+@application.route('/masscmd', methods=['GET', 'POST'])
+def handle_mass_command():
+    LOGGER.debug("Processing mass command...")
+    return validate_and_dispatch(request, perform_mass_command,
+                                 extra_parameters={'selector': validate_selector,
+                                                   'dry_run': validate_flag})
+
+
+@application.route('/changes', methods=['GET'])
+def handle_changes():
+    LOGGER.debug("Subscribing to changes...")
+    try:
+        query = validate_query(get_parameter(request, 'q'))
+        if not query.startswith('GET '):
+            raise ValueError('The query must be a GET query.')
+        auth = request.authorization.username if request.authorization else None
+        subscription = subscribe_to_changes(query, key=request.args.get('key'), auth=auth,
+                                            handler=get_parameter(request, 'handler'))
+    except TooManySubscribersException as exception:
+        LOGGER.warn(str(exception))
+        return error_response(exception)
+    except BaseException as exception:
+        LOGGER.error(traceback.format_exc())
+        return error_response(exception)
+    return Response(CHANGE_FEED.stream(subscription), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@application.route('/hosts_with_services', methods=['GET'])
+def handle_hosts_with_services():
+    LOGGER.debug("Joining hosts with their services...")
+    return validate_and_dispatch(request, perform_join_query,
+                                 extra_parameters={'host_columns': validate_host_columns,
+                                                   'service_columns': validate_service_columns,
+                                                   'host_filter': validate_filter,
+                                                   'service_filter': validate_filter},
+                                 with_query=False, streamed=True)
+
+
+@application.route('/analytics', methods=['GET'])
+def handle_analytics():
+    LOGGER.debug("Analysing query...")
+    return validate_and_dispatch(request, perform_analytics,
+                                 extra_parameters={'percentiles': validate_column_list,
+                                                   'percents': validate_percents,
+                                                   'histogram': validate_column_list,
+                                                   'bins': validate_bins,
+                                                   'group_by': validate_column_list,
+                                                   'top': validate_column,
+                                                   'top_n': validate_top_n,
+                                                   'top_columns': validate_column_list})
+
+
+@application.route('/metrics', methods=['GET'])
+def handle_metrics():
+    return REGISTRY.exposition(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+@application.route('/admin/slow_queries', methods=['GET'])
+def handle_slow_queries():
+    if not is_admin(request):
+        return 'Error : Only admins may see the slow queries', 403
+    return '{0}\n'.format(json.dumps(SLOW_QUERY_LOG.summary(), indent=4)), 200
+
+
+@application.route('/admin/profiles', methods=['GET'])
+def handle_profiles():
+    if not is_admin(request):
+        return 'Error : Only admins may see the profiles', 403
+    return '{0}\n'.format(json.dumps(REQUEST_PROFILER.list_profiles(), indent=4)), 200
+
+
+@application.route('/admin/profiles/<profile_name>', methods=['GET'])
+def handle_profile_download(profile_name):
+    if not is_admin(request):
+        return 'Error : Only admins may download profiles', 403
+    profile_path = REQUEST_PROFILER.get_profile_path(profile_name)
+    if profile_path is None:
+        return 'Error : No such profile {0}'.format(profile_name), 404
+    with open(profile_path, 'rb') as profile_file:
+        profile = profile_file.read()
+    return profile, 200, {'Content-Type': 'application/octet-stream',
+                          'Content-Disposition': 'attachment; filename={0}'.format(profile_name)}
+
+
+def is_admin(request):
+    auth = request.authorization.username if request.authorization else None
+    return auth is not None and auth in get_current_configuration().admins
+
+
+def add_cache_headers(response, table):
+    """
+    The ETag is a hash of the answer, clients revalidating with If-None-Match get a 304 without it.
+    Answers from the shared cache carry their age, stale ones are marked while they are refreshed.
+    """
+    max_age = get_current_configuration().query_max_age.get(table)
+    response.headers['Cache-Control'] = 'max-age={0}'.format(max_age) if max_age else 'no-cache'
+    response.headers['Vary'] = 'Authorization'
+    cache_freshness = server_timing.cache_freshness()
+    age, fresh = cache_freshness if cache_freshness is not None else (0, True)
+    response.headers['Age'] = str(int(age))
+    response.headers['X-Livestatus-Freshness'] = 'fresh' if fresh else 'stale'
+    response.add_etag()
+
+
+def error_response(exception):
+    """Failures must not be cached, temporarily unavailable resources tell when to retry"""
+    for exception_type, status, retry_after in ERROR_STATUSES:
+        if isinstance(exception, exception_type):
+            break
+    else:
+        status, retry_after = 500, None
+    headers = {'Cache-Control': 'no-store'}
+    if retry_after is not None:
+        headers['Retry-After'] = retry_after
+    return 'Error : %s' % exception, status, headers
+
+
+def dispatch_request(query, dispatch_function, status=200, streamed=False, **kwargs):
+    if query is None:
+        result = dispatch_function(**kwargs)
+    else:
+        result = dispatch_function(query, **kwargs)
+    if streamed:
+        return Response(stream_json(result), status=status, mimetype='application/json',
+                        headers={'Cache-Control': 'no-cache', 'Vary': 'Authorization'})
+    return '{0}\n'.format(result), status
 
 
 def validate_query(query):
@@ -78,14 +257,145 @@ def validate_query(query):
     return query
 
 
-def validate_and_dispatch(request, dispatch_function):
+def validate_selector(selector):
+    if not selector:
+        raise ValueError('The "selector" parameter is mandatory.')
+    selector = validate_query(selector)
+    if not selector.startswith('GET '):
+        raise ValueError('The selector must be a GET query.')
+    return selector
+
+
+def validate_columns(columns, name):
+    if not columns:
+        raise ValueError('The "{0}" parameter is mandatory.'.format(name))
+    return validate_column_list(columns)
+
+
+def validate_host_columns(columns):
+    return validate_columns(columns, 'host_columns')
+
+
+def validate_service_columns(columns):
+    return validate_columns(columns, 'service_columns')
+
+
+def validate_column_list(columns):
+    if not columns:
+        return []
+    if '\n' in columns.replace('\\n', '\n'):
+        raise ValueError('Columns must be separated by spaces or commas, not by newlines.')
+    return columns.replace(',', ' ').split()
+
+
+def validate_column(column):
+    columns = validate_column_list(column)
+    if len(columns) > 1:
+        raise ValueError('Only one column is allowed, not {0}.'.format(column))
+    return columns[0] if columns else None
+
+
+def validate_percents(percents):
+    if not percents:
+        return None
+    try:
+        percents = [float(percent) for percent in percents.replace(',', ' ').split()]
+    except ValueError:
+        raise ValueError('The "percents" parameter must be a list of numbers.')
+    if not all(0 <= percent <= 100 for percent in percents):
+        raise ValueError('Percents must be between 0 and 100.')
+    return percents
+
+
+def validate_bins(bins):
+    return _validate_count(bins, 'bins', 10, 1000)
+
+
+def validate_top_n(top_n):
+    return _validate_count(top_n, 'top_n', 10, 1000)
+
+
+def _validate_count(count, name, default, maximum):
+    if count is None:
+        return default
+    try:
+        count = int(count)
+    except ValueError:
+        raise ValueError('The "{0}" parameter must be an integer.'.format(name))
+    if not 0 < count <= maximum:
+        raise ValueError('The "{0}" parameter must be between 1 and {1}.'.format(name, maximum))
+    return count
+
+
+def validate_filter(filter_lines):
+    if filter_lines is None:
+        return ''
+    return validate_query(filter_lines)
+
+
+def validate_perf_data(perf_data):
+    if perf_data is None or perf_data in PERF_DATA_OUTPUTS:
+        return perf_data
+    raise ValueError('The "perf_data" parameter must be one of {0}.'.format(', '.join(PERF_DATA_OUTPUTS)))
+
+
+def validate_since(since):
+    if since is None:
+        return None
+    try:
+        return float(since)
+    except ValueError:
+        raise ValueError('The "since" parameter must be a unix timestamp.')
+
+
+def validate_flag(flag):
+    return flag is not None and flag.lower() in ('1', 'true', 'yes', 'on')
+
+
+def get_parameter(request, name):
+    return request.args.get(name) or request.form.get(name)
+
+
+def validate_and_dispatch(request, dispatch_function, extra_parameters=None, success_status=200,
+                          with_query=True, streamed=False):
+    """
+    Without a query the dispatch function gets the extra parameters only. A streamed result
+    is an iterable serialized to a JSON array while it is sent.
+    """
+    start = time.time()
+    endpoint = getattr(dispatch_function, '__name__', str(dispatch_function))
+    handler = None
+    outcome = 'error'
     try:
-        query = request.args.get('q') or request.form.get('q')
-        query = validate_query(query)
+        query = validate_query(get_parameter(request, 'q')) if with_query else None
         key = request.args.get('key')
         auth = request.authorization.username if request.authorization else None
-        handler = request.args.get('handler') or request.form.get('handler')
-        return dispatch_request(query, dispatch_function, key=key, auth=auth, handler=handler)
+        handler = get_parameter(request, 'handler')
+        extra_kwargs = {}
+        for name, validate in (extra_parameters or {}).items():
+            extra_kwargs[name] = validate(get_parameter(request, name))
+        TRAFFIC_RECORDER.record(endpoint, query, key, auth, handler,
+                                dict((name, get_parameter(request, name)) for name in extra_parameters or {}))
+        dispatch_kwargs = dict(status=success_status, key=key, auth=auth, handler=handler, **extra_kwargs)
+        if streamed:
+            dispatch_kwargs['streamed'] = True
+        if REQUEST_PROFILER.should_profile(validate_flag(get_parameter(request, 'profile')) and is_admin(request)):
+            response, profile_name = REQUEST_PROFILER.run(endpoint, dispatch_request, query, dispatch_function, **dispatch_kwargs)
+            if profile_name and streamed:
+                response.headers['X-Livestatus-Profile'] = profile_name
+            elif profile_name:
+                response += ({'X-Livestatus-Profile': profile_name},)
+        else:
+            response = dispatch_request(query, dispatch_function, **dispatch_kwargs)
+        outcome = 'ok'
+        return response
+    except CommandQueueFullException as exception:
+        outcome = 'rejected'
+        LOGGER.warn(str(exception))
+        return error_response(exception)
     except BaseException as exception:
         LOGGER.error(traceback.format_exc())
-        return 'Error : %s' % exception, 200
+        return error_response(exception)
+    finally:
+        REQUEST_SECONDS.observe(time.time() - start, endpoint=endpoint,
+                                handler=handler_label(handler), outcome=outcome)
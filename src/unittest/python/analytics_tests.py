@@ -0,0 +1,116 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from mock import patch
+import unittest
+
+from livestatus_service import analytics
+from livestatus_service.analytics import Analysis, percentiles, histogram, group_counts, top_indices
+
+
+class PurePythonAnalyticsTests(unittest.TestCase):
+
+    def setUp(self):
+        numpy_patch = patch('livestatus_service.analytics.numpy', None)
+        numpy_patch.start()
+        self.addCleanup(numpy_patch.stop)
+
+    def numeric(self, values):
+        return analytics._numeric('column', values)
+
+    def test_percentiles_should_interpolate_between_ranks(self):
+        result = percentiles(self.numeric([4, 1, 3, 2, 5]), [0, 50, 90, 100])
+
+        self.assertEqual(result, {'0': 1.0, '50': 3.0, '90': 4.6, '100': 5.0})
+
+    def test_percentiles_of_no_values_should_be_none(self):
+        self.assertEqual(percentiles(self.numeric([]), [99.9]), {'99.9': None})
+
+    def test_histogram_should_include_maximum_in_last_bin(self):
+        result = histogram(self.numeric([0, 1, 2, 3, 4, 10]), 5)
+
+        self.assertEqual(result, {'edges': [0.0, 2.0, 4.0, 6.0, 8.0, 10.0], 'counts': [2, 2, 1, 0, 1]})
+
+    def test_histogram_of_equal_values_should_center_one_bin_width(self):
+        self.assertEqual(histogram(self.numeric([3, 3]), 2), {'edges': [2.5, 3.0, 3.5], 'counts': [0, 2]})
+
+    def test_top_indices_should_order_ties_by_row(self):
+        self.assertEqual(top_indices(self.numeric([1, 5, 3, 5, 2]), 3), [1, 3, 2])
+        self.assertEqual(top_indices(self.numeric([1, 2]), 3), [1, 0])
+
+    def test_analysis_should_aggregate_fetched_columns(self):
+        analysis = Analysis(percentiles=['latency'], percents=[50], histogram=['latency'], bins=2,
+                            group_by=['groups', 'state'], top='latency', top_n=2, top_columns=['description'])
+        answer = [[0.5, ['web', 'db'], 0, 'ping'],
+                  [1.5, ['web'], 2, 'disk'],
+                  [1.0, [], 0, 'load']]
+
+        result = analysis.compute(answer)
+
+        self.assertEqual(analysis.columns, ['latency', 'groups', 'state', 'description'])
+        self.assertEqual(result['rows'], 3)
+        self.assertEqual(result['percentiles'], {'latency': {'50': 1.0}})
+        self.assertEqual(result['histograms'], {'latency': {'edges': [0.5, 1.0, 1.5], 'counts': [1, 2]}})
+        self.assertEqual(sorted(result['groups'], key=lambda group: (group['groups'], group['state'])),
+                         [{'groups': 'db', 'state': 0, 'count': 1},
+                          {'groups': 'web', 'state': 0, 'count': 1},
+                          {'groups': 'web', 'state': 2, 'count': 1}])
+        self.assertEqual(result['top'], [{'latency': 1.5, 'description': 'disk'}, {'latency': 1.0, 'description': 'load'}])
+
+    def test_analysis_of_no_rows_should_return_empty_aggregates(self):
+        result = Analysis(percentiles=['latency'], top='latency').compute([])
+
+        self.assertEqual(result['percentiles'], {'latency': {'50': None, '90': None, '95': None, '99': None}})
+        self.assertEqual(result['top'], [])
+
+    def test_analysis_should_reject_non_numeric_columns(self):
+        self.assertRaises(ValueError, Analysis(percentiles=['host_name']).compute, [['alpha']])
+
+
+@unittest.skipIf(analytics.numpy is None, 'numpy is not installed')
+class NumpyAnalyticsTests(PurePythonAnalyticsTests):
+
+    def setUp(self):
+        pass
+
+
+class AnalysisQueryTests(unittest.TestCase):
+
+    def test_should_add_columns_of_analysis_to_query(self):
+        query = Analysis(group_by=['state'], top='execution_time').query('GET services\nFilter: state != 0\n')
+
+        self.assertEqual(query, 'GET services\nFilter: state != 0\nColumns: state execution_time')
+
+    def test_should_reject_columns_and_stats_in_query(self):
+        analysis = Analysis(group_by=['state'])
+
+        self.assertRaises(ValueError, analysis.query, 'GET services\nColumns: state')
+        self.assertRaises(ValueError, analysis.query, 'GET services\nStats: state = 0')
+        self.assertRaises(ValueError, analysis.query, 'COMMAND [0] DISABLE_NOTIFICATIONS')
+
+    def test_should_require_something_to_analyse(self):
+        self.assertRaises(ValueError, Analysis)
+
+    def test_group_counts_should_put_largest_groups_first(self):
+        self.assertEqual(group_counts([[0, 2, 2]], ['state']), [{'state': 2, 'count': 2}, {'state': 0, 'count': 1}])
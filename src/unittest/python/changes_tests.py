@@ -0,0 +1,160 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from mock import patch
+import simplejson as json
+import unittest
+
+from livestatus_service.changes import (ChangeFeed, Subscription, Watcher, TooManySubscribersException,
+                                        get_key_columns, with_key_columns, diff_rows, format_event)
+
+
+def parse_event(event):
+    event_line, data_line = event.strip().split('\n')
+    return event_line[len('event: '):], json.loads(data_line[len('data: '):])
+
+
+class ChangeFeedFunctionTests(unittest.TestCase):
+
+    def test_should_use_default_key_columns_of_table(self):
+        self.assertEqual(get_key_columns('GET services'), ['host_name', 'description'])
+        self.assertEqual(get_key_columns('GET services', key='display_name'), ['display_name'])
+
+    def test_should_raise_exception_for_table_without_default_key(self):
+        self.assertRaises(ValueError, get_key_columns, 'GET log')
+
+    def test_should_add_missing_key_columns_to_query(self):
+        self.assertEqual(with_key_columns('GET services\nColumns: state\nFilter: state = 2', ['host_name', 'description']),
+                         'GET services\nColumns: state host_name description\nFilter: state = 2')
+        self.assertEqual(with_key_columns('GET hosts', ['name']), 'GET hosts')
+
+    def test_should_reject_queries_with_wait_headers(self):
+        self.assertRaises(ValueError, with_key_columns, 'GET hosts\nWaitTrigger: check', ['name'])
+
+    def test_should_diff_rows(self):
+        previous_rows = {('a',): {'name': 'a', 'state': 0}, ('b',): {'name': 'b', 'state': 0}}
+        current_rows = {('a',): {'name': 'a', 'state': 1}, ('c',): {'name': 'c', 'state': 0}}
+
+        changed, removed = diff_rows(previous_rows, current_rows)
+
+        self.assertEqual(sorted(row['name'] for row in changed), ['a', 'c'])
+        self.assertEqual(removed, [['b']])
+
+
+class SubscriptionTests(unittest.TestCase):
+
+    def test_should_return_empty_event_after_timeout(self):
+        self.assertEqual(Subscription('key').next_event(0.01), '')
+
+    def test_should_close_subscription_which_does_not_keep_up(self):
+        subscription = Subscription('key')
+
+        for number in range(Subscription.QUEUE_SIZE + 1):
+            subscription.publish(format_event('changes', number))
+
+        self.assertTrue(subscription.closed)
+        self.assertEqual(subscription.next_event(0.01), None)
+
+
+class WatcherTests(unittest.TestCase):
+
+    def setUp(self):
+        self.watcher = Watcher('GET hosts\nColumns: name state', ['name'], None, '/path/to/socket')
+        self.subscription = Subscription('key')
+        self.watcher.subscriptions.append(self.subscription)
+
+    def test_should_publish_snapshot_and_then_changed_rows_only(self):
+        self.watcher.update({('a',): {'name': 'a', 'state': 0}, ('b',): {'name': 'b', 'state': 0}})
+        self.watcher.update({('a',): {'name': 'a', 'state': 0}, ('b',): {'name': 'b', 'state': 2}})
+        self.watcher.update({('a',): {'name': 'a', 'state': 0}, ('b',): {'name': 'b', 'state': 2}})
+
+        event_type, rows = parse_event(self.subscription.next_event(0.01))
+        self.assertEqual(event_type, 'snapshot')
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(parse_event(self.subscription.next_event(0.01)),
+                         ('changes', {'changed': [{'name': 'b', 'state': 2}], 'removed': []}))
+        self.assertEqual(self.subscription.next_event(0.01), '')
+
+    @patch('livestatus_service.changes.LivestatusSocket')
+    def test_should_wait_for_state_changes_after_first_fetch(self, livestatus_socket):
+        livestatus_socket.return_value.send_query_and_receive_json_answer.return_value = [['a', 0]]
+
+        rows = self.watcher.fetch(wait=True)
+
+        self.assertEqual(rows, {('a',): {'name': 'a', 'state': 0}})
+        self.assertFalse(livestatus_socket.return_value.measured)
+        livestatus_socket.return_value.send_query_and_receive_json_answer.assert_called_with(
+            'GET hosts\nColumns: name state\nWaitTrigger: state\nWaitTimeout: 10000', auth=None)
+
+
+class ChangeFeedTests(unittest.TestCase):
+
+    def setUp(self):
+        self.feed = ChangeFeed(max_subscribers=2)
+
+    def tearDown(self):
+        for watcher in list(self.feed._watchers.values()):
+            watcher.stopped = True
+
+    @patch('livestatus_service.changes.Watcher.fetch')
+    def test_should_share_one_watcher_between_subscribers(self, fetch):
+        fetch.return_value = {('a',): {'name': 'a'}}
+
+        first_subscription = self.feed.subscribe('GET hosts\nColumns: name', '/path/to/socket')
+        second_subscription = self.feed.subscribe('GET hosts\nColumns: name', '/path/to/socket')
+
+        self.assertEqual(len(self.feed._watchers), 1)
+        self.assertEqual(parse_event(first_subscription.next_event(1))[0], 'snapshot')
+        self.assertEqual(parse_event(second_subscription.next_event(1))[0], 'snapshot')
+
+    @patch('livestatus_service.changes.Watcher.fetch')
+    def test_should_reject_subscribers_above_maximum(self, fetch):
+        fetch.return_value = {}
+        self.feed.subscribe('GET hosts', '/path/to/socket')
+        self.feed.subscribe('GET services', '/path/to/socket')
+
+        self.assertRaises(TooManySubscribersException, self.feed.subscribe, 'GET hosts', '/path/to/socket')
+
+    @patch('livestatus_service.changes.Watcher.fetch')
+    def test_should_stop_watcher_without_subscribers(self, fetch):
+        fetch.return_value = {}
+        subscription = self.feed.subscribe('GET hosts', '/path/to/socket')
+        watcher = self.feed._watchers[subscription.watch_key]
+
+        self.feed.unsubscribe(subscription)
+
+        self.assertTrue(watcher.stopped)
+        self.assertEqual(self.feed._watchers, {})
+        self.assertEqual(self.feed.subscribers, 0)
+
+    def test_should_unsubscribe_when_stream_is_closed(self):
+        subscription = Subscription('key')
+        subscription.publish(format_event('snapshot', []))
+        stream = self.feed.stream(subscription, heartbeat_interval=0.01)
+
+        self.assertEqual(next(stream), 'event: snapshot\ndata: []\n\n')
+        self.assertEqual(next(stream), ': keepalive\n\n')
+        stream.close()
+
+        self.assertTrue(subscription.closed)
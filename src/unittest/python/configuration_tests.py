@@ -23,6 +23,7 @@ THE SOFTWARE.
 '''
 
 from mock import patch, call
+import logging
 import tempfile
 import unittest
 
@@ -106,6 +107,133 @@ class ConfigurationTests(unittest.TestCase):
             config = Configuration(configuration_file.name)
             self.assertEqual(config.icinga_command_file, "foo/bar.cmd")
 
+    def test_should_return_default_icinga_command_writer_settings(self):
+        with tempfile.NamedTemporaryFile() as configuration_file:
+            configuration_file.write(b"[livestatus-service]\n")
+            configuration_file.flush()
+            config = Configuration(configuration_file.name)
+            self.assertEqual(config.icinga_command_writer, 'blocking')
+            self.assertEqual(config.icinga_command_queue_size, Configuration.DEFAULT_ICINGA_COMMAND_QUEUE_SIZE)
+            self.assertEqual(config.icinga_command_timeout, Configuration.DEFAULT_ICINGA_COMMAND_TIMEOUT)
+
+    def test_should_return_configured_icinga_command_writer_settings(self):
+        with tempfile.NamedTemporaryFile() as configuration_file:
+            configuration_file.write(b"[livestatus-service]\nicinga_command_writer=queued\n"
+                                     b"icinga_command_queue_size=10\nicinga_command_timeout=2.5")
+            configuration_file.flush()
+            config = Configuration(configuration_file.name)
+            self.assertEqual(config.icinga_command_writer, 'queued')
+            self.assertEqual(config.icinga_command_queue_size, 10)
+            self.assertEqual(config.icinga_command_timeout, 2.5)
+
+    def test_should_raise_exception_when_integer_option_is_not_an_integer(self):
+        with tempfile.NamedTemporaryFile() as configuration_file:
+            configuration_file.write(b"[livestatus-service]\nicinga_command_queue_size=many")
+            configuration_file.flush()
+            config = Configuration(configuration_file.name)
+            self.assertRaises(ValueError, lambda: config.icinga_command_queue_size)
+
+    def test_should_not_return_command_journal_when_none_is_configured(self):
+        with tempfile.NamedTemporaryFile() as configuration_file:
+            configuration_file.write(b"[livestatus-service]\n")
+            configuration_file.flush()
+            config = Configuration(configuration_file.name)
+            self.assertEqual(config.command_journal, None)
+
+    def test_should_return_configured_command_journal(self):
+        with tempfile.NamedTemporaryFile() as configuration_file:
+            configuration_file.write(b"[livestatus-service]\ncommand_journal=/var/spool/livestatus/commands.journal")
+            configuration_file.flush()
+            config = Configuration(configuration_file.name)
+            self.assertEqual(config.command_journal, "/var/spool/livestatus/commands.journal")
+
+    def test_should_return_configured_command_deduplication(self):
+        with tempfile.NamedTemporaryFile() as configuration_file:
+            configuration_file.write(b"[livestatus-service]\ncommand_dedup_window=30\ncommand_dedup_ignore=time, comment")
+            configuration_file.flush()
+            config = Configuration(configuration_file.name)
+            self.assertEqual(config.command_dedup_window, 30)
+            self.assertEqual(config.command_dedup_ignore, ['time', 'comment'])
+
+    def test_should_return_info_log_level_by_default(self):
+        with tempfile.NamedTemporaryFile() as configuration_file:
+            configuration_file.write(b"[livestatus-service]\n")
+            configuration_file.flush()
+            config = Configuration(configuration_file.name)
+            self.assertEqual(config.log_level, logging.INFO)
+
+    def test_should_return_configured_log_level(self):
+        with tempfile.NamedTemporaryFile() as configuration_file:
+            configuration_file.write(b"[livestatus-service]\nlog_level=debug")
+            configuration_file.flush()
+            config = Configuration(configuration_file.name)
+            self.assertEqual(config.log_level, logging.DEBUG)
+
+    def test_should_raise_exception_for_unknown_log_level(self):
+        with tempfile.NamedTemporaryFile() as configuration_file:
+            configuration_file.write(b"[livestatus-service]\nlog_level=chatty")
+            configuration_file.flush()
+            config = Configuration(configuration_file.name)
+            self.assertRaises(ValueError, lambda: config.log_level)
+
+    def test_should_return_configured_slow_query_settings(self):
+        with tempfile.NamedTemporaryFile() as configuration_file:
+            configuration_file.write(b"[livestatus-service]\nslow_query_threshold=0.25\nslow_query_fingerprints=50")
+            configuration_file.flush()
+            config = Configuration(configuration_file.name)
+            self.assertEqual(config.slow_query_threshold, 0.25)
+            self.assertEqual(config.slow_query_log_interval, 300.0)
+            self.assertEqual(config.slow_query_fingerprints, 50)
+
+    def test_should_return_configured_traffic_recording(self):
+        with tempfile.NamedTemporaryFile() as configuration_file:
+            configuration_file.write(b"[livestatus-service]\ntraffic_recording=/var/log/livestatus-traffic.log")
+            configuration_file.flush()
+            config = Configuration(configuration_file.name)
+            self.assertEqual(config.traffic_recording, '/var/log/livestatus-traffic.log')
+            self.assertEqual(config.change_feed_subscribers, 20)
+
+    def test_should_return_configured_snapshot_settings(self):
+        with tempfile.NamedTemporaryFile() as configuration_file:
+            configuration_file.write(b"[livestatus-service]\nsnapshot_tables=hosts, services\nsnapshot_refresh_interval=5")
+            configuration_file.flush()
+            config = Configuration(configuration_file.name)
+            self.assertEqual(config.snapshot_tables, ['hosts', 'services'])
+            self.assertEqual(config.snapshot_refresh_interval, 5.0)
+            self.assertEqual(config.snapshot_reload_interval, 300.0)
+
+    def test_should_return_configured_shared_cache(self):
+        with tempfile.NamedTemporaryFile() as configuration_file:
+            configuration_file.write(b"[livestatus-service]\nshared_cache=/dev/shm/livestatus-service.cache\nshared_cache_ttl=2")
+            configuration_file.flush()
+            config = Configuration(configuration_file.name)
+            self.assertEqual(config.shared_cache, '/dev/shm/livestatus-service.cache')
+            self.assertEqual(config.shared_cache_size, 67108864)
+            self.assertEqual(config.shared_cache_ttl, 2.0)
+            self.assertEqual(config.shared_cache_auth_ttl, 60.0)
+            self.assertEqual(config.shared_cache_max_stale, 30.0)
+
+    def test_should_return_configured_query_max_age_per_table(self):
+        with tempfile.NamedTemporaryFile() as configuration_file:
+            configuration_file.write(b"[livestatus-service]\nquery_max_age=hosts=30, services = 10")
+            configuration_file.flush()
+            config = Configuration(configuration_file.name)
+            self.assertEqual(config.query_max_age, {'hosts': 30, 'services': 10})
+
+    def test_should_raise_exception_for_invalid_query_max_age(self):
+        with tempfile.NamedTemporaryFile() as configuration_file:
+            configuration_file.write(b"[livestatus-service]\nquery_max_age=hosts:30")
+            configuration_file.flush()
+            config = Configuration(configuration_file.name)
+            self.assertRaises(ValueError, lambda: config.query_max_age)
+
+    def test_should_not_snapshot_tables_by_default(self):
+        with tempfile.NamedTemporaryFile() as configuration_file:
+            configuration_file.write(b"[livestatus-service]\n")
+            configuration_file.flush()
+            config = Configuration(configuration_file.name)
+            self.assertEqual(config.snapshot_tables, [])
+
 
 class ConfigurationLoadingTests(unittest.TestCase):
 
@@ -0,0 +1,84 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from mock import patch
+import threading
+import unittest
+
+from livestatus_service.deduplication import CommandDeduplicator
+
+
+class CommandDeduplicatorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.deduplicator = CommandDeduplicator()
+
+    def test_should_claim_new_commands(self):
+        self.assertEqual(self.deduplicator.claim('FOO;bar', 'ftp', 10), (False, None))
+
+    def test_should_report_duplicates_with_the_first_contact(self):
+        self.deduplicator.claim('FOO;bar', 'ftp', 10)
+        self.deduplicator.confirm('FOO;bar')
+
+        self.assertEqual(self.deduplicator.claim('FOO;bar', 'admin', 10), (True, 'ftp'))
+
+    @patch('livestatus_service.deduplication.time.time')
+    def test_should_claim_commands_again_after_the_window(self, mock_time):
+        mock_time.return_value = 100
+        self.deduplicator.claim('FOO;bar', 'ftp', 10)
+        self.deduplicator.confirm('FOO;bar')
+
+        mock_time.return_value = 110
+
+        self.assertEqual(self.deduplicator.claim('FOO;bar', 'admin', 10), (False, None))
+
+    def test_should_claim_released_commands_again(self):
+        self.deduplicator.claim('FOO;bar', 'ftp', 10)
+        self.deduplicator.release('FOO;bar')
+
+        self.assertEqual(self.deduplicator.claim('FOO;bar', 'admin', 10), (False, None))
+
+    def test_should_coalesce_with_commands_in_progress_once_they_succeeded(self):
+        self.deduplicator.claim('FOO;bar', 'ftp', 10)
+        results = []
+        duplicate = threading.Thread(target=lambda: results.append(self.deduplicator.claim('FOO;bar', 'admin', 10)))
+        duplicate.start()
+
+        duplicate.join(0.1)
+        self.assertEqual(results, [])
+        self.deduplicator.confirm('FOO;bar')
+        duplicate.join(5)
+
+        self.assertEqual(results, [(True, 'ftp')])
+
+    def test_should_claim_commands_in_progress_again_when_they_failed(self):
+        self.deduplicator.claim('FOO;bar', 'ftp', 10)
+        results = []
+        duplicate = threading.Thread(target=lambda: results.append(self.deduplicator.claim('FOO;bar', 'admin', 10)))
+        duplicate.start()
+
+        self.deduplicator.release('FOO;bar')
+        duplicate.join(5)
+
+        self.assertEqual(results, [(False, None)])
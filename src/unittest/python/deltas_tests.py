@@ -0,0 +1,157 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from mock import patch
+import simplejson as json
+import unittest
+
+from livestatus_service.deltas import DeltaTracker, KeyTimeline, changed_rows_query, keys_query
+
+
+class DeltaQueryTests(unittest.TestCase):
+
+    def test_should_append_change_filters(self):
+        self.assertEqual(changed_rows_query('GET hosts\nFilter: state = 1', 1400000000.5),
+                         'GET hosts\nFilter: state = 1\n'
+                         'Filter: last_check >= 1400000000\n'
+                         'Filter: last_state_change >= 1400000000\n'
+                         'Filter: last_hard_state_change >= 1400000000\n'
+                         'Or: 3')
+
+    def test_should_replace_columns_with_key_columns(self):
+        self.assertEqual(keys_query('GET services\nColumns: state host_name description\nFilter: state = 1', ['host_name', 'description']),
+                         'GET services\nColumns: host_name description\nFilter: state = 1')
+
+
+class KeyTimelineTests(unittest.TestCase):
+
+    def test_should_track_inserted_and_removed_keys(self):
+        timeline = KeyTimeline([('a',), ('b',)], 100)
+
+        timeline.observe([('b',), ('c',)], 200, retention=3600)
+
+        self.assertTrue(timeline.inserted_since(('c',), 150))
+        self.assertFalse(timeline.inserted_since(('b',), 150))
+        self.assertEqual(timeline.removed_since(150), [['a']])
+        self.assertEqual(timeline.removed_since(250), [])
+
+    def test_should_ignore_observations_older_than_the_last_one(self):
+        timeline = KeyTimeline([('a',)], 200)
+
+        timeline.observe([], 100, retention=3600)
+
+        self.assertEqual(timeline.removed_since(0), [])
+
+    def test_should_forget_removed_keys_after_retention(self):
+        timeline = KeyTimeline([('a',)], 100)
+        timeline.observe([], 200, retention=3600)
+
+        timeline.observe([], 5000, retention=3600)
+
+        self.assertEqual(timeline.removed_since(0), [])
+        self.assertFalse(timeline.covers(1000, 5000, retention=3600))
+        self.assertTrue(timeline.covers(2000, 5000, retention=3600))
+
+
+class DeltaTrackerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tracker = DeltaTracker()
+        self.answers = {}
+
+    def fetch_answer(self, query, socket_path, auth=None):
+        for query_start, answer in self.answers.items():
+            if query.startswith(query_start):
+                return answer
+        raise AssertionError('unexpected query {0!r}'.format(query))
+
+    def test_should_raise_exception_for_other_tables(self):
+        self.assertRaises(ValueError, self.tracker.perform_delta_query, 'GET downtimes', '/path/to/socket', 0)
+
+    @patch('livestatus_service.deltas.time.time')
+    @patch('livestatus_service.deltas.fetch_answer')
+    def test_should_answer_first_delta_with_all_rows(self, fetch_answer, now):
+        fetch_answer.side_effect = self.fetch_answer
+        now.return_value = 1000.5
+        self.answers['GET hosts\nColumns: name\n'] = [['a'], ['b']]
+        self.answers['GET hosts\nColumns: name'] = [['a'], ['b']]
+        self.answers['GET hosts\nColumns: state name'] = [[0, 'a'], [1, 'b']]
+
+        delta = json.loads(self.tracker.perform_delta_query('GET hosts\nColumns: state', '/path/to/socket', 0))
+
+        self.assertEqual(delta, {'high_water_mark': 1000,
+                                 'full': True,
+                                 'inserted': [{'state': 0, 'name': 'a'}, {'state': 1, 'name': 'b'}],
+                                 'changed': [],
+                                 'removed': []})
+
+    @patch('livestatus_service.deltas.time.time')
+    @patch('livestatus_service.deltas.fetch_answer')
+    def test_should_answer_later_deltas_with_inserted_changed_and_removed_rows(self, fetch_answer, now):
+        fetch_answer.side_effect = self.fetch_answer
+        now.return_value = 1000
+        self.answers['GET hosts\nColumns: name'] = [['a'], ['b']]
+        self.answers['GET hosts\nColumns: state name'] = [[0, 'a'], [0, 'b']]
+        self.tracker.perform_delta_query('GET hosts\nColumns: state', '/path/to/socket', 0)
+
+        now.return_value = 1100
+        self.answers = {'GET hosts\nColumns: name': [['a'], ['c']],
+                        'GET hosts\nColumns: state name\nFilter: last_check >= 1000': [[2, 'a'], [0, 'c']]}
+        delta = json.loads(self.tracker.perform_delta_query('GET hosts\nColumns: state', '/path/to/socket', 1000))
+
+        self.assertEqual(delta, {'high_water_mark': 1100,
+                                 'full': False,
+                                 'inserted': [{'state': 0, 'name': 'c'}],
+                                 'changed': [{'state': 2, 'name': 'a'}],
+                                 'removed': [['b']]})
+
+    @patch('livestatus_service.deltas.time.time')
+    @patch('livestatus_service.deltas.fetch_answer')
+    def test_should_answer_delta_since_high_water_mark_of_first_answer(self, fetch_answer, now):
+        fetch_answer.side_effect = self.fetch_answer
+        now.return_value = 1000.5
+        self.answers['GET hosts\nColumns: name'] = [['a']]
+        self.answers['GET hosts\nColumns: state name'] = [[0, 'a']]
+        high_water_mark = json.loads(self.tracker.perform_delta_query('GET hosts\nColumns: state', '/path/to/socket', 0))['high_water_mark']
+
+        now.return_value = 1010.5
+        self.answers = {'GET hosts\nColumns: name': [['a']],
+                        'GET hosts\nColumns: state name\nFilter: last_check >= 1000': [[1, 'a']]}
+        delta = json.loads(self.tracker.perform_delta_query('GET hosts\nColumns: state', '/path/to/socket', high_water_mark))
+
+        self.assertEqual(delta, {'high_water_mark': 1010,
+                                 'full': False,
+                                 'inserted': [],
+                                 'changed': [{'state': 1, 'name': 'a'}],
+                                 'removed': []})
+
+    @patch('livestatus_service.deltas.fetch_answer')
+    def test_should_keep_timelines_of_most_recent_queries_only(self, fetch_answer):
+        fetch_answer.return_value = []
+        tracker = DeltaTracker(max_queries=1)
+
+        tracker.perform_delta_query('GET hosts\nColumns: name', '/path/to/socket', 0)
+        tracker.perform_delta_query('GET services\nColumns: host_name description', '/path/to/socket', 0)
+
+        self.assertEqual([timeline_key[0] for timeline_key in tracker._timelines], ['GET services\nColumns: host_name description'])
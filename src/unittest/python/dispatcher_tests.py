@@ -23,9 +23,17 @@ THE SOFTWARE.
 '''
 
 from mock import patch, Mock
+import simplejson as json
 import unittest
 
-from livestatus_service.dispatcher import perform_command, perform_query, check_contact_permissions, check_auth_contactgroup_cmds
+from livestatus_service.dispatcher import (perform_command, perform_query, check_contact_permissions, check_auth_contactgroup_cmds,
+                                           check_contact_permissions_in_bulk, perform_mass_command, submit_commands,
+                                           submit_command_job, execute_command_jobs, replay_journaled_commands,
+                                           subscribe_to_changes, perform_join_query,
+                                           perform_analytics, PermissionDeniedException)
+from livestatus_service.livestatus import LivestatusSocketUnavailableException
+from livestatus_service.deduplication import CommandDeduplicator
+from livestatus_service.jobs import CommandJob
 
 
 class DispatcherTests(unittest.TestCase):
@@ -34,6 +42,8 @@ class DispatcherTests(unittest.TestCase):
     @patch('livestatus_service.dispatcher.perform_livestatus_command')
     def test_perform_command_should_dispatch_to_livestatus_if_handler_is_livestatus(self, cmd, current_config):
         mock_config = Mock()
+        mock_config.command_journal = None
+        mock_config.command_dedup_window = 0
         mock_config.livestatus_socket = '/path/to/socket'
         mock_config.admins = ["admin"]
         current_config.return_value = mock_config
@@ -46,6 +56,8 @@ class DispatcherTests(unittest.TestCase):
     @patch('livestatus_service.dispatcher.perform_icinga_command')
     def test_perform_command_should_dispatch_to_icinga_if_handler_is_icinga(self, cmd, current_config):
         mock_config = Mock()
+        mock_config.command_journal = None
+        mock_config.command_dedup_window = 0
         mock_config.icinga_command_file = '/path/to/commandfile.cmd'
         mock_config.admins = ["admin"]
         current_config.return_value = mock_config
@@ -54,9 +66,28 @@ class DispatcherTests(unittest.TestCase):
 
         cmd.assert_called_with('FOO;bar', '/path/to/commandfile.cmd', None, auth='admin')
 
+    @patch('livestatus_service.dispatcher.get_current_configuration')
+    @patch('livestatus_service.dispatcher.perform_queued_icinga_commands')
+    def test_perform_command_should_use_queued_icinga_writer_if_configured(self, cmds, current_config):
+        mock_config = Mock()
+        mock_config.command_journal = None
+        mock_config.command_dedup_window = 0
+        mock_config.icinga_command_file = '/path/to/commandfile.cmd'
+        mock_config.icinga_command_writer = 'queued'
+        mock_config.icinga_command_queue_size = 10
+        mock_config.icinga_command_timeout = 2.5
+        mock_config.admins = ["admin"]
+        current_config.return_value = mock_config
+
+        perform_command('FOO;bar', key=None, handler='icinga', auth="admin")
+
+        cmds.assert_called_with(['FOO;bar'], '/path/to/commandfile.cmd', 10, 2.5)
+
     @patch('livestatus_service.dispatcher.get_current_configuration')
     def test_perform_command_should_raise_exception_when_handler_does_not_exist(self, current_config):
         mock_config = Mock()
+        mock_config.command_journal = None
+        mock_config.command_dedup_window = 0
         current_config.return_value = mock_config
         self.assertRaises(BaseException, perform_command, 'FOO;bar', None, 'mylittlepony')
 
@@ -76,7 +107,7 @@ class DispatcherTests(unittest.TestCase):
 
         perform_query('FOO;bar', key=None, handler='livestatus', auth='user')
 
-        query.assert_called_with('FOO;bar', '/path/to/socket', None, auth='user')
+        query.assert_called_with('FOO;bar', '/path/to/socket', None, auth='user', perf_data=None)
 
     @patch('livestatus_service.dispatcher.get_current_configuration')
     @patch('livestatus_service.dispatcher.perform_livestatus_query')
@@ -88,7 +119,7 @@ class DispatcherTests(unittest.TestCase):
 
         perform_query('FOO;bar', key=None, handler='livestatus')
 
-        query.assert_called_with('FOO;bar', '/path/to/socket', None, auth=None)
+        query.assert_called_with('FOO;bar', '/path/to/socket', None, auth=None, perf_data=None)
 
     @patch('livestatus_service.dispatcher.get_current_configuration')
     @patch('livestatus_service.dispatcher.perform_livestatus_query')
@@ -100,13 +131,178 @@ class DispatcherTests(unittest.TestCase):
 
         perform_query('FOO;bar', key=None, handler='livestatus', auth="admin")
 
-        query.assert_called_with('FOO;bar', '/path/to/socket', None, auth=None)
+        query.assert_called_with('FOO;bar', '/path/to/socket', None, auth=None, perf_data=None)
+
+    @patch('livestatus_service.dispatcher.get_current_configuration')
+    @patch('livestatus_service.dispatcher.DELTA_TRACKER')
+    def test_perform_query_should_perform_delta_query_when_since_is_given(self, delta_tracker, current_config):
+        current_config.return_value.livestatus_socket = '/path/to/socket'
+        current_config.return_value.admins = []
+
+        perform_query('GET hosts', auth='user', since=1400000000)
+
+        delta_tracker.perform_delta_query.assert_called_with('GET hosts', '/path/to/socket', 1400000000, None, auth='user')
+
+    @patch('livestatus_service.dispatcher.get_current_configuration')
+    @patch('livestatus_service.dispatcher.perform_livestatus_query')
+    @patch('livestatus_service.dispatcher.SNAPSHOTS')
+    def test_perform_query_should_answer_from_snapshot_when_possible(self, snapshots, query, current_config):
+        current_config.return_value.livestatus_socket = '/path/to/socket'
+        current_config.return_value.admins = []
+        snapshots.answer.return_value = [['alpha', 0]]
+
+        answer = perform_query('GET hosts\nColumns: name state', key='name', auth='user')
+
+        snapshots.answer.assert_called_with('GET hosts\nColumns: name state', 'user')
+        self.assertEqual(json.loads(answer), {'alpha': {'name': 'alpha', 'state': 0}})
+        self.assertFalse(query.called)
+
+    @patch('livestatus_service.dispatcher.get_current_configuration')
+    @patch('livestatus_service.dispatcher.DELTA_TRACKER')
+    def test_perform_query_should_not_parse_perf_data_of_delta_queries(self, delta_tracker, current_config):
+        current_config.return_value.admins = []
+
+        self.assertRaises(ValueError, perform_query, 'GET services\nColumns: perf_data', since=1000.0, perf_data='structured')
+        self.assertFalse(delta_tracker.perform_delta_query.called)
+
+    @patch('livestatus_service.dispatcher.get_current_configuration')
+    @patch('livestatus_service.dispatcher.perform_livestatus_query')
+    @patch('livestatus_service.dispatcher.SHARED_CACHE')
+    def test_perform_query_should_answer_from_shared_cache(self, shared_cache, query, current_config):
+        current_config.return_value.admins = []
+        shared_cache.get_entry.return_value = (b'[["alpha"]]', 2.0, True)
+
+        answer = perform_query('GET hosts\nColumns: name', auth='user')
+
+        shared_cache.get_entry.assert_called_with(json.dumps(['query', 'GET hosts\nColumns: name', None, 'user', None]))
+        self.assertEqual(answer, '[["alpha"]]')
+        self.assertFalse(query.called)
+        self.assertFalse(shared_cache.claim.called)
+
+    @patch('livestatus_service.dispatcher.get_current_configuration')
+    @patch('livestatus_service.dispatcher.perform_livestatus_query')
+    @patch('livestatus_service.dispatcher.SHARED_CACHE')
+    def test_perform_query_should_serve_stale_answer_and_refresh_it_in_background(self, shared_cache, query, current_config):
+        current_config.return_value.admins = []
+        current_config.return_value.livestatus_socket = '/path/to/socket'
+        shared_cache.get_entry.return_value = (b'[["alpha"]]', 7.0, False)
+        shared_cache.claim.return_value = True
+        shared_cache.max_stale = 30.0
+        query.return_value = '[["beta"]]'
+        cache_key = json.dumps(['query', 'GET hosts\nColumns: name', None, 'user', None])
+
+        with patch('livestatus_service.dispatcher.threading.Thread') as thread:
+            answer = perform_query('GET hosts\nColumns: name', auth='user')
+            self.assertEqual(answer, '[["alpha"]]')
+            self.assertFalse(query.called)
+            thread.return_value.start.assert_called_with()
+            thread.call_args[1]['target'](*thread.call_args[1]['args'])
+
+        shared_cache.claim.assert_called_with(cache_key, 60.0)
+        query.assert_called_with('GET hosts\nColumns: name', '/path/to/socket', None, auth='user', perf_data=None)
+        shared_cache.put.assert_called_with(cache_key, b'[["beta"]]', max_stale=30.0)
+        shared_cache.release.assert_called_with(cache_key)
+
+    @patch('livestatus_service.dispatcher.get_current_configuration')
+    @patch('livestatus_service.dispatcher.SHARED_CACHE')
+    def test_perform_query_should_not_refresh_stale_answer_claimed_by_another_process(self, shared_cache, current_config):
+        current_config.return_value.admins = []
+        shared_cache.get_entry.return_value = (b'[["alpha"]]', 7.0, False)
+        shared_cache.claim.return_value = False
+
+        with patch('livestatus_service.dispatcher.threading.Thread') as thread:
+            self.assertEqual(perform_query('GET hosts\nColumns: name', auth='user'), '[["alpha"]]')
+
+        self.assertFalse(thread.called)
+
+    @patch('livestatus_service.dispatcher.get_current_configuration')
+    @patch('livestatus_service.dispatcher.perform_livestatus_query')
+    @patch('livestatus_service.dispatcher.SHARED_CACHE')
+    def test_perform_query_should_share_answers_of_livestatus(self, shared_cache, query, current_config):
+        current_config.return_value.admins = ['admin']
+        shared_cache.get_entry.return_value = None
+        shared_cache.max_stale = 30.0
+        query.return_value = '[["alpha"]]'
+
+        perform_query('GET hosts\nColumns: name', auth='admin')
+
+        shared_cache.put.assert_called_with(json.dumps(['query', 'GET hosts\nColumns: name', None, None, None]), b'[["alpha"]]',
+                                            max_stale=30.0)
+
+    @patch('livestatus_service.dispatcher.get_current_configuration')
+    @patch('livestatus_service.dispatcher.join_hosts_with_services')
+    def test_perform_join_query_should_join_for_admins_without_auth(self, join, current_config):
+        current_config.return_value.livestatus_socket = '/path/to/socket'
+        current_config.return_value.admins = ['admin']
+
+        perform_join_query(['name'], ['description'], service_filter='Filter: state = 2', key='name', auth='admin')
+
+        join.assert_called_with(['name'], ['description'], '', 'Filter: state = 2', '/path/to/socket', 'name', None)
+
+    @patch('livestatus_service.dispatcher.get_current_configuration')
+    @patch('livestatus_service.dispatcher.fetch_raw_answer')
+    def test_perform_analytics_should_return_aggregates_of_fetched_columns(self, fetch, current_config):
+        current_config.return_value.livestatus_socket = '/path/to/socket'
+        current_config.return_value.admins = []
+        fetch.return_value = [[0], [2], [0]]
+
+        answer = perform_analytics('GET services\nFilter: host_name = alpha', auth='user', group_by=['state'])
+
+        fetch.assert_called_with('GET services\nFilter: host_name = alpha\nColumns: state', '/path/to/socket', 'user')
+        self.assertEqual(json.loads(answer), {'rows': 3, 'groups': [{'state': 0, 'count': 2}, {'state': 2, 'count': 1}]})
+
+    @patch('livestatus_service.dispatcher.get_current_configuration')
+    def test_perform_join_query_should_raise_exception_for_icinga_handler(self, current_config):
+        current_config.return_value.admins = []
+
+        self.assertRaises(ValueError, perform_join_query, ['name'], ['description'], handler='icinga')
+
+    @patch('livestatus_service.dispatcher.get_current_configuration')
+    @patch('livestatus_service.dispatcher.CHANGE_FEED')
+    def test_subscribe_to_changes_should_subscribe_admins_without_auth(self, change_feed, current_config):
+        current_config.return_value.livestatus_socket = '/path/to/socket'
+        current_config.return_value.admins = ['admin']
+
+        subscribe_to_changes('GET hosts', key='name', auth='admin')
+
+        change_feed.subscribe.assert_called_with('GET hosts', '/path/to/socket', 'name', None)
+
+    @patch('livestatus_service.dispatcher.get_current_configuration')
+    def test_subscribe_to_changes_should_raise_exception_for_icinga_handler(self, current_config):
+        current_config.return_value.admins = []
+
+        self.assertRaises(ValueError, subscribe_to_changes, 'GET hosts', handler='icinga')
 
     @patch('livestatus_service.dispatcher.check_auth_contactgroup_cmds')
     def test_check_contact_permissions_should_call_cmd_group_check_function(self, check_func):
         check_contact_permissions("DISABLE_CONTACTGROUP_HOST_NOTIFICATIONS;contactgroup", "admin")
         check_func.assert_called_with("admin", "contactgroup")
 
+    @patch('livestatus_service.dispatcher.tracing.span')
+    @patch('livestatus_service.dispatcher.check_auth_contactgroup_cmds')
+    def test_check_contact_permissions_should_trace_cmd_group_check_function(self, check_func, span):
+        check_contact_permissions("DISABLE_CONTACTGROUP_HOST_NOTIFICATIONS;contactgroup", "ftp")
+        span.assert_called_with('check_auth_contactgroup_cmds', auth='ftp', target='contactgroup')
+
+    @patch('livestatus_service.dispatcher.SHARED_CACHE')
+    @patch('livestatus_service.dispatcher.check_auth_contactgroup_cmds')
+    def test_check_contact_permissions_should_use_shared_permissions(self, check_func, shared_cache):
+        shared_cache.get.return_value = b'0'
+
+        self.assertRaises(ValueError, check_contact_permissions, "DISABLE_CONTACTGROUP_HOST_NOTIFICATIONS;contactgroup", "ftp")
+        self.assertFalse(check_func.called)
+
+    @patch('livestatus_service.dispatcher.SHARED_CACHE')
+    @patch('livestatus_service.dispatcher.check_auth_contactgroup_cmds')
+    def test_check_contact_permissions_should_share_checked_permissions(self, check_func, shared_cache):
+        shared_cache.get.return_value = None
+        shared_cache.auth_ttl = 60.0
+        check_func.return_value = True
+
+        check_contact_permissions("DISABLE_CONTACTGROUP_HOST_NOTIFICATIONS;contactgroup", "ftp")
+
+        shared_cache.put.assert_called_with(json.dumps(['auth', 'check_auth_contactgroup_cmds', 'ftp', 'contactgroup']), b'1', 60.0)
+
     @patch('livestatus_service.dispatcher.check_auth_contactgroup_cmds')
     def test_check_contact_permissions_no_existant_command_should_raise_exception(self, check_func):
         self.assertRaises(NameError, check_contact_permissions, "NO_EXISTANT_COMMAND;contactgroup", "admin")
@@ -128,6 +324,8 @@ class DispatcherTests(unittest.TestCase):
     @patch('livestatus_service.dispatcher.perform_livestatus_command')
     def test_perform_command_should_call_check_contact_permissions_if_not_admin(self, cmd, current_config, perm):
         mock_config = Mock()
+        mock_config.command_journal = None
+        mock_config.command_dedup_window = 0
         mock_config.livestatus_socket = '/path/to/socket'
         mock_config.admins = ["admin"]
         current_config.return_value = mock_config
@@ -141,6 +339,8 @@ class DispatcherTests(unittest.TestCase):
     @patch('livestatus_service.dispatcher.perform_livestatus_command')
     def test_perform_command_should_call_check_contact_permissions_if_admin(self, cmd, current_config, perm):
         mock_config = Mock()
+        mock_config.command_journal = None
+        mock_config.command_dedup_window = 0
         mock_config.livestatus_socket = '/path/to/socket'
         mock_config.admins = ["admin"]
         current_config.return_value = mock_config
@@ -148,3 +348,356 @@ class DispatcherTests(unittest.TestCase):
         perform_command('FOO;bar', None, handler='livestatus', auth="admin")
 
         self.assertFalse(perm.called)
+
+    @patch('livestatus_service.dispatcher.check_contact_permissions')
+    def test_check_contact_permissions_in_bulk_should_check_every_target_once(self, perm):
+        check_contact_permissions_in_bulk(["ACKNOWLEDGE_HOST_PROBLEM;devica01;1;1;1;ftp;down",
+                                           "SCHEDULE_HOST_CHECK;devica01;0",
+                                           "ACKNOWLEDGE_HOST_PROBLEM;tuvdbs05;1;1;1;ftp;down"], "ftp")
+
+        self.assertEqual([c[0][0] for c in perm.call_args_list],
+                         ["ACKNOWLEDGE_HOST_PROBLEM;devica01;1;1;1;ftp;down",
+                          "ACKNOWLEDGE_HOST_PROBLEM;tuvdbs05;1;1;1;ftp;down"])
+
+
+class MassCommandTests(unittest.TestCase):
+
+    def setUp(self):
+        self.config_patcher = patch('livestatus_service.dispatcher.get_current_configuration')
+        mock_config = self.config_patcher.start().return_value
+        mock_config.livestatus_socket = '/path/to/socket'
+        mock_config.icinga_command_file = '/path/to/commandfile.cmd'
+        mock_config.admins = ["admin"]
+
+    def tearDown(self):
+        self.config_patcher.stop()
+
+    @patch('livestatus_service.dispatcher.perform_query')
+    def test_should_add_template_columns_to_selector(self, query):
+        query.return_value = '[]'
+
+        perform_mass_command("SCHEDULE_FORCED_SVC_CHECK;{host_name};{description};0", auth="admin",
+                             selector="GET services\nFilter: state = 2\n", dry_run=True)
+
+        query.assert_called_with("GET services\nFilter: state = 2\nColumns: host_name description", auth="admin")
+
+    @patch('livestatus_service.dispatcher.perform_query')
+    def test_should_extend_existing_columns_of_selector(self, query):
+        query.return_value = '[]'
+
+        perform_mass_command("SCHEDULE_FORCED_SVC_CHECK;{host_name};{description};0", auth="admin",
+                             selector="GET services\nColumns: description state", dry_run=True)
+
+        query.assert_called_with("GET services\nColumns: description state host_name", auth="admin")
+
+    @patch('livestatus_service.dispatcher.perform_livestatus_commands')
+    @patch('livestatus_service.dispatcher.perform_query')
+    def test_dry_run_should_return_expansion_without_submitting(self, query, cmds):
+        query.return_value = '[{"host_name": "devica01"}, {"host_name": "tuvdbs05"}]'
+
+        result = perform_mass_command("SCHEDULE_HOST_CHECK;{host_name};0", auth="admin",
+                                      selector="GET hosts", dry_run=True)
+
+        self.assertEqual(json.loads(result), ["SCHEDULE_HOST_CHECK;devica01;0", "SCHEDULE_HOST_CHECK;tuvdbs05;0"])
+        self.assertFalse(cmds.called)
+
+    @patch('livestatus_service.dispatcher.check_contact_permissions_in_bulk')
+    @patch('livestatus_service.dispatcher.perform_livestatus_commands')
+    @patch('livestatus_service.dispatcher.perform_query')
+    def test_should_check_permissions_and_submit_one_batch(self, query, cmds, perm):
+        query.return_value = '[{"host_name": "devica01"}, {"host_name": "tuvdbs05"}]'
+
+        perform_mass_command("SCHEDULE_HOST_CHECK;{host_name};0", auth="ftp", selector="GET hosts")
+
+        perm.assert_called_with(["SCHEDULE_HOST_CHECK;devica01;0", "SCHEDULE_HOST_CHECK;tuvdbs05;0"], "ftp")
+        cmds.assert_called_with(["SCHEDULE_HOST_CHECK;devica01;0", "SCHEDULE_HOST_CHECK;tuvdbs05;0"],
+                                '/path/to/socket', auth="ftp")
+
+    def test_should_raise_exception_when_selector_is_missing(self):
+        self.assertRaises(ValueError, perform_mass_command, "SCHEDULE_HOST_CHECK;{host_name};0")
+
+    def test_should_raise_exception_when_template_references_no_column(self):
+        self.assertRaises(ValueError, perform_mass_command, "SCHEDULE_HOST_CHECK;devica01;0", selector="GET hosts")
+
+    @patch('livestatus_service.dispatcher.perform_icinga_commands')
+    def test_submit_commands_should_dispatch_to_icinga_if_handler_is_icinga(self, cmds):
+        submit_commands(["FOO;bar", "FOO;baz"], handler='icinga')
+
+        cmds.assert_called_with(["FOO;bar", "FOO;baz"], '/path/to/commandfile.cmd', auth=None)
+
+
+class CommandJobTests(unittest.TestCase):
+
+    def setUp(self):
+        self.config_patcher = patch('livestatus_service.dispatcher.get_current_configuration')
+        mock_config = self.config_patcher.start().return_value
+        mock_config.admins = ["admin"]
+
+    def tearDown(self):
+        self.config_patcher.stop()
+
+    @patch('livestatus_service.dispatcher.get_command_job_executor')
+    def test_should_submit_command_to_executor_and_report_job(self, get_executor):
+        executor = get_executor.return_value
+        executor.submit.return_value = CommandJob('ENABLE_HOST_NOTIFICATIONS;devica01')
+        executor.queue_depth = 1
+        executor.queue_size = 10
+
+        job_status = json.loads(submit_command_job('ENABLE_HOST_NOTIFICATIONS;devica01', auth='ftp'))
+
+        executor.submit.assert_called_with('ENABLE_HOST_NOTIFICATIONS;devica01', auth='ftp', handler=None)
+        self.assertEqual(job_status['status'], CommandJob.QUEUED)
+        self.assertEqual(job_status['queue_depth'], 1)
+
+    def test_should_refuse_unknown_commands(self):
+        self.assertRaises(ValueError, submit_command_job, 'NO_EXISTANT_COMMAND;devica01', auth='ftp')
+
+    def test_should_refuse_unknown_handlers(self):
+        self.assertRaises(ValueError, submit_command_job, 'ENABLE_HOST_NOTIFICATIONS;devica01', handler='mylittlepony')
+
+    @patch('livestatus_service.dispatcher.check_contact_permissions')
+    @patch('livestatus_service.dispatcher.submit_commands')
+    def test_should_submit_permitted_jobs_of_a_contact_at_once(self, submit, perm):
+        perm.side_effect = lambda command, auth: command.endswith('forbidden') and 1 / 0
+        submit.return_value = 'OK'
+        jobs = [CommandJob('ENABLE_HOST_NOTIFICATIONS;devica01', auth='ftp'),
+                CommandJob('ENABLE_HOST_NOTIFICATIONS;forbidden', auth='ftp'),
+                CommandJob('ENABLE_HOST_NOTIFICATIONS;tuvdbs05', auth='ftp')]
+
+        execute_command_jobs(jobs)
+
+        submit.assert_called_once_with(['ENABLE_HOST_NOTIFICATIONS;devica01', 'ENABLE_HOST_NOTIFICATIONS;tuvdbs05'],
+                                       handler=None, auth='ftp')
+        self.assertEqual([job.status for job in jobs], [CommandJob.DONE, CommandJob.FAILED, CommandJob.DONE])
+
+    @patch('livestatus_service.dispatcher.check_contact_permissions')
+    @patch('livestatus_service.dispatcher.submit_commands')
+    def test_should_submit_jobs_of_different_handlers_separately(self, submit, perm):
+        jobs = [CommandJob('ENABLE_HOST_NOTIFICATIONS;devica01', auth='admin'),
+                CommandJob('ENABLE_HOST_NOTIFICATIONS;tuvdbs05', auth='admin', handler='icinga')]
+
+        execute_command_jobs(jobs)
+
+        self.assertEqual(submit.call_count, 2)
+        self.assertFalse(perm.called)
+
+    @patch('livestatus_service.dispatcher.submit_commands')
+    def test_should_fail_jobs_when_submitting_fails(self, submit):
+        submit.side_effect = RuntimeError('socket gone')
+        job = CommandJob('ENABLE_HOST_NOTIFICATIONS;devica01', auth='admin')
+
+        execute_command_jobs([job])
+
+        self.assertEqual((job.status, job.error), (CommandJob.FAILED, 'socket gone'))
+
+
+class CommandJournalingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.config_patcher = patch('livestatus_service.dispatcher.get_current_configuration')
+        self.config = self.config_patcher.start().return_value
+        self.config.admins = ["admin"]
+        self.config.livestatus_socket = '/path/to/socket'
+        self.config.command_journal = '/path/to/journal'
+        self.config.command_dedup_window = 0
+        self.journal_patcher = patch('livestatus_service.dispatcher.get_command_journal')
+        self.journal = self.journal_patcher.start().return_value
+        self.journal.has_pending_commands.return_value = False
+        self.logger_patcher = patch('livestatus_service.dispatcher.LOGGER')
+        self.logger_patcher.start()
+
+    def tearDown(self):
+        self.logger_patcher.stop()
+        self.journal_patcher.stop()
+        self.config_patcher.stop()
+
+    @patch('livestatus_service.dispatcher.perform_livestatus_command')
+    def test_should_deliver_command_when_icinga_is_reachable(self, cmd):
+        cmd.return_value = 'OK'
+
+        self.assertEqual(perform_command('FOO;bar', auth='admin'), 'OK')
+        self.assertFalse(self.journal.append.called)
+
+    @patch('livestatus_service.dispatcher.perform_livestatus_command')
+    def test_should_journal_command_when_icinga_is_unreachable(self, cmd):
+        cmd.side_effect = LivestatusSocketUnavailableException('gone')
+
+        self.assertEqual(perform_command('FOO;bar', auth='admin'), 'QUEUED')
+        self.journal.append.assert_called_with('FOO;bar', auth='admin', handler=None)
+
+    @patch('livestatus_service.dispatcher.perform_livestatus_command')
+    def test_should_journal_command_while_journal_has_pending_commands(self, cmd):
+        self.journal.has_pending_commands.return_value = True
+
+        self.assertEqual(perform_command('FOO;bar', auth='admin'), 'QUEUED')
+        self.assertFalse(cmd.called)
+
+    @patch('livestatus_service.dispatcher.check_contact_permissions')
+    @patch('livestatus_service.dispatcher.perform_livestatus_command')
+    def test_should_journal_permitted_command_of_contact_while_journal_has_pending_commands(self, cmd, perm):
+        self.journal.has_pending_commands.return_value = True
+
+        self.assertEqual(perform_command('ACKNOWLEDGE_HOST_PROBLEM;devica01', auth='ftp'), 'QUEUED')
+        perm.assert_called_with('ACKNOWLEDGE_HOST_PROBLEM;devica01', 'ftp')
+        self.journal.append.assert_called_with('ACKNOWLEDGE_HOST_PROBLEM;devica01', auth='ftp', handler=None)
+
+    @patch('livestatus_service.dispatcher.check_contact_permissions')
+    @patch('livestatus_service.dispatcher.perform_livestatus_command')
+    def test_should_not_journal_forbidden_command_while_journal_has_pending_commands(self, cmd, perm):
+        self.journal.has_pending_commands.return_value = True
+        perm.side_effect = PermissionDeniedException('not allowed')
+
+        self.assertRaises(PermissionDeniedException, perform_command, 'ACKNOWLEDGE_HOST_PROBLEM;devica01', auth='ftp')
+        self.assertFalse(self.journal.append.called)
+
+    @patch('livestatus_service.dispatcher.perform_livestatus_command')
+    def test_should_not_journal_unknown_command_of_contact(self, cmd):
+        self.journal.has_pending_commands.return_value = True
+
+        self.assertRaises(PermissionDeniedException, perform_command, 'FOO;bar', auth='ftp')
+        self.assertFalse(self.journal.append.called)
+
+    @patch('livestatus_service.dispatcher.check_contact_permissions')
+    @patch('livestatus_service.dispatcher.perform_livestatus_command')
+    def test_should_refuse_command_of_contact_when_permission_cannot_be_checked(self, cmd, perm):
+        perm.side_effect = LivestatusSocketUnavailableException('gone')
+
+        self.assertRaises(PermissionDeniedException, perform_command, 'ACKNOWLEDGE_HOST_PROBLEM;devica01', auth='ftp')
+        self.assertFalse(self.journal.append.called)
+
+    def test_should_not_journal_commands_for_unknown_handlers(self):
+        self.assertRaises(ValueError, perform_command, 'FOO;bar', handler='mylittlepony')
+
+    @patch('livestatus_service.dispatcher.perform_livestatus_command')
+    def test_replay_should_stop_when_icinga_is_still_unreachable(self, cmd):
+        cmd.side_effect = [None, LivestatusSocketUnavailableException('gone')]
+        entries = [{'command': 'FOO;1', 'auth': 'admin', 'handler': None},
+                   {'command': 'FOO;2', 'auth': 'admin', 'handler': None}]
+
+        self.assertEqual(replay_journaled_commands(entries), 1)
+
+    @patch('livestatus_service.dispatcher.check_contact_permissions')
+    @patch('livestatus_service.dispatcher.perform_livestatus_command')
+    def test_replay_should_drop_commands_which_are_not_permitted(self, cmd, perm):
+        perm.side_effect = ValueError('not allowed')
+        entries = [{'command': 'FOO;1', 'auth': 'ftp', 'handler': None}]
+
+        self.assertEqual(replay_journaled_commands(entries), 1)
+        self.assertFalse(cmd.called)
+
+
+class CommandDeduplicationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.config_patcher = patch('livestatus_service.dispatcher.get_current_configuration')
+        self.config = self.config_patcher.start().return_value
+        self.config.admins = ["admin"]
+        self.config.livestatus_socket = '/path/to/socket'
+        self.config.command_journal = None
+        self.config.command_dedup_window = 30
+        self.config.command_dedup_ignore = ['time', 'author']
+        self.deduplicator_patcher = patch('livestatus_service.dispatcher.COMMAND_DEDUPLICATOR', CommandDeduplicator())
+        self.deduplicator_patcher.start()
+
+    def tearDown(self):
+        self.deduplicator_patcher.stop()
+        self.config_patcher.stop()
+
+    @patch('livestatus_service.dispatcher.perform_livestatus_command')
+    def test_should_perform_only_the_first_of_identical_commands(self, cmd):
+        cmd.return_value = 'OK'
+
+        first = perform_command('SCHEDULE_FORCED_SVC_CHECK;devica01;ping;1400000000', auth='admin')
+        second = perform_command('SCHEDULE_FORCED_SVC_CHECK;devica01;ping;1400000005', auth='admin')
+
+        self.assertEqual((first, second), ('OK', 'COALESCED'))
+        self.assertEqual(cmd.call_count, 1)
+
+    @patch('livestatus_service.dispatcher.perform_livestatus_command')
+    def test_should_perform_commands_for_different_targets(self, cmd):
+        perform_command('SCHEDULE_FORCED_SVC_CHECK;devica01;ping;1400000000', auth='admin')
+        perform_command('SCHEDULE_FORCED_SVC_CHECK;tuvdbs05;ping;1400000000', auth='admin')
+
+        self.assertEqual(cmd.call_count, 2)
+
+    @patch('livestatus_service.dispatcher.perform_livestatus_command')
+    def test_should_perform_command_again_when_the_first_failed(self, cmd):
+        cmd.side_effect = [RuntimeError('socket gone'), 'OK']
+
+        self.assertRaises(RuntimeError, perform_command, 'ENABLE_HOST_NOTIFICATIONS;devica01', auth='admin')
+        self.assertEqual(perform_command('ENABLE_HOST_NOTIFICATIONS;devica01', auth='admin'), 'OK')
+
+    @patch('livestatus_service.dispatcher.check_contact_permissions')
+    @patch('livestatus_service.dispatcher.perform_livestatus_command')
+    def test_should_not_coalesce_with_commands_that_failed_their_permission_check(self, cmd, perm):
+        perm.side_effect = [ValueError('not allowed'), None]
+        cmd.return_value = 'OK'
+
+        self.assertRaises(ValueError, perform_command, 'ENABLE_HOST_NOTIFICATIONS;devica01', auth='alice')
+        self.assertEqual(perform_command('ENABLE_HOST_NOTIFICATIONS;devica01', auth='alice'), 'OK')
+        self.assertEqual(cmd.call_count, 1)
+
+    @patch('livestatus_service.dispatcher.check_contact_permissions')
+    @patch('livestatus_service.dispatcher.perform_livestatus_command')
+    def test_should_check_permissions_of_other_contacts_before_coalescing(self, cmd, perm):
+        perform_command('ENABLE_HOST_NOTIFICATIONS;devica01', auth='alice')
+        perm.side_effect = ValueError('not allowed')
+
+        self.assertRaises(ValueError, perform_command, 'ENABLE_HOST_NOTIFICATIONS;devica01', auth='mallory')
+        self.assertEqual(cmd.call_count, 1)
+
+    @patch('livestatus_service.dispatcher.check_contact_permissions')
+    @patch('livestatus_service.dispatcher.perform_livestatus_command')
+    def test_should_not_check_permissions_again_for_the_same_contact(self, cmd, perm):
+        perform_command('ENABLE_HOST_NOTIFICATIONS;devica01', auth='alice')
+        perform_command('ENABLE_HOST_NOTIFICATIONS;devica01', auth='alice')
+
+        self.assertEqual(perm.call_count, 1)
+
+
+class DispatchMeasurementTests(unittest.TestCase):
+
+    @patch('livestatus_service.dispatcher.DISPATCH_SECONDS')
+    @patch('livestatus_service.dispatcher.get_current_configuration')
+    @patch('livestatus_service.dispatcher.perform_livestatus_query')
+    def test_should_measure_queries_by_table(self, query, current_config, dispatch_seconds):
+        current_config.return_value.admins = []
+
+        perform_query('GET services\nColumns: host_name', handler='livestatus')
+
+        self.assertEqual(dispatch_seconds.observe.call_args[1],
+                         {'operation': 'query', 'table': 'services', 'handler': 'livestatus', 'outcome': 'ok'})
+
+    @patch('livestatus_service.dispatcher.DISPATCH_SECONDS')
+    @patch('livestatus_service.dispatcher.get_current_configuration')
+    def test_should_measure_failed_commands(self, current_config, dispatch_seconds):
+        current_config.return_value.admins = ['admin']
+        current_config.return_value.command_dedup_window = 0
+        current_config.return_value.command_journal = None
+
+        self.assertRaises(ValueError, perform_command, 'FOO;bar', auth='admin', handler='mylittlepony')
+
+        self.assertEqual(dispatch_seconds.observe.call_args[1]['outcome'], 'error')
+        self.assertEqual(dispatch_seconds.observe.call_args[1]['handler'], 'other')
+
+    @patch('livestatus_service.dispatcher.DISPATCH_SECONDS')
+    @patch('livestatus_service.dispatcher.get_current_configuration')
+    @patch('livestatus_service.dispatcher.perform_livestatus_query')
+    def test_should_measure_dry_runs_without_the_expanded_commands(self, query, current_config, dispatch_seconds):
+        current_config.return_value.admins = []
+        query.return_value = '[{"host_name": "devica01"}, {"host_name": "tuvdbs05"}]'
+
+        perform_mass_command('ENABLE_HOST_NOTIFICATIONS;{host_name}', selector='GET hosts', dry_run=True)
+
+        self.assertEqual(dispatch_seconds.observe.call_args[1],
+                         {'operation': 'mass_command', 'table': '', 'handler': 'livestatus', 'outcome': 'dry_run'})
+
+    @patch('livestatus_service.dispatcher.DISPATCH_SECONDS')
+    @patch('livestatus_service.dispatcher.get_current_configuration')
+    @patch('livestatus_service.dispatcher.perform_livestatus_query')
+    def test_should_measure_unknown_tables_as_other(self, query, current_config, dispatch_seconds):
+        current_config.return_value.admins = []
+
+        perform_query('GET hosts_{0}\nColumns: host_name'.format('x' * 100), handler='livestatus')
+
+        self.assertEqual(dispatch_seconds.observe.call_args[1]['table'], 'other')
@@ -22,7 +22,10 @@ THE SOFTWARE.
 
 import unittest
 
-from livestatus_service.external_commands import get_command_group_and_arg
+from livestatus_service.external_commands import (get_command_group_and_arg,
+                                                  get_template_columns,
+                                                  normalize_command,
+                                                  expand_command_template)
 
 
 class ExternalCommandsTests(unittest.TestCase):
@@ -50,3 +53,32 @@ class ExternalCommandsTests(unittest.TestCase):
         group, arg = get_command_group_and_arg("DISABLE_SERVICEGROUP_HOST_CHECKS;")
         self.assertEqual(group, "SERVICEGROUPNAME_CMDS")
         self.assertEqual(arg, '')
+
+    def test_get_template_columns_should_return_each_column_once(self):
+        columns = get_template_columns("SCHEDULE_SVC_DOWNTIME;{host_name};{description};{host_name}")
+        self.assertEqual(columns, ["host_name", "description"])
+
+    def test_expand_command_template_should_expand_one_command_per_row(self):
+        commands = expand_command_template("SCHEDULE_FORCED_SVC_CHECK;{host_name};{description};0",
+                                           [{"host_name": "devica01", "description": "ping"},
+                                            {"host_name": "tuvdbs05", "description": "disk"}])
+        self.assertEqual(commands, ["SCHEDULE_FORCED_SVC_CHECK;devica01;ping;0",
+                                    "SCHEDULE_FORCED_SVC_CHECK;tuvdbs05;disk;0"])
+
+    def test_expand_command_template_should_raise_exception_when_column_is_missing(self):
+        self.assertRaises(ValueError, expand_command_template,
+                          "ACKNOWLEDGE_HOST_PROBLEM;{host_name}", [{"name": "devica01"}])
+
+    def test_expand_command_template_should_refuse_values_with_newlines(self):
+        self.assertRaises(ValueError, expand_command_template,
+                          "ACKNOWLEDGE_HOST_PROBLEM;{host_name}", [{"host_name": "devica01\nSHUTDOWN_PROCESS"}])
+
+    def test_normalize_command_should_blank_out_ignored_arguments(self):
+        self.assertEqual(normalize_command("ACKNOWLEDGE_SVC_PROBLEM;host;svc;1;1;1;alice;on it", ["author"]),
+                         "ACKNOWLEDGE_SVC_PROBLEM;host;svc;1;1;1;;on it")
+        self.assertEqual(normalize_command("SCHEDULE_FORCED_SVC_CHECK;host;svc;1400000000", ["time", "author"]),
+                         "SCHEDULE_FORCED_SVC_CHECK;host;svc;")
+
+    def test_normalize_command_should_keep_commands_without_volatile_arguments(self):
+        self.assertEqual(normalize_command("ENABLE_HOST_NOTIFICATIONS;host", ["time", "author"]),
+                         "ENABLE_HOST_NOTIFICATIONS;host")
@@ -27,6 +27,12 @@ THE SOFTWARE.
 
 from __future__ import absolute_import
 from mock import patch, MagicMock, call
+import errno
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 
 try:
@@ -35,7 +41,10 @@ try:
 except ImportError:
     pass
 
-from livestatus_service.icinga import perform_command
+from livestatus_service.icinga import (perform_command,
+                                       perform_commands,
+                                       IcingaCommandPipeWriter,
+                                       IcingaCommandPipeUnavailableException)
 
 
 class IcingaTests(unittest.TestCase):
@@ -62,3 +71,116 @@ class IcingaTests(unittest.TestCase):
 
         mock_file = mock_open.return_value.__enter__.return_value
         mock_file.write.assert_called_with(b'[123] FOO;b\xc3\xa4r\n')
+
+    @patch('livestatus_service.icinga.open', create=True)
+    @patch('livestatus_service.icinga.time.time')
+    def test_should_write_all_commands_to_named_pipe_at_once(self, mock_time, mock_open):
+        mock_open.return_value = MagicMock(spec=file)
+        mock_time.return_value = '123'
+
+        perform_commands(['FOO;bar', 'FOO;baz'], '/path/to/commandfile.cmd')
+
+        mock_file = mock_open.return_value.__enter__.return_value
+        mock_file.write.assert_called_once_with(b'[123] FOO;bar\n[123] FOO;baz\n')
+
+    @patch('livestatus_service.icinga.open', create=True)
+    def test_should_raise_unavailable_exception_when_command_file_cannot_be_opened(self, mock_open):
+        mock_open.side_effect = IOError('No such device or address')
+
+        self.assertRaises(IcingaCommandPipeUnavailableException, perform_command, 'FOO;bar', '/path/to/commandfile.cmd')
+
+
+class IcingaCommandPipeWriterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.pipe_path = os.path.join(self.directory, 'icinga.cmd')
+        os.mkfifo(self.pipe_path)
+        self.logger_patcher = patch('livestatus_service.icinga.LOGGER')
+        self.logger_patcher.start()
+
+    def tearDown(self):
+        self.logger_patcher.stop()
+        shutil.rmtree(self.directory)
+
+    def test_should_raise_exception_when_nobody_reads_the_pipe(self):
+        writer = IcingaCommandPipeWriter(self.pipe_path, queue_size=10, timeout=0.3)
+
+        self.assertRaises(IcingaCommandPipeUnavailableException, writer.send_commands, ['FOO;bar'])
+
+    @patch('livestatus_service.icinga.time.time')
+    def test_should_write_commands_to_the_pipe(self, mock_time):
+        mock_time.return_value = 123
+        reader = os.open(self.pipe_path, os.O_RDONLY | os.O_NONBLOCK)
+        try:
+            writer = IcingaCommandPipeWriter(self.pipe_path, queue_size=10, timeout=5)
+
+            writer.send_commands([u'FOO;bär', 'FOO;baz'])
+
+            self.assertEqual(os.read(reader, 4096), b'[123] FOO;b\xc3\xa4r\n[123] FOO;baz\n')
+        finally:
+            os.close(reader)
+
+    def test_should_coalesce_queued_commands_into_one_write(self):
+        writer = IcingaCommandPipeWriter(self.pipe_path, queue_size=10, timeout=5)
+        senders = [threading.Thread(target=writer.send_commands, args=(['FOO;{0}'.format(i)],)) for i in range(5)]
+        with patch('livestatus_service.icinga.os.write') as mock_write:
+            mock_write.side_effect = lambda fd, data: len(data)
+            reader = os.open(self.pipe_path, os.O_RDONLY | os.O_NONBLOCK)
+            try:
+                with patch.object(writer, '_start_if_necessary'):
+                    for sender in senders:
+                        sender.start()
+                    while writer._queue.qsize() < 5:
+                        pass
+                writer._start_if_necessary()
+                for sender in senders:
+                    sender.join()
+            finally:
+                os.close(reader)
+
+        self.assertEqual(mock_write.call_count, 1)
+        self.assertEqual(mock_write.call_args[0][1].count(b'FOO;'), 5)
+
+    def test_should_split_batches_at_pipe_buf(self):
+        writer = IcingaCommandPipeWriter(self.pipe_path, queue_size=10, timeout=5)
+        writer.PIPE_BUF = 30
+        for i in range(3):
+            writer._queue.put(MagicMock(data=b'x' * 12, deadline=float('inf')))
+
+        self.assertEqual(len(writer._next_batch()), 2)
+        self.assertEqual(len(writer._next_batch()), 1)
+
+    def test_should_split_commands_at_command_boundaries_into_pipe_buf_chunks(self):
+        writer = IcingaCommandPipeWriter(self.pipe_path, queue_size=10, timeout=5)
+        writer.PIPE_BUF = 30
+
+        with patch('livestatus_service.icinga.time.time', return_value=123):
+            chunks = writer._split_into_atomic_writes(['FOO;a', 'FOO;b', 'FOO;c'])
+
+        self.assertEqual(chunks, [b'[123] FOO;a\n[123] FOO;b\n', b'[123] FOO;c\n'])
+
+    def test_should_refuse_commands_longer_than_pipe_buf(self):
+        writer = IcingaCommandPipeWriter(self.pipe_path, queue_size=10, timeout=5)
+        writer.PIPE_BUF = 20
+
+        self.assertRaises(ValueError, writer.send_commands, ['FOO;' + 'x' * 20])
+
+    def test_should_fail_partial_writes_instead_of_continuing_them(self):
+        writer = IcingaCommandPipeWriter(self.pipe_path, queue_size=10, timeout=5)
+        with patch('livestatus_service.icinga.os.open', return_value=99), \
+                patch('livestatus_service.icinga.os.close'), \
+                patch('livestatus_service.icinga.os.write', return_value=3) as mock_write:
+            self.assertRaises(IcingaCommandPipeUnavailableException, writer._write, b'[123] FOO;a\n', time.time() + 5)
+
+        self.assertEqual(mock_write.call_count, 1)
+
+    def test_should_write_whole_chunk_again_after_reopening_on_epipe(self):
+        writer = IcingaCommandPipeWriter(self.pipe_path, queue_size=10, timeout=5)
+        with patch('livestatus_service.icinga.os.open', return_value=99), \
+                patch('livestatus_service.icinga.os.close'), \
+                patch('livestatus_service.icinga.os.write') as mock_write:
+            mock_write.side_effect = [OSError(errno.EPIPE, 'Broken pipe'), 12]
+            writer._write(b'[123] FOO;a\n', time.time() + 5)
+
+        self.assertEqual([c[0][1] for c in mock_write.call_args_list], [b'[123] FOO;a\n'] * 2)
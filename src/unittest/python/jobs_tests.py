@@ -0,0 +1,83 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from mock import Mock
+import unittest
+
+from livestatus_service.jobs import CommandJob, CommandJobExecutor, CommandQueueFullException
+
+
+class CommandJobExecutorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.execute_batch = Mock()
+        self.executor = CommandJobExecutor(self.execute_batch, queue_size=3, batch_size=2, retained_jobs=2)
+        self.executor._start_if_necessary = Mock()
+
+    def test_should_queue_submitted_jobs(self):
+        job = self.executor.submit('FOO;bar', auth='ftp', handler='icinga')
+
+        self.assertEqual(job.status, CommandJob.QUEUED)
+        self.assertEqual((job.command, job.auth, job.handler), ('FOO;bar', 'ftp', 'icinga'))
+        self.assertEqual(self.executor.queue_depth, 1)
+        self.assertEqual(self.executor.get(job.id), job)
+
+    def test_should_raise_exception_when_queue_is_full(self):
+        for _ in range(3):
+            self.executor.submit('FOO;bar')
+
+        self.assertRaises(CommandQueueFullException, self.executor.submit, 'FOO;bar')
+
+    def test_should_only_retain_the_latest_jobs(self):
+        first_job = self.executor.submit('FOO;bar')
+        self.executor.submit('FOO;bar')
+        self.executor.submit('FOO;bar')
+
+        self.assertEqual(self.executor.get(first_job.id), None)
+
+    def test_should_execute_jobs_in_batches(self):
+        jobs = [self.executor.submit('FOO;{0}'.format(i)) for i in range(3)]
+
+        self.executor._execute_next_batch()
+        self.executor._execute_next_batch()
+
+        self.assertEqual([call[0][0] for call in self.execute_batch.call_args_list], [jobs[:2], jobs[2:]])
+
+    def test_should_fail_unfinished_jobs_when_batch_execution_raises(self):
+        self.execute_batch.side_effect = lambda jobs: jobs[0].succeed('OK') or 1 / 0
+        jobs = [self.executor.submit('FOO;{0}'.format(i)) for i in range(2)]
+
+        self.executor._execute_next_batch()
+
+        self.assertEqual([job.status for job in jobs], [CommandJob.DONE, CommandJob.FAILED])
+
+    def test_job_should_describe_itself(self):
+        job = CommandJob('FOO;bar')
+        job.fail(ValueError('not allowed'))
+
+        job_status = job.as_dict()
+
+        self.assertEqual(job_status['status'], CommandJob.FAILED)
+        self.assertEqual(job_status['error'], 'not allowed')
+        self.assertEqual(job_status['id'], job.id)
@@ -0,0 +1,100 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from mock import patch
+import simplejson as json
+import unittest
+
+from livestatus_service.joins import join_hosts_with_services, build_query, fetch_concurrently, stream_json
+
+
+class JoinTests(unittest.TestCase):
+
+    def test_build_query_should_add_missing_join_column_and_filters(self):
+        self.assertEqual(build_query('services', ['description'], 'host_name', 'Filter: state = 2'),
+                         'GET services\nColumns: host_name description\nFilter: state = 2')
+        self.assertEqual(build_query('hosts', ['state', 'name'], 'name'), 'GET hosts\nColumns: state name')
+
+    def test_build_query_should_reject_lines_other_than_filters(self):
+        self.assertRaises(ValueError, build_query, 'hosts', ['name'], 'name', 'Filter: state = 1\nStats: state = 0')
+
+    @patch('livestatus_service.joins.SNAPSHOTS')
+    @patch('livestatus_service.joins.fetch_answer')
+    def test_fetch_concurrently_should_return_answers_in_order_of_queries(self, fetch_answer, snapshots):
+        snapshots.answer.side_effect = lambda query, auth: [['snapshot']] if 'hosts' in query else None
+        fetch_answer.side_effect = lambda query, socket_path, auth: [[query]]
+
+        answers = fetch_concurrently(['GET hosts', 'GET services', 'GET contacts'], '/path/to/socket', 'user')
+
+        self.assertEqual(answers, [[['snapshot']], [['GET services']], [['GET contacts']]])
+        snapshots.answer.assert_any_call('GET services', 'user')
+
+    @patch('livestatus_service.joins.SNAPSHOTS')
+    @patch('livestatus_service.joins.fetch_answer')
+    def test_fetch_concurrently_should_raise_failure_of_any_query(self, fetch_answer, snapshots):
+        snapshots.answer.return_value = None
+
+        def fail_for_services(query, socket_path, auth):
+            if 'services' in query:
+                raise RuntimeError('no services')
+            return []
+        fetch_answer.side_effect = fail_for_services
+
+        self.assertRaises(RuntimeError, fetch_concurrently, ['GET hosts', 'GET services'], '/path/to/socket')
+
+    @patch('livestatus_service.joins.fetch_concurrently')
+    def test_should_nest_services_into_their_hosts(self, fetch_concurrently):
+        fetch_concurrently.return_value = [[['alpha', 0], ['beta', 1]],
+                                           [['alpha', 'ping', 0], ['alpha', 'disk', 2], ['gamma', 'ping', 0]]]
+
+        hosts = join_hosts_with_services(['state'], ['description', 'state'], '', 'Filter: state != 1', '/path/to/socket')
+
+        fetch_concurrently.assert_called_with(['GET hosts\nColumns: name state',
+                                               'GET services\nColumns: host_name description state\nFilter: state != 1'],
+                                              '/path/to/socket', None)
+        self.assertEqual(hosts, [{'state': 0, 'services': [{'description': 'ping', 'state': 0},
+                                                           {'description': 'disk', 'state': 2}]},
+                                 {'state': 1, 'services': []}])
+
+    @patch('livestatus_service.joins.fetch_concurrently')
+    def test_should_key_joined_hosts_like_query_answers(self, fetch_concurrently):
+        fetch_concurrently.return_value = [[['alpha', 0]], [['alpha', 'ping']]]
+
+        hosts = join_hosts_with_services(['name', 'state'], ['host_name', 'description'], '', '', '/path/to/socket',
+                                         key='name', auth='user')
+
+        self.assertEqual(hosts, {'alpha': {'name': 'alpha', 'state': 0,
+                                           'services': [{'host_name': 'alpha', 'description': 'ping'}]}})
+
+    def test_should_reject_services_host_column(self):
+        self.assertRaises(ValueError, join_hosts_with_services, ['name', 'services'], ['description'], '', '', '/path/to/socket')
+
+    def test_stream_json_should_yield_one_host_per_line(self):
+        hosts = [{'name': 'alpha'}, {'name': 'beta'}]
+
+        chunks = list(stream_json(hosts))
+
+        self.assertEqual(''.join(chunks), '[\n{"name": "alpha"},\n{"name": "beta"}\n]\n')
+        self.assertEqual(json.loads(''.join(stream_json({'alpha': {'name': 'alpha'}}))), {'alpha': {'name': 'alpha'}})
+        self.assertEqual(json.loads(''.join(stream_json([]))), [])
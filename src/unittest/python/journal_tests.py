@@ -0,0 +1,164 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from livestatus_service.journal import CommandJournal
+
+
+class CommandJournalTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.journal_path = os.path.join(self.directory, 'commands.journal')
+        self.journal = CommandJournal(self.journal_path, compact_size=1024 * 1024)
+        self.logger_patcher = patch('livestatus_service.journal.LOGGER')
+        self.logger_patcher.start()
+
+    def tearDown(self):
+        self.logger_patcher.stop()
+        shutil.rmtree(self.directory)
+
+    def test_should_not_have_pending_commands_without_journal_file(self):
+        self.assertFalse(self.journal.has_pending_commands())
+
+    def test_should_have_pending_commands_after_append(self):
+        self.journal.append('FOO;bar', auth='ftp', handler='icinga')
+
+        self.assertTrue(self.journal.has_pending_commands())
+
+    def test_should_replay_commands_in_order(self):
+        self.journal.append('FOO;bar', auth='ftp')
+        self.journal.append('FOO;baz', handler='icinga')
+        replayed = []
+
+        self.journal.replay(lambda entries: replayed.extend(entries) or len(entries))
+
+        self.assertEqual([(entry['command'], entry['auth'], entry['handler']) for entry in replayed],
+                         [('FOO;bar', 'ftp', None), ('FOO;baz', None, 'icinga')])
+        self.assertFalse(self.journal.has_pending_commands())
+
+    def test_should_continue_behind_the_handled_commands(self):
+        for command in ('FOO;1', 'FOO;2', 'FOO;3'):
+            self.journal.append(command)
+
+        self.journal.replay(lambda entries: 1)
+        replayed = []
+        self.journal.replay(lambda entries: replayed.extend(entries) or len(entries))
+
+        self.assertEqual([entry['command'] for entry in replayed], ['FOO;2', 'FOO;3'])
+
+    def test_should_keep_pending_commands_across_instances(self):
+        self.journal.append('FOO;bar')
+
+        other_journal = CommandJournal(self.journal_path, compact_size=1024 * 1024)
+
+        self.assertTrue(other_journal.has_pending_commands())
+
+    def test_should_compact_replayed_commands(self):
+        journal = CommandJournal(self.journal_path, compact_size=1)
+        journal.append('FOO;1')
+        journal.append('FOO;2')
+
+        journal.replay(lambda entries: 1)
+
+        with open(self.journal_path) as journal_file:
+            self.assertTrue('FOO;1' not in journal_file.read())
+        replayed = []
+        journal.replay(lambda entries: replayed.extend(entries) or len(entries))
+        self.assertEqual([entry['command'] for entry in replayed], ['FOO;2'])
+
+    def test_should_append_to_the_compacted_journal(self):
+        journal = CommandJournal(self.journal_path, compact_size=1)
+        journal.append('FOO;1')
+        journal.replay(lambda entries: len(entries))
+
+        journal.append('FOO;2')
+
+        replayed = []
+        journal.replay(lambda entries: replayed.extend(entries) or len(entries))
+        self.assertEqual([entry['command'] for entry in replayed], ['FOO;2'])
+
+    def test_should_accept_appends_while_replaying(self):
+        self.journal.append('FOO;1')
+
+        def submit(entries):
+            self.journal.append('FOO;2')
+            return len(entries)
+        self.assertEqual(self.journal.replay(submit), 1)
+
+        replayed = []
+        self.journal.replay(lambda entries: replayed.extend(entries) or len(entries))
+        self.assertEqual([entry['command'] for entry in replayed], ['FOO;2'])
+
+    def test_should_not_replay_concurrently(self):
+        self.journal.append('FOO;1')
+        other_journal = CommandJournal(self.journal_path, compact_size=1024 * 1024)
+        nested_replays = []
+
+        def submit(entries):
+            nested_replays.append(other_journal.replay(lambda entries: len(entries)))
+            return len(entries)
+        self.journal.replay(submit)
+
+        self.assertEqual(nested_replays, [0])
+        self.assertFalse(self.journal.has_pending_commands())
+
+    def test_should_not_apply_checkpoint_of_previous_generation_to_compacted_journal(self):
+        journal = CommandJournal(self.journal_path, compact_size=1)
+        for command in ('FOO;1', 'FOO;2', 'FOO;3'):
+            journal.append(command)
+
+        write_checkpoint = journal._write_checkpoint
+        checkpoints = []
+
+        def die_after_compaction(*position):
+            # the service dies after the journal was compacted, before the checkpoint is reset
+            checkpoints.append(position)
+            if len(checkpoints) > 1:
+                raise SystemExit()
+            write_checkpoint(*position)
+        with patch.object(journal, '_write_checkpoint', side_effect=die_after_compaction):
+            self.assertRaises(SystemExit, journal.replay, lambda entries: 1)
+
+        replayed = []
+        journal.replay(lambda entries: replayed.extend(entries) or len(entries))
+        self.assertEqual([entry['command'] for entry in replayed], ['FOO;2', 'FOO;3'])
+
+    def test_should_read_checkpoint_without_generation(self):
+        for command in ('FOO;1', 'FOO;2'):
+            self.journal.append(command)
+        with open(self.journal_path, 'rb') as journal_file:
+            first_entry_size = len(journal_file.readline())
+        with open(self.journal_path + '.checkpoint', 'w') as checkpoint_file:
+            checkpoint_file.write(str(first_entry_size))
+
+        replayed = []
+        self.journal.replay(lambda entries: replayed.extend(entries) or len(entries))
+        self.assertEqual([entry['command'] for entry in replayed], ['FOO;2'])
@@ -23,25 +23,104 @@ THE SOFTWARE.
 '''
 
 from mock import patch, call, PropertyMock
+import logging
 import unittest
 
 import livestatus_service
-from livestatus_service import initialize_logging
+from livestatus_service import initialize_logging, shutdown_logging
 
 
 class LivestatusServiceInitializationTests(unittest.TestCase):
 
-    @patch('livestatus_service.initialize_logging')
-    @patch('livestatus_service.Configuration')
-    def test_should_initialize_logging_with_current_configuration(self, mock_config, mock_initialize_logging):
+    def setUp(self):
+        self.mock_config = self._patch('livestatus_service.Configuration')
+        self.mock_initialize_logging = self._patch('livestatus_service.initialize_logging')
+        self.mock_registry = self._patch('livestatus_service.REGISTRY')
+        self._patch('livestatus_service.SLOW_QUERY_LOG')
+        self.mock_profiler = self._patch('livestatus_service.REQUEST_PROFILER')
+        self.mock_span_exporter = self._patch('livestatus_service.SPAN_EXPORTER')
+        self.mock_traffic_recorder = self._patch('livestatus_service.TRAFFIC_RECORDER')
+        self.mock_change_feed = self._patch('livestatus_service.CHANGE_FEED')
+        self.mock_snapshots = self._patch('livestatus_service.SNAPSHOTS')
+        self.mock_shared_cache = self._patch('livestatus_service.SHARED_CACHE')
+
+    def _patch(self, target):
+        patcher = patch(target)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def tearDown(self):
+        shutdown_logging()
+
+    def test_should_initialize_logging_with_current_configuration(self):
         config_properties = PropertyMock()
         config_properties.log_file = '/foo/bar/baz.log'
-        mock_config.return_value = config_properties
+        config_properties.log_level = logging.WARNING
+        self.mock_config.return_value = config_properties
 
         livestatus_service.initialize('/foo/bar/config.cfg')
 
         self.assertEqual(
-            mock_initialize_logging.call_args, call(config_properties.log_file))
+            self.mock_initialize_logging.call_args, call(config_properties.log_file, logging.WARNING))
+
+    def test_should_use_configured_metrics_directory(self):
+        self.mock_config.return_value.metrics_directory = '/dev/shm/livestatus-metrics'
+
+        livestatus_service.initialize('/foo/bar/config.cfg')
+
+        self.mock_registry.use_directory.assert_called_with('/dev/shm/livestatus-metrics')
+
+    def test_should_configure_request_profiler(self):
+        self.mock_config.return_value.profile_directory = '/var/tmp/livestatus-profiles'
+        self.mock_config.return_value.profile_sample_rate = 1000
+        self.mock_config.return_value.profile_retention = 10
+
+        livestatus_service.initialize('/foo/bar/config.cfg')
+
+        self.mock_profiler.configure.assert_called_with('/var/tmp/livestatus-profiles', 1000, 10)
+
+    def test_should_configure_span_exporter(self):
+        self.mock_config.return_value.trace_export = '/var/run/otel.sock'
+        self.mock_config.return_value.trace_batch_size = 100
+
+        livestatus_service.initialize('/foo/bar/config.cfg')
+
+        self.mock_span_exporter.configure.assert_called_with('/var/run/otel.sock', 100)
+
+    def test_should_configure_traffic_recorder(self):
+        self.mock_config.return_value.traffic_recording = '/var/log/livestatus-traffic.log'
+
+        livestatus_service.initialize('/foo/bar/config.cfg')
+
+        self.mock_traffic_recorder.configure.assert_called_with('/var/log/livestatus-traffic.log')
+
+    def test_should_configure_change_feed(self):
+        self.mock_config.return_value.change_feed_subscribers = 50
+
+        livestatus_service.initialize('/foo/bar/config.cfg')
+
+        self.mock_change_feed.configure.assert_called_with(50)
+
+    def test_should_configure_table_snapshots(self):
+        self.mock_config.return_value.snapshot_tables = ['hosts', 'services']
+        self.mock_config.return_value.livestatus_socket = '/var/lib/icinga/rw/live'
+        self.mock_config.return_value.snapshot_refresh_interval = 5.0
+        self.mock_config.return_value.snapshot_reload_interval = 60.0
+
+        livestatus_service.initialize('/foo/bar/config.cfg')
+
+        self.mock_snapshots.configure.assert_called_with(['hosts', 'services'], '/var/lib/icinga/rw/live', 5.0, 60.0)
+
+    def test_should_configure_shared_cache(self):
+        self.mock_config.return_value.shared_cache = '/dev/shm/livestatus-service.cache'
+        self.mock_config.return_value.shared_cache_size = 1048576
+        self.mock_config.return_value.shared_cache_ttl = 2.0
+        self.mock_config.return_value.shared_cache_auth_ttl = 30.0
+        self.mock_config.return_value.shared_cache_max_stale = 10.0
+
+        livestatus_service.initialize('/foo/bar/config.cfg')
+
+        self.mock_shared_cache.configure.assert_called_with('/dev/shm/livestatus-service.cache', 1048576, 2.0, 30.0, 10.0)
 
     @patch('livestatus_service.logging.FileHandler')
     def test_initialize_logging_should_create_log_file_handler(self, mock_file_handler):
@@ -49,3 +128,31 @@ class LivestatusServiceInitializationTests(unittest.TestCase):
 
         self.assertEqual(
             mock_file_handler.call_args, call('/path/to/log/file'))
+
+    @patch('livestatus_service.logging.FileHandler')
+    def test_initialize_logging_should_set_configured_level(self, mock_file_handler):
+        initialize_logging('/path/to/log/file', logging.WARNING)
+
+        self.assertEqual(logging.getLogger('livestatus').level, logging.WARNING)
+        self.assertEqual(logging.getLogger('werkzeug').level, logging.WARNING)
+
+    @patch('livestatus_service.logging.FileHandler')
+    def test_initialize_logging_twice_should_not_duplicate_handlers(self, mock_file_handler):
+        handlers_before = len(logging.getLogger('livestatus').handlers)
+
+        initialize_logging('/path/to/log/file')
+        handlers_once = len(logging.getLogger('livestatus').handlers)
+        initialize_logging('/path/to/log/file')
+
+        self.assertEqual(len(logging.getLogger('livestatus').handlers), handlers_once)
+        self.assertTrue(handlers_once > handlers_before)
+
+    @patch('livestatus_service.logging.FileHandler')
+    def test_shutdown_logging_should_remove_handlers(self, mock_file_handler):
+        handlers_before = len(logging.getLogger('livestatus').handlers)
+        initialize_logging('/path/to/log/file')
+
+        shutdown_logging()
+
+        self.assertEqual(len(logging.getLogger('livestatus').handlers), handlers_before)
+        self.assertTrue(mock_file_handler.return_value.close.called)
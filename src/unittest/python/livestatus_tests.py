@@ -24,14 +24,20 @@ THE SOFTWARE.
 
 from __future__ import absolute_import
 from mock import patch
+import simplejson as json
+import socket
 import unittest
 
 import livestatus_service
 from livestatus_service.livestatus import (perform_query,
                                            LivestatusSocket,
                                            perform_command,
+                                           perform_commands,
                                            format_answer,
                                            NoColumnsSpecifiedException,
+                                           LivestatusSocketUnavailableException,
+                                           get_table,
+                                           serialize_answer,
                                            determine_columns_to_show_from_query)
 
 
@@ -61,6 +67,12 @@ class LivestatusTests(unittest.TestCase):
             self.fail(
                 'Socket instantiation with wrong path should throw an error')
 
+    @patch('livestatus_service.livestatus.socket.socket')
+    def test_should_raise_unavailable_exception_when_socket_refuses_connections(self, mock_socket):
+        mock_socket.return_value.connect.side_effect = socket.error('Connection refused')
+
+        self.assertRaises(LivestatusSocketUnavailableException, perform_command, 'foobar', '/path/to/socket')
+
     @patch('livestatus_service.livestatus.format_answer')
     @patch('livestatus_service.livestatus.socket.socket')
     def test_should_read_query_answer_fully(self, mock_socket, format_answer):
@@ -111,6 +123,62 @@ class LivestatusTests(unittest.TestCase):
         mock_socket.return_value.send.assert_called_with(
             b'COMMAND [123] foobar\n')
 
+    @patch('livestatus_service.livestatus.time.time')
+    @patch('livestatus_service.livestatus.socket.socket')
+    def test_should_send_all_commands_at_once(self, mock_socket, time):
+        time.return_value = 123
+
+        perform_commands(['foo', 'bar'], '/path/to/socket')
+
+        mock_socket.return_value.sendall.assert_called_with(
+            b'COMMAND [123] foo\n\nCOMMAND [123] bar\n')
+
+    @patch('livestatus_service.server_timing.PHASE_SECONDS')
+    @patch('livestatus_service.livestatus.socket.socket')
+    def test_should_measure_query_phases(self, mock_socket, phase_seconds):
+        mock_socket.return_value.recv.side_effect = [b'[["devica01"]]', None]
+
+        perform_query('GET hosts\nColumns: host_name', '/path/to/socket')
+
+        self.assertEqual([c[1]['phase'] for c in phase_seconds.observe.call_args_list],
+                         ['connect', 'send', 'first_byte', 'receive', 'parse', 'format', 'serialize'])
+        self.assertEqual(set(c[1]['table'] for c in phase_seconds.observe.call_args_list), set(['hosts']))
+
+    @patch('livestatus_service.livestatus.SLOW_QUERY_LOG')
+    @patch('livestatus_service.livestatus.socket.socket')
+    def test_should_record_query_in_slow_query_log(self, mock_socket, slow_query_log):
+        mock_socket.return_value.recv.side_effect = [b'[["devica01"]]', None]
+
+        perform_query('GET hosts\nColumns: host_name', '/path/to/socket')
+
+        query, _, rows, received_bytes = slow_query_log.record.call_args[0]
+        self.assertEqual((query, rows, received_bytes), ('GET hosts\nColumns: host_name', 1, 14))
+
+    @patch('livestatus_service.livestatus.LOGGER')
+    @patch('livestatus_service.livestatus.socket.socket')
+    def test_should_log_only_first_rows_of_answer(self, mock_socket, logger):
+        logger.isEnabledFor.return_value = True
+        mock_socket.return_value.recv.side_effect = [json.dumps([[i] for i in range(100)]).encode('utf-8'), None]
+
+        perform_query('GET hosts\nColumns: host_name', '/path/to/socket')
+
+        self.assertEqual(logger.debug.call_args[0][1:], (100, 10, [[i] for i in range(10)]))
+
+    @patch('livestatus_service.livestatus.LOGGER')
+    @patch('livestatus_service.livestatus.socket.socket')
+    def test_should_not_log_answer_unless_debug_is_enabled(self, mock_socket, logger):
+        logger.isEnabledFor.return_value = False
+        mock_socket.return_value.recv.side_effect = [b'[["devica01"]]', None]
+
+        perform_query('GET hosts\nColumns: host_name', '/path/to/socket')
+
+        self.assertFalse(any('Answer' in c[0][0] for c in logger.debug.call_args_list))
+
+    def test_get_table_should_return_queried_table(self):
+        self.assertEqual(get_table('GET hosts\nColumns: host_name'), 'hosts')
+        self.assertEqual(get_table('GET services'), 'services')
+        self.assertEqual(get_table('foobar'), '')
+
 
 class LivestatusAnswerParsingTests(unittest.TestCase):
 
@@ -257,6 +325,13 @@ Columns: host_name notifications_enabled''', [["devica01", 1], ["tuvdbs05", 1],
         self.assertEqual(
             answer, [{'notifications_enabled': 1, 'host_name': 'devica01'}])
 
+    def test_should_serialize_answer_with_parsed_perf_data(self):
+        answer = serialize_answer('GET services\nColumns: description perf_data', [['ping', 'rta=0.5ms;100;200']],
+                                  'description', 'structured')
+
+        self.assertEqual(json.loads(answer), {'ping': {'description': 'ping', 'perf_data': [
+            {'label': 'rta', 'value': 0.5, 'unit': 'ms', 'warn': 100.0, 'crit': 200.0, 'min': None, 'max': None}]}})
+
     def test_should_skip_rows_where_the_key_is_missing(self):
         answer = format_answer('GET hosts\nColumns: foo bar baz\n', [
                                ["foo1", "bar1", "baz1"], ["foo2", "bar2"]], 'baz')
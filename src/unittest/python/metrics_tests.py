@@ -0,0 +1,131 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+import shutil
+import tempfile
+import unittest
+
+from livestatus_service.metrics import MetricsRegistry, table_label, handler_label, outcome_label
+
+
+class MetricsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_should_expose_counter_with_labels(self):
+        counter = self.registry.counter('rows', 'Rows answered.', ('table',))
+
+        counter.inc(3, table='hosts')
+        counter.inc(2, table='hosts')
+        counter.inc(table='services')
+
+        self.assertEqual(self.registry.exposition(), '\n'.join([
+            '# HELP rows Rows answered.',
+            '# TYPE rows counter',
+            'rows_total{table="hosts"} 5',
+            'rows_total{table="services"} 1']) + '\n')
+
+    def test_should_expose_cumulative_histogram_buckets(self):
+        histogram = self.registry.histogram('latency', 'Latency.', ('phase',), buckets=(0.1, 1.0))
+
+        histogram.observe(0.05, phase='connect')
+        histogram.observe(0.5, phase='connect')
+        histogram.observe(5, phase='connect')
+
+        self.assertEqual(self.registry.exposition(), '\n'.join([
+            '# HELP latency Latency.',
+            '# TYPE latency histogram',
+            'latency_bucket{phase="connect",le="0.1"} 1',
+            'latency_bucket{phase="connect",le="1"} 2',
+            'latency_bucket{phase="connect",le="+Inf"} 3',
+            'latency_count{phase="connect"} 3',
+            'latency_sum{phase="connect"} 5.55']) + '\n')
+
+    def test_should_escape_label_values(self):
+        counter = self.registry.counter('rows', 'Rows answered.', ('table',))
+
+        counter.inc(table='ho"sts')
+
+        self.assertTrue('rows_total{table="ho\\"sts"} 1' in self.registry.exposition())
+
+
+class SharedMetricsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_should_aggregate_values_of_all_processes(self):
+        registry = MetricsRegistry()
+        registry.use_directory(self.directory)
+        counter = registry.counter('rows', 'Rows answered.', ('table',))
+        counter.inc(2, table='hosts')
+        other_process_registry = MetricsRegistry()
+        other_process_registry.use_directory(self.directory)
+        other_process_registry.values.FILE_PATTERN = 'metrics_other_{0}.db'
+        other_process_registry.counter('rows', 'Rows answered.', ('table',)).inc(3, table='hosts')
+
+        self.assertTrue('rows_total{table="hosts"} 5' in registry.exposition())
+
+    def test_should_keep_values_when_the_file_grows(self):
+        registry = MetricsRegistry()
+        registry.use_directory(self.directory)
+        registry.values.INITIAL_SIZE = 64
+        counter = registry.counter('rows', 'Rows answered.', ('table',))
+
+        for table in range(20):
+            counter.inc(table, table=str(table))
+
+        exposition = registry.exposition()
+        self.assertTrue('rows_total{table="0"} 0' in exposition)
+        self.assertTrue('rows_total{table="19"} 19' in exposition)
+
+    def test_should_continue_with_values_of_the_existing_file(self):
+        registry = MetricsRegistry()
+        registry.use_directory(self.directory)
+        registry.counter('rows', 'Rows answered.', ('table',)).inc(2, table='hosts')
+
+        reopened_registry = MetricsRegistry()
+        reopened_registry.use_directory(self.directory)
+        reopened_registry.counter('rows', 'Rows answered.', ('table',)).inc(2, table='hosts')
+
+        self.assertTrue('rows_total{table="hosts"} 4' in reopened_registry.exposition())
+
+
+class LabelTests(unittest.TestCase):
+
+    def test_should_limit_tables_to_livestatus_tables(self):
+        self.assertEqual([table_label(table) for table in ('hosts', '', 'hosts\nFilter: x')], ['hosts', '', 'other'])
+
+    def test_should_limit_handlers_to_known_handlers(self):
+        self.assertEqual([handler_label(handler) for handler in (None, 'livestatus', 'icinga', 'pony')],
+                         ['livestatus', 'livestatus', 'icinga', 'other'])
+
+    def test_should_limit_outcomes_to_fixed_set(self):
+        self.assertEqual([outcome_label(result) for result in ('OK', 'QUEUED', 'COALESCED', '[{"a": 1}]', None)],
+                         ['ok', 'queued', 'coalesced', 'ok', 'ok'])
+        self.assertEqual(outcome_label('["FOO;bar"]', dry_run=True), 'dry_run')
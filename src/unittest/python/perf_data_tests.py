@@ -0,0 +1,92 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from mock import patch
+import unittest
+
+from livestatus_service import perf_data
+from livestatus_service.perf_data import parse_perf_data, parse_perf_data_batch, format_perf_data
+
+
+class PerfDataTests(unittest.TestCase):
+
+    def test_should_parse_nagios_performance_data(self):
+        metrics = parse_perf_data("'rta'=0.5ms;100;200;0; pl=0%;20;60;; 'disk ''/'''=12,5GB;;~:20;0;100")
+
+        self.assertEqual(metrics, (('rta', 0.5, 'ms', 100.0, 200.0, 0.0, None),
+                                   ('pl', 0.0, '%', 20.0, 60.0, None, None),
+                                   ("disk '/'", 12.5, 'GB', None, '~:20', 0.0, 100.0)))
+
+    def test_should_skip_items_which_are_no_metrics(self):
+        self.assertEqual(parse_perf_data('garbage state=up time=U;@10:20 count=3c'),
+                         (('time', None, '', '@10:20', None, None, None), ('count', 3.0, 'c', None, None, None, None)))
+        self.assertEqual(parse_perf_data(''), ())
+        self.assertEqual(parse_perf_data(None), ())
+
+    def test_should_parse_every_string_once(self):
+        with patch('livestatus_service.perf_data._metric', wraps=perf_data._metric) as metric:
+            parse_perf_data('cached_metric=1')
+            parse_perf_data('cached_metric=1')
+
+        self.assertEqual(metric.call_count, 1)
+
+    def test_should_parse_repeated_strings_of_batch_once(self):
+        with patch('livestatus_service.perf_data._parse', wraps=perf_data._parse) as parse:
+            metrics = parse_perf_data_batch(['batch_metric=1', 'batch_metric=1', 'batch_other=2'])
+
+        self.assertEqual(parse.call_count, 2)
+        self.assertEqual([metric[0][0] for metric in metrics], ['batch_metric', 'batch_metric', 'batch_other'])
+
+    @patch('livestatus_service.perf_data.PARSED_CACHE_SIZE', 1)
+    def test_should_start_over_when_cache_is_full(self):
+        parse_perf_data('first=1')
+        parse_perf_data('second=2')
+
+        self.assertEqual(list(perf_data._PARSED.keys()), ['second=2'])
+
+    def test_should_replace_perf_data_of_rows_by_structured_metrics(self):
+        answer = {'alpha': {'host_name': 'alpha', 'perf_data': 'rta=1ms load=0.5'}}
+
+        formatted = format_perf_data(answer, 'structured')
+
+        self.assertEqual([metric['label'] for metric in formatted['alpha']['perf_data']], ['rta', 'load'])
+        self.assertEqual(formatted['alpha']['perf_data'][0],
+                         {'label': 'rta', 'value': 1.0, 'unit': 'ms', 'warn': None, 'crit': None, 'min': None, 'max': None})
+
+    def test_should_return_one_column_per_field_and_row_column(self):
+        answer = [{'host_name': 'alpha', 'perf_data': 'rta=1ms load=0.5'},
+                  {'host_name': 'beta', 'perf_data': ''},
+                  {'host_name': 'gamma', 'perf_data': 'rta=2ms;5'}]
+
+        columns = format_perf_data(answer, 'columnar')
+
+        self.assertEqual(columns['host_name'], ['alpha', 'alpha', 'gamma'])
+        self.assertEqual(columns['label'], ['rta', 'load', 'rta'])
+        self.assertEqual(columns['value'], [1.0, 0.5, 2.0])
+        self.assertEqual(columns['unit'], ['ms', '', 'ms'])
+        self.assertEqual(columns['warn'], [None, None, 5.0])
+
+    def test_should_reject_answers_without_perf_data(self):
+        self.assertRaises(ValueError, format_perf_data, [{'host_name': 'alpha'}], 'structured')
+        self.assertRaises(ValueError, format_perf_data, [], 'raw')
@@ -0,0 +1,93 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import unittest
+
+from livestatus_service.profiling import RequestProfiler
+
+
+class RequestProfilerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.profiler = RequestProfiler(self.directory, sample_rate=0, retained_profiles=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_should_not_profile_without_directory(self):
+        self.assertFalse(RequestProfiler().should_profile(requested_by_admin=True))
+
+    def test_should_profile_requests_of_admins(self):
+        self.assertTrue(self.profiler.should_profile(requested_by_admin=True))
+        self.assertFalse(self.profiler.should_profile(requested_by_admin=False))
+
+    def test_should_profile_one_in_sample_rate_requests(self):
+        self.profiler.configure(self.directory, 3, 2)
+
+        self.assertEqual([self.profiler.should_profile() for _ in range(6)],
+                         [False, False, True, False, False, True])
+
+    def test_should_write_loadable_profile_and_return_result(self):
+        result, profile_name = self.profiler.run('perform_query', sorted, [3, 1, 2])
+
+        self.assertEqual(result, [1, 2, 3])
+        self.assertEqual(self.profiler.list_profiles(), [profile_name])
+        self.assertTrue(profile_name.endswith('-perform_query.pstats'))
+        pstats.Stats(self.profiler.get_profile_path(profile_name))
+
+    def test_should_keep_only_the_newest_profiles(self):
+        profile_names = [self.profiler.run('perform_query', sorted, [])[1] for _ in range(3)]
+
+        self.assertEqual(self.profiler.list_profiles(), list(reversed(profile_names[1:])))
+
+    def test_should_not_resolve_unknown_profiles(self):
+        open(os.path.join(self.directory, 'other.txt'), 'w').close()
+
+        self.assertEqual(self.profiler.get_profile_path('../other.pstats'), None)
+        self.assertEqual(self.profiler.get_profile_path('other.txt'), None)
+
+    def test_should_run_concurrent_requests_without_profiling(self):
+        profiling_started = threading.Event()
+        finish_profiling = threading.Event()
+
+        def slow_request():
+            profiling_started.set()
+            finish_profiling.wait(5)
+            return 'slow'
+        profiled = threading.Thread(target=self.profiler.run, args=('perform_query', slow_request))
+        profiled.start()
+        profiling_started.wait(5)
+
+        concurrent_result = self.profiler.run('perform_query', sorted, [2, 1])
+        finish_profiling.set()
+        profiled.join(5)
+
+        self.assertEqual(concurrent_result, ([1, 2], None))
+        self.assertEqual(len(self.profiler.list_profiles()), 1)
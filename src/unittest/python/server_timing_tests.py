@@ -0,0 +1,74 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from mock import patch
+import unittest
+
+from livestatus_service import server_timing
+
+
+class ServerTimingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.phase_seconds_patcher = patch('livestatus_service.server_timing.PHASE_SECONDS')
+        self.phase_seconds = self.phase_seconds_patcher.start()
+
+    def tearDown(self):
+        server_timing.stop()
+        self.phase_seconds_patcher.stop()
+
+    def test_should_only_record_metrics_outside_of_a_request(self):
+        server_timing.record_phase('connect', 0.5, 'hosts')
+
+        self.phase_seconds.observe.assert_called_with(0.5, phase='connect', table='hosts')
+        self.assertEqual(server_timing.stop(), None)
+
+    def test_should_sum_up_phases_of_the_request_in_order(self):
+        server_timing.start()
+
+        server_timing.record_phase('config', 0.001)
+        server_timing.record_phase('connect', 0.002)
+        server_timing.record_phase('config', 0.001)
+        timings = server_timing.stop()
+
+        self.assertEqual(timings.phases, ['config', 'connect'])
+        self.assertEqual(timings.durations['config'], 0.002)
+
+    @patch('livestatus_service.server_timing.time.time')
+    def test_should_describe_phases_in_header(self, mock_time):
+        mock_time.return_value = 100
+        server_timing.start()
+        server_timing.record_phase('first_byte', 0.25)
+        mock_time.return_value = 100.5
+
+        self.assertEqual(server_timing.stop().header_value(),
+                         'first_byte;desc="livestatus wait";dur=250.000, total;desc="total";dur=500.000')
+
+    def test_should_count_rows_and_bytes(self):
+        server_timing.start()
+
+        server_timing.count('rows', 2)
+        server_timing.count('rows', 3)
+
+        self.assertEqual(server_timing.stop().counts, {'rows': 5})
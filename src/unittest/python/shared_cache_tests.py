@@ -0,0 +1,166 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from mock import patch
+import os
+import shutil
+import tempfile
+import unittest
+
+from livestatus_service.shared_cache import SharedCache, HEADER_SIZE, ENTRY
+
+
+class TinySharedCache(SharedCache):
+    SETS = 1
+    WAYS = 2
+
+
+class SharedCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'livestatus-service.cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def tiny_cache(self, ring_size=64):
+        return TinySharedCache(self.path, HEADER_SIZE + 2 * ENTRY.size + ring_size, ttl=5.0)
+
+    def test_should_not_cache_when_disabled(self):
+        cache = SharedCache()
+        cache.put('key', b'payload')
+
+        self.assertEqual(cache.get('key'), None)
+
+    def test_should_reject_too_small_caches(self):
+        self.assertRaises(ValueError, SharedCache, self.path, 1024)
+
+    def test_should_return_stored_payload(self):
+        cache = SharedCache(self.path, 1048576)
+
+        cache.put('key', b'payload')
+        cache.put('other key', b'other payload')
+
+        self.assertEqual(cache.get('key'), b'payload')
+        self.assertEqual(cache.get('other key'), b'other payload')
+        self.assertEqual(cache.get('unknown key'), None)
+
+    def test_should_share_payloads_with_other_instances_of_the_file(self):
+        SharedCache(self.path, 1048576).put('key', b'payload')
+
+        self.assertEqual(SharedCache(self.path, 1048576).get('key'), b'payload')
+
+    def test_should_reinitialize_file_of_other_geometry(self):
+        SharedCache(self.path, 1048576).put('key', b'payload')
+
+        self.assertEqual(SharedCache(self.path, 2097152).get('key'), None)
+        self.assertEqual(os.path.getsize(self.path), 2097152)
+
+    @patch('livestatus_service.shared_cache.time.time')
+    def test_should_expire_payloads(self, time):
+        cache = SharedCache(self.path, 1048576, ttl=5.0)
+        time.return_value = 1000.0
+        cache.put('key', b'payload')
+        cache.put('auth key', b'1', ttl=60.0)
+
+        time.return_value = 1005.0
+
+        self.assertEqual(cache.get('key'), None)
+        self.assertEqual(cache.get('auth key'), b'1')
+
+    @patch('livestatus_service.shared_cache.time.time')
+    def test_should_return_stale_payloads_within_their_stale_window(self, time):
+        cache = SharedCache(self.path, 1048576, ttl=5.0)
+        time.return_value = 1000.0
+        cache.put('key', b'payload', max_stale=10.0)
+
+        time.return_value = 1002.0
+        self.assertEqual(cache.get_entry('key'), (b'payload', 2.0, True))
+        time.return_value = 1007.0
+        self.assertEqual(cache.get_entry('key'), (b'payload', 7.0, False))
+        self.assertEqual(cache.get('key'), None)
+        time.return_value = 1015.0
+        self.assertEqual(cache.get_entry('key'), None)
+
+    @patch('livestatus_service.shared_cache.time.time')
+    def test_should_grant_claim_to_one_caller_until_released_or_timed_out(self, time):
+        time.return_value = 1000.0
+        cache = SharedCache(self.path, 1048576)
+
+        self.assertTrue(cache.claim('key', 60.0))
+        self.assertFalse(SharedCache(self.path, 1048576).claim('key', 60.0))
+        self.assertTrue(cache.claim('other key', 60.0))
+        cache.release('key')
+        self.assertTrue(cache.claim('key', 60.0))
+        time.return_value = 1060.0
+        self.assertTrue(cache.claim('key', 60.0))
+        self.assertEqual(cache.get('key'), None)
+
+    def test_should_not_store_payloads_larger_than_an_eighth_of_the_ring(self):
+        cache = self.tiny_cache()
+
+        cache.put('key', b'x' * 9)
+
+        self.assertEqual(cache.get('key'), None)
+
+    def test_should_read_payloads_wrapping_around_the_ring(self):
+        cache = self.tiny_cache(ring_size=16)
+        cache.put('a', b'1')
+        for _ in range(7):
+            cache.put('b', b'23')
+
+        cache.put('c', b'AB')
+
+        self.assertEqual(cache._written(), 17)
+        self.assertEqual(cache.get('c'), b'AB')
+
+    def test_should_lose_payloads_overwritten_by_the_ring(self):
+        cache = self.tiny_cache(ring_size=16)
+        cache.put('a', b'12')
+        cache.put('b', b'34')
+        for _ in range(7):
+            cache.put('b', b'34')
+
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('b'), b'34')
+
+    def test_should_evict_least_recently_used_entry_of_a_set(self):
+        cache = self.tiny_cache()
+        cache.put('a', b'1')
+        cache.put('b', b'2')
+        cache.get('a')
+
+        cache.put('c', b'3')
+
+        self.assertEqual(cache.get('a'), b'1')
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('c'), b'3')
+
+    def test_should_treat_unusable_file_as_miss(self):
+        cache = SharedCache(os.path.join(self.directory, 'missing', 'livestatus-service.cache'), 1048576)
+
+        cache.put('key', b'payload')
+
+        self.assertEqual(cache.get('key'), None)
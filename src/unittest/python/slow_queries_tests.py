@@ -0,0 +1,97 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from mock import patch
+import time
+import unittest
+
+from livestatus_service.slow_queries import SlowQueryLog, fingerprint
+
+
+class FingerprintTests(unittest.TestCase):
+
+    def test_should_strip_filter_values(self):
+        self.assertEqual(fingerprint('GET services\nColumns: description state\nFilter: host_name = devica01'),
+                         'GET services\nColumns: description state\nFilter: host_name = ?')
+
+    def test_should_give_queries_of_the_same_shape_the_same_fingerprint(self):
+        self.assertEqual(fingerprint('GET hosts\nFilter: state >= 1\nFilter: name ~ ^dev\nOr: 2\nLimit: 10'),
+                         fingerprint('GET hosts\nFilter: state >= 2\nFilter: name ~ ^tuv foo\nOr: 2\nLimit: 20'))
+
+    def test_should_keep_stats_without_values_and_drop_auth_user(self):
+        self.assertEqual(fingerprint('GET services\nStats: state = 2\nStats: sum execution_time\nAuthUser: ftp\n'),
+                         'GET services\nStats: state = ?\nStats: sum execution_time')
+
+
+class SlowQueryLogTests(unittest.TestCase):
+
+    def setUp(self):
+        self.slow_query_log = SlowQueryLog(threshold=1.0, log_interval=300, max_fingerprints=2)
+        patcher = patch('livestatus_service.slow_queries.LOGGER')
+        self.logger = patcher.start()
+        self.addCleanup(patcher.stop)
+        timer_patcher = patch.object(self.slow_query_log, '_start_logging')
+        timer_patcher.start()
+        self.addCleanup(timer_patcher.stop)
+
+    def test_should_ignore_fast_queries(self):
+        self.slow_query_log.record('GET hosts', 0.5, 10, 100)
+
+        self.assertEqual(self.slow_query_log.summary(), [])
+        self.assertFalse(self.logger.warn.called)
+
+    def test_should_aggregate_slow_queries_by_fingerprint(self):
+        for seconds in (1.0, 2.0, 3.0, 4.0):
+            self.slow_query_log.record('GET hosts\nFilter: name = host{0}'.format(seconds), seconds, 10, 100)
+
+        self.assertEqual(self.slow_query_log.summary(), [{'fingerprint': 'GET hosts\nFilter: name = ?',
+                                                          'count': 4,
+                                                          'total_seconds': 10.0,
+                                                          'p50_seconds': 3.0,
+                                                          'p95_seconds': 4.0,
+                                                          'max_seconds': 4.0,
+                                                          'rows': 40,
+                                                          'bytes': 400}])
+        self.assertEqual(self.logger.warn.call_count, 4)
+
+    def test_should_drop_the_least_recently_seen_fingerprint(self):
+        with patch('livestatus_service.slow_queries.time.time') as mock_time:
+            for now, query in enumerate(['GET hosts', 'GET services', 'GET hosts', 'GET contacts']):
+                mock_time.return_value = now
+                self.slow_query_log.record(query, 2.0, 1, 1)
+
+        self.assertEqual([entry['fingerprint'] for entry in self.slow_query_log.summary()],
+                         ['GET hosts', 'GET contacts'])
+
+    def test_should_log_summary_periodically_without_further_queries(self):
+        slow_query_log = SlowQueryLog(threshold=1.0, log_interval=0.01)
+        slow_query_log.record('GET hosts', 2.0, 1, 1)
+
+        for _ in range(500):
+            if self.logger.info.called:
+                break
+            time.sleep(0.01)
+
+        self.assertTrue(self.logger.info.called)
+        self.assertEqual(self.logger.info.call_args[0][1], 'GET hosts')
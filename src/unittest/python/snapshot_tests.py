@@ -0,0 +1,236 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from mock import patch
+import time
+import unittest
+
+from livestatus_service.snapshot import (SnapshotStore, SnapshotQuery, TableSnapshot, UnsupportedQueryException,
+                                         NumberColumn, EncodedColumn)
+
+COLUMNS = ['name', 'state', 'groups', 'contacts', 'plugin_output', 'last_check']
+ROWS = [['alpha', 0, ['web', 'db'], ['alice'], 'OK - fine', 100],
+        ['beta', 2, ['web'], ['bob'], 'CRITICAL - down', 200],
+        ['gamma', 2, [], ['alice', 'bob'], 'CRITICAL - Disk full', 300]]
+
+
+def hosts_snapshot():
+    snapshot = TableSnapshot('hosts', COLUMNS)
+    snapshot.load([list(row) for row in ROWS], time.time())
+    return snapshot
+
+
+def answer(query, auth=None):
+    return SnapshotQuery(hosts_snapshot(), query).answer(auth)
+
+
+class TableSnapshotTests(unittest.TestCase):
+
+    def test_should_replace_updated_rows_in_place(self):
+        snapshot = hosts_snapshot()
+
+        snapshot.update([['alpha', 1, ['db'], ['alice'], 'WARNING', 400]], time.time())
+
+        self.assertEqual(snapshot.keys, [('alpha',), ('beta',), ('gamma',)])
+        self.assertEqual(SnapshotQuery(snapshot, 'GET hosts\nColumns: name state groups').answer(),
+                         [['alpha', 1, ['db']], ['beta', 2, ['web']], ['gamma', 2, []]])
+        self.assertEqual(snapshot.indexes['name'], {'alpha': set([0]), 'beta': set([1]), 'gamma': set([2])})
+        self.assertEqual(snapshot.indexes['groups']['web'], set([1]))
+
+    def test_should_select_candidates_from_indexes(self):
+        snapshot = hosts_snapshot()
+        snapshot.indexes['groups']['web'].discard(1)
+
+        self.assertEqual(SnapshotQuery(snapshot, 'GET hosts\nColumns: name\nFilter: groups >= web').answer(), [['alpha']])
+
+    def test_should_store_numbers_in_arrays_and_encode_other_values(self):
+        snapshot = hosts_snapshot()
+
+        self.assertTrue(isinstance(snapshot.column_values[1], NumberColumn))
+        self.assertEqual(snapshot.column_values[1].values.typecode, 'i')
+        self.assertTrue(isinstance(snapshot.column_values[2], EncodedColumn))
+        self.assertEqual(snapshot.column_values[3].dictionary, [('alice',), ('bob',), ('alice', 'bob')])
+
+    def test_should_encode_numbers_not_fitting_the_array(self):
+        snapshot = hosts_snapshot()
+
+        snapshot.update([['beta', 2.5, ['web'], ['bob'], 'CRITICAL', 2 ** 40]], time.time())
+        snapshot.update([['gamma', 2, [], ['alice', 'bob'], 'CRITICAL', 2 ** 70]], time.time())
+
+        self.assertTrue(isinstance(snapshot.column_values[1], EncodedColumn))
+        self.assertTrue(isinstance(snapshot.column_values[5], EncodedColumn))
+        self.assertEqual(SnapshotQuery(snapshot, 'GET hosts\nColumns: state last_check').answer(),
+                         [[0, 100], [2.5, 2 ** 40], [2, 2 ** 70]])
+
+    def test_should_widen_integer_arrays(self):
+        snapshot = hosts_snapshot()
+
+        snapshot.update([['beta', 2, ['web'], ['bob'], 'CRITICAL', 2 ** 40]], time.time())
+
+        self.assertEqual(snapshot.column_values[5].values.typecode, 'l')
+        self.assertEqual(snapshot.getter('last_check')(1), 2 ** 40)
+
+
+class EncodedColumnTests(unittest.TestCase):
+
+    def test_should_store_distinct_values_once(self):
+        column = EncodedColumn(['OK', 'OK', 'CRITICAL', 'OK'])
+
+        self.assertEqual(column.dictionary, ['OK', 'CRITICAL'])
+        self.assertEqual(list(column), ['OK', 'OK', 'CRITICAL', 'OK'])
+
+    def test_should_reuse_codes_of_values_no_longer_referenced(self):
+        column = EncodedColumn(['OK', 'CRITICAL'])
+
+        column.set(1, 'OK')
+        column.set(0, 'WARNING')
+
+        self.assertEqual(column.dictionary, ['OK', 'WARNING'])
+        self.assertEqual(list(column), ['WARNING', 'OK'])
+        self.assertEqual(column.free_codes, [])
+
+
+class SnapshotQueryTests(unittest.TestCase):
+
+    def test_should_answer_columns_in_the_order_of_the_query(self):
+        self.assertEqual(answer('GET hosts\nColumns: state name'), [[0, 'alpha'], [2, 'beta'], [2, 'gamma']])
+
+    def test_should_add_column_headers_when_asked_to(self):
+        self.assertEqual(answer('GET hosts\nColumns: name\nColumnHeaders: on\nLimit: 1'), [['name'], ['alpha']])
+
+    def test_should_filter_scalar_columns(self):
+        self.assertEqual(answer('GET hosts\nColumns: name\nFilter: last_check >= 200'), [['beta'], ['gamma']])
+        self.assertEqual(answer('GET hosts\nColumns: name\nFilter: name != alpha'), [['beta'], ['gamma']])
+        self.assertEqual(answer('GET hosts\nColumns: name\nFilter: plugin_output ~ ^CRIT'), [['beta'], ['gamma']])
+        self.assertEqual(answer('GET hosts\nColumns: name\nFilter: plugin_output ~~ disk'), [['gamma']])
+        self.assertEqual(answer('GET hosts\nColumns: name\nFilter: name =~ BETA'), [['beta']])
+        self.assertEqual(answer('GET hosts\nColumns: name\nFilter: plugin_output !~ CRIT'), [['alpha']])
+
+    def test_should_filter_list_columns(self):
+        self.assertEqual(answer('GET hosts\nColumns: name\nFilter: groups >= web'), [['alpha'], ['beta']])
+        self.assertEqual(answer('GET hosts\nColumns: name\nFilter: groups ='), [['gamma']])
+        self.assertEqual(answer('GET hosts\nColumns: name\nFilter: groups < db'), [['beta'], ['gamma']])
+        self.assertEqual(answer('GET hosts\nColumns: name\nFilter: groups <= WEB'), [['alpha'], ['beta']])
+
+    def test_should_combine_filters(self):
+        query = 'GET hosts\nColumns: name\nFilter: state = 0\nFilter: groups =\nOr: 2\nNegate:'
+
+        self.assertEqual(answer(query), [['beta']])
+
+    def test_should_only_answer_rows_of_contact(self):
+        self.assertEqual(answer('GET hosts\nColumns: name', auth='bob'), [['beta'], ['gamma']])
+
+    def test_should_answer_services_to_contacts_of_their_host(self):
+        snapshot = TableSnapshot('services', ['host_name', 'description', 'groups', 'contacts', 'host_contacts'])
+        snapshot.load([['alpha', 'ping', [], ['alice'], ['bob']],
+                       ['alpha', 'disk', [], ['carol'], ['bob']],
+                       ['beta', 'ping', [], ['alice'], ['carol']]], time.time())
+        query = 'GET services\nColumns: host_name description'
+
+        self.assertEqual(SnapshotQuery(snapshot, query).answer('bob'), [['alpha', 'ping'], ['alpha', 'disk']])
+        self.assertEqual(SnapshotQuery(snapshot, query).answer('alice'), [['alpha', 'ping'], ['beta', 'ping']])
+
+    def test_should_count_stats_grouped_by_columns(self):
+        query = 'GET hosts\nColumns: state\nStats: groups >= web\nStats: sum last_check\nStats: avg last_check'
+
+        self.assertEqual(answer(query), [[0, 1, 100, 100.0], [2, 1, 500, 250.0]])
+
+    def test_should_answer_stats_without_columns_in_one_row(self):
+        query = 'GET hosts\nColumns:\nStats: state = 0\nStats: state = 2\nStats: max last_check'
+
+        self.assertEqual(answer(query), [[1, 2, 300]])
+
+    def test_should_combine_stats_filters(self):
+        query = 'GET hosts\nColumns:\nStats: state = 0\nStats: groups >= db\nStatsAnd: 2\nStats: state = 2'
+
+        self.assertEqual(answer(query), [[1, 2]])
+
+    def test_should_not_answer_queries_beyond_the_snapshot(self):
+        snapshot = hosts_snapshot()
+        for query in ('GET hosts',
+                      'GET hosts\nColumns: address',
+                      'GET hosts\nColumns: name\nFilter: address = 10.0.0.1',
+                      'GET hosts\nColumns: name\nFilter: groups = web',
+                      'GET hosts\nColumns: name\nFilter: state ~ 2',
+                      'GET hosts\nColumns: name\nFilter: state = critical',
+                      'GET hosts\nColumns: name\nAnd: 2',
+                      'GET hosts\nColumns: name\nStats: std last_check',
+                      'GET hosts\nColumns: name\nStats: sum last_check\nStatsAnd: 1',
+                      'GET hosts\nColumns: name\nWaitTrigger: state'):
+            self.assertRaises(UnsupportedQueryException, SnapshotQuery, snapshot, query)
+
+
+class SnapshotStoreTests(unittest.TestCase):
+
+    def loaded_store(self):
+        store = SnapshotStore(['hosts'], '/path/to/socket', 10.0, 300.0)
+        store.snapshots['hosts'] = hosts_snapshot()
+        store._thread = 'started'
+        return store
+
+    def test_should_reject_unsupported_tables(self):
+        self.assertRaises(ValueError, SnapshotStore, ['downtimes'], '/path/to/socket')
+
+    def test_should_answer_queries_from_fresh_snapshots(self):
+        store = self.loaded_store()
+
+        self.assertEqual(store.answer('GET hosts\nColumns: name\nFilter: name = beta'), [['beta']])
+
+    def test_should_not_answer_other_tables_or_unsupported_queries(self):
+        store = self.loaded_store()
+
+        self.assertEqual(store.answer('GET services\nColumns: description'), None)
+        self.assertEqual(store.answer('GET hosts\nColumns: name\nFilter: name ~ ('), None)
+
+    def test_should_not_answer_from_stale_snapshots(self):
+        store = self.loaded_store()
+        store.snapshots['hosts'].refreshed_at = time.time() - 31
+
+        self.assertEqual(store.answer('GET hosts\nColumns: name'), None)
+
+    @patch('livestatus_service.snapshot.fetch_answer')
+    def test_should_load_snapshots_and_refresh_changed_rows(self, fetch_answer):
+        store = SnapshotStore(['hosts'], '/path/to/socket', 10.0, 300.0)
+        fetch_answer.side_effect = [[[1400000000]], [['alpha'] + [0] * 28],
+                                    [[1400000000]], [['beta'] + [0] * 28]]
+
+        store.refresh()
+        store.refresh()
+
+        self.assertEqual(store.snapshots['hosts'].keys, [('alpha',), ('beta',)])
+        refresh_query = fetch_answer.call_args_list[3][0][0]
+        self.assertTrue(refresh_query.startswith('GET hosts\nColumns: name alias display_name'))
+        self.assertTrue('Filter: last_check >= ' in refresh_query)
+
+    @patch('livestatus_service.snapshot.fetch_answer')
+    def test_should_reload_snapshots_when_the_core_restarted(self, fetch_answer):
+        store = SnapshotStore(['hosts'], '/path/to/socket', 10.0, 300.0)
+        fetch_answer.side_effect = [[[1400000000]], [['alpha'] + [0] * 28],
+                                    [[1400000100]], [['beta'] + [0] * 28]]
+
+        store.refresh()
+        store.refresh()
+
+        self.assertEqual(store.snapshots['hosts'].keys, [('beta',)])
+        self.assertFalse('Filter:' in fetch_answer.call_args_list[3][0][0])
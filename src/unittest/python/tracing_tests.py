@@ -0,0 +1,180 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from mock import patch
+import os
+import shutil
+import simplejson as json
+import socket
+import tempfile
+import threading
+import unittest
+
+from livestatus_service import tracing
+from livestatus_service.tracing import SPAN_EXPORTER, SpanExporter, start_trace, finish_trace, span, record_span
+
+
+class TracingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.trace_file = os.path.join(self.directory, 'spans.json')
+        SPAN_EXPORTER.configure(self.trace_file, 512)
+        patcher = patch.object(SPAN_EXPORTER, '_start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        SPAN_EXPORTER.configure(None, 512)
+        tracing._TRACE.spans = None
+        shutil.rmtree(self.directory)
+
+    def exported_spans(self):
+        SPAN_EXPORTER.flush()
+        with open(self.trace_file) as trace_file:
+            batches = [json.loads(line) for line in trace_file]
+        return [exported_span for batch in batches
+                for exported_span in batch['resourceSpans'][0]['scopeSpans'][0]['spans']]
+
+    def test_should_export_nothing_when_disabled(self):
+        SPAN_EXPORTER.configure(None, 512)
+
+        self.assertEqual(start_trace('GET /query'), None)
+        with span('livestatus.query') as current_span:
+            self.assertEqual(current_span, None)
+
+    def test_should_continue_trace_of_incoming_traceparent(self):
+        start_trace('GET /query', '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01')
+        with span('livestatus.query', table='hosts'):
+            record_span('connect', 0.001)
+        finish_trace(status=200)
+
+        connect, query, request = self.exported_spans()
+        self.assertEqual(set(s['traceId'] for s in (connect, query, request)), set(['0af7651916cd43dd8448eb211c80319c']))
+        self.assertEqual(request['parentSpanId'], 'b7ad6b7169203331')
+        self.assertEqual(request['kind'], tracing.SPAN_KIND_SERVER)
+        self.assertEqual(request['attributes'], [{'key': 'status', 'value': {'stringValue': '200'}}])
+        self.assertEqual(query['parentSpanId'], request['spanId'])
+        self.assertEqual(connect['parentSpanId'], query['spanId'])
+        self.assertEqual(int(connect['endTimeUnixNano']) - int(connect['startTimeUnixNano']), 1000000)
+
+    def test_should_not_trace_requests_the_caller_does_not_sample(self):
+        self.assertEqual(start_trace('GET /query', '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-00'), None)
+
+    def test_should_not_export_spans_of_requests_the_caller_does_not_sample(self):
+        start_trace('GET /cmd', '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-00')
+        with span('check_auth_hostname_cmds') as current_span:
+            record_span('connect', 0.001)
+        finish_trace(status=200)
+
+        self.assertEqual(current_span, None)
+        self.assertFalse(os.path.exists(self.trace_file))
+
+    def test_should_start_new_trace_without_traceparent(self):
+        root_span = start_trace('GET /query', 'garbage')
+
+        self.assertEqual(len(root_span.trace_id), 32)
+        self.assertEqual(root_span.parent_span_id, None)
+
+    def test_should_start_own_trace_outside_of_requests(self):
+        with span('icinga.command'):
+            pass
+
+        exported_span, = self.exported_spans()
+        self.assertFalse('parentSpanId' in exported_span)
+
+    def test_should_mark_failed_spans(self):
+        def fail():
+            with span('icinga.command'):
+                raise ValueError('broken pipe')
+        self.assertRaises(ValueError, fail)
+
+        exported_span, = self.exported_spans()
+        self.assertEqual(exported_span['status'], {'code': tracing.STATUS_CODE_ERROR, 'message': 'ValueError: broken pipe'})
+
+    def test_should_write_batches_of_configured_size(self):
+        SPAN_EXPORTER.configure(self.trace_file, 2)
+        for _ in range(3):
+            with span('icinga.command'):
+                pass
+        SPAN_EXPORTER.flush()
+
+        with open(self.trace_file) as trace_file:
+            self.assertEqual(len(trace_file.readlines()), 2)
+
+
+class SpanExporterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def finished_span(self):
+        finished_span = tracing.Span('0af7651916cd43dd8448eb211c80319c', 'icinga.command', start_ns=1000)
+        finished_span.end_ns = 2000
+        return finished_span
+
+    def test_should_send_batches_to_unix_socket_collector(self):
+        socket_path = os.path.join(self.directory, 'collector.sock')
+        collector = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        collector.settimeout(5)
+        collector.bind(socket_path)
+        collector.listen(1)
+        received = []
+
+        def collect():
+            connection, _ = collector.accept()
+            received.append(connection.makefile().readline())
+            connection.close()
+        collector_thread = threading.Thread(target=collect)
+        collector_thread.daemon = True
+        collector_thread.start()
+
+        exporter = SpanExporter(socket_path, 10)
+        exporter._write([self.finished_span()])
+        collector_thread.join(5)
+        collector.close()
+
+        self.assertEqual(json.loads(received[0])['resourceSpans'][0]['scopeSpans'][0]['spans'][0]['name'], 'icinga.command')
+
+    def test_should_drop_spans_when_collector_is_unavailable(self):
+        exporter = SpanExporter(os.path.join(self.directory, 'missing', 'spans.json'), 10)
+
+        with patch('livestatus_service.tracing.LOGGER'):
+            exporter._write([self.finished_span()])
+
+        self.assertEqual(exporter.dropped_spans, 1)
+
+    def test_should_drop_batches_that_cannot_be_serialized(self):
+        exporter = SpanExporter(os.path.join(self.directory, 'spans.json'), 10)
+        broken_span = self.finished_span()
+        broken_span.end_ns = None
+        broken_span.attributes = None
+
+        with patch('livestatus_service.tracing.LOGGER'):
+            exporter._write([broken_span])
+
+        self.assertEqual(exporter.dropped_spans, 1)
@@ -0,0 +1,79 @@
+'''
+The MIT License (MIT)
+
+Copyright (c) 2013 ImmobilienScout24
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from livestatus_service.traffic import TrafficRecorder, read_recording
+
+
+class TrafficRecorderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'traffic.log')
+        self.recorder = TrafficRecorder(self.path)
+
+    def tearDown(self):
+        self.recorder.configure(None)
+        shutil.rmtree(self.directory)
+
+    def test_should_not_record_when_disabled(self):
+        recorder = TrafficRecorder()
+
+        recorder.record('perform_query', 'GET hosts')
+
+        self.assertFalse(recorder.enabled)
+        self.assertEqual(recorder.recorded_requests, 0)
+
+    def test_should_record_requests_as_lines(self):
+        self.recorder.record('perform_query', 'GET hosts\nColumns: name', key='name', auth='ftp', handler='livestatus')
+        self.recorder.record('perform_mass_command', 'DISABLE_HOST_NOTIFICATIONS;{host_name}', parameters={'selector': 'GET hosts'})
+
+        recorded_requests = list(read_recording(self.path))
+
+        self.assertEqual(len(recorded_requests), 2)
+        self.assertEqual(recorded_requests[0]['endpoint'], 'perform_query')
+        self.assertEqual(recorded_requests[0]['q'], 'GET hosts\nColumns: name')
+        self.assertEqual(recorded_requests[0]['key'], 'name')
+        self.assertEqual(recorded_requests[0]['auth'], 'ftp')
+        self.assertEqual(recorded_requests[0]['handler'], 'livestatus')
+        self.assertEqual(recorded_requests[1]['parameters'], {'selector': 'GET hosts'})
+        self.assertTrue(recorded_requests[0]['timestamp'] <= recorded_requests[1]['timestamp'])
+
+    def test_should_count_failed_recordings_instead_of_raising(self):
+        recorder = TrafficRecorder(os.path.join(self.directory, 'missing', 'traffic.log'))
+
+        recorder.record('perform_query', 'GET hosts')
+
+        self.assertEqual(recorder.failed_requests, 1)
+
+    def test_should_skip_incomplete_lines(self):
+        self.recorder.record('perform_query', 'GET hosts')
+        with open(self.path, 'a') as recording:
+            recording.write('[1400000000.0, "perform_query", "GET ser')
+
+        self.assertEqual([recorded_request['q'] for recorded_request in read_recording(self.path)], ['GET hosts'])
@@ -23,16 +23,32 @@ THE SOFTWARE.
 '''
 
 from mock import patch, Mock
+import tempfile
 import unittest
 
 import livestatus_service
+from livestatus_service.jobs import CommandJob, CommandQueueFullException
+from livestatus_service.changes import TooManySubscribersException
+from livestatus_service.dispatcher import PermissionDeniedException
+from livestatus_service.livestatus import LivestatusSocketUnavailableException
+from livestatus_service import server_timing
 from livestatus_service.webapp import (validate_and_dispatch,
                                        validate_query,
                                        dispatch_request,
                                        handle_index,
                                        render_application_template,
                                        handle_command,
-                                       handle_query)
+                                       handle_mass_command,
+                                       handle_query,
+                                       handle_command_status,
+                                       handle_metrics,
+                                       handle_slow_queries,
+                                       handle_profile_download,
+                                       validate_flag,
+                                       validate_since,
+                                       validate_perf_data,
+                                       validate_selector,
+                                       application)
 
 
 class WebappTests(unittest.TestCase):
@@ -58,7 +74,7 @@ class WebappTests(unittest.TestCase):
 
         response = validate_and_dispatch(mock_request, lambda x: None)
 
-        self.assertEqual(response, ('Error : too fat to fly', 200))
+        self.assertEqual(response, ('Error : too fat to fly', 400, {'Cache-Control': 'no-store'}))
 
     def test_should_raise_exception_when_query_is_missing(self):
         self.assertRaises(BaseException, validate_query, None)
@@ -102,14 +118,365 @@ class WebappTests(unittest.TestCase):
 
     @patch('livestatus_service.webapp.validate_and_dispatch')
     def test_handle_command_should_dispatch_with_perform_command(self, mock_dispatch):
-        handle_command()
+        with application.test_request_context('/cmd?q=FOO'):
+            handle_command()
 
         mock_dispatch.assert_called_with(livestatus_service.webapp.request,
                                          livestatus_service.webapp.perform_command)
 
     @patch('livestatus_service.webapp.validate_and_dispatch')
     def test_handle_query_should_dispatch_with_perform_query(self, mock_dispatch):
-        handle_query()
+        mock_dispatch.return_value = ('Error : no', 400, {'Cache-Control': 'no-store'})
+
+        with application.test_request_context('/query?q=GET%20hosts'):
+            handle_query()
 
         mock_dispatch.assert_called_with(livestatus_service.webapp.request,
-                                         livestatus_service.webapp.perform_query)
+                                         livestatus_service.webapp.perform_query,
+                                         extra_parameters={'since': validate_since, 'perf_data': validate_perf_data})
+
+    @patch('livestatus_service.webapp.get_current_configuration')
+    @patch('livestatus_service.webapp.perform_query')
+    def test_query_response_should_carry_etag_and_configured_max_age(self, mock_perform_query, configuration):
+        configuration.return_value.query_max_age = {'hosts': 30}
+        mock_perform_query.return_value = '[["alpha"]]'
+
+        hosts_response = application.test_client().get('/query?q=GET%20hosts')
+        services_response = application.test_client().get('/query?q=GET%20services')
+
+        self.assertEqual(hosts_response.headers['Cache-Control'], 'max-age=30')
+        self.assertEqual(hosts_response.headers['Vary'], 'Authorization')
+        self.assertEqual(services_response.headers['Cache-Control'], 'no-cache')
+        self.assertEqual(hosts_response.headers['ETag'], services_response.headers['ETag'])
+
+    @patch('livestatus_service.webapp.get_current_configuration')
+    @patch('livestatus_service.webapp.perform_query')
+    def test_query_response_should_carry_age_and_freshness_of_cached_answers(self, mock_perform_query, configuration):
+        configuration.return_value.query_max_age = {}
+
+        def serve_stale_answer(*args, **kwargs):
+            server_timing.served_from_cache(7.5, False)
+            return '[["alpha"]]'
+        mock_perform_query.return_value = '[["alpha"]]'
+        live_response = application.test_client().get('/query?q=GET%20hosts')
+        mock_perform_query.side_effect = serve_stale_answer
+        stale_response = application.test_client().get('/query?q=GET%20hosts')
+
+        self.assertEqual((live_response.headers['Age'], live_response.headers['X-Livestatus-Freshness']), ('0', 'fresh'))
+        self.assertEqual((stale_response.headers['Age'], stale_response.headers['X-Livestatus-Freshness']), ('7', 'stale'))
+
+    @patch('livestatus_service.webapp.get_current_configuration')
+    @patch('livestatus_service.webapp.perform_query')
+    def test_query_should_answer_not_modified_for_matching_etag(self, mock_perform_query, configuration):
+        configuration.return_value.query_max_age = {}
+        mock_perform_query.return_value = '[["alpha"]]'
+        etag = application.test_client().get('/query?q=GET%20hosts').headers['ETag']
+
+        response = application.test_client().get('/query?q=GET%20hosts', headers={'If-None-Match': etag})
+        mock_perform_query.return_value = '[["beta"]]'
+        changed_response = application.test_client().get('/query?q=GET%20hosts', headers={'If-None-Match': etag})
+
+        self.assertEqual((response.status_code, response.data), (304, b''))
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual((changed_response.status_code, changed_response.data), (200, b'[["beta"]]\n'))
+
+    @patch('livestatus_service.webapp.perform_query')
+    def test_query_should_answer_errors_with_status_codes_which_are_not_cached(self, mock_perform_query):
+        for exception, status in ((ValueError('bad query'), 400),
+                                  (PermissionDeniedException('not allowed'), 403),
+                                  (LivestatusSocketUnavailableException('down'), 503),
+                                  (RuntimeError('bug'), 500)):
+            mock_perform_query.side_effect = exception
+
+            response = application.test_client().get('/query?q=GET%20hosts')
+
+            self.assertEqual(response.status_code, status)
+            self.assertEqual(response.headers['Cache-Control'], 'no-store')
+            self.assertFalse('ETag' in response.headers)
+
+    def test_validate_since_should_accept_unix_timestamps(self):
+        self.assertEqual(validate_since(None), None)
+        self.assertEqual(validate_since('1400000000'), 1400000000.0)
+        self.assertRaises(ValueError, validate_since, 'yesterday')
+
+    @patch('livestatus_service.webapp.validate_and_dispatch')
+    def test_handle_mass_command_should_dispatch_with_perform_mass_command(self, mock_dispatch):
+        handle_mass_command()
+
+        self.assertEqual(mock_dispatch.call_args[0], (livestatus_service.webapp.request,
+                                                      livestatus_service.webapp.perform_mass_command))
+
+    @patch('livestatus_service.webapp.dispatch_request')
+    def test_should_pass_validated_extra_parameters(self, dispatch_request):
+        mock_request = Mock()
+        mock_request.args = {'q': 'SCHEDULE_HOST_CHECK;{host_name};0',
+                             'selector': 'GET hosts\\nFilter: state = 1',
+                             'dry_run': 'true'}
+        mock_request.authorization = None
+
+        validate_and_dispatch(mock_request, 'noodles',
+                              extra_parameters={'selector': validate_selector, 'dry_run': validate_flag})
+
+        dispatch_request.assert_called_with('SCHEDULE_HOST_CHECK;{host_name};0', 'noodles', status=200, key=None, auth=None,
+                                            handler=mock_request.form.get.return_value,
+                                            selector='GET hosts\nFilter: state = 1', dry_run=True)
+
+    def test_should_raise_exception_when_selector_is_not_a_get_query(self):
+        self.assertRaises(ValueError, validate_selector, 'COMMAND foo')
+
+    def test_validate_flag_should_only_accept_true_values(self):
+        self.assertTrue(validate_flag('1'))
+        self.assertTrue(validate_flag('True'))
+        self.assertFalse(validate_flag('0'))
+        self.assertFalse(validate_flag(None))
+
+    @patch('livestatus_service.webapp.validate_and_dispatch')
+    def test_handle_command_should_submit_job_when_async_is_requested(self, mock_dispatch):
+        with application.test_request_context('/cmd?q=FOO&async=1'):
+            handle_command()
+
+        mock_dispatch.assert_called_with(livestatus_service.webapp.request,
+                                         livestatus_service.webapp.submit_command_job,
+                                         success_status=202)
+
+    def test_should_respond_with_success_status(self):
+        result = dispatch_request('foobar', lambda x: 'replaced', status=202)
+        self.assertEqual(result, ('replaced\n', 202))
+
+    @patch('livestatus_service.webapp.dispatch_request')
+    def test_should_respond_with_service_unavailable_when_command_queue_is_full(self, dispatch_request):
+        dispatch_request.side_effect = CommandQueueFullException('full')
+        mock_request = Mock()
+        mock_request.args = {'q': 'FOO;bar'}
+
+        with patch('livestatus_service.webapp.LOGGER.warn'):
+            response = validate_and_dispatch(mock_request, 'noodles')
+
+        self.assertEqual(response, ('Error : full', 503, {'Cache-Control': 'no-store', 'Retry-After': '1'}))
+
+    @patch('livestatus_service.webapp.find_command_job')
+    def test_handle_command_status_should_return_job_status(self, find_job):
+        find_job.return_value = CommandJob('FOO;bar')
+
+        body, status = handle_command_status('1234')
+
+        self.assertEqual(status, 200)
+        self.assertTrue('"status": "queued"' in body)
+
+    @patch('livestatus_service.webapp.find_command_job')
+    def test_handle_command_status_should_return_not_found_for_unknown_jobs(self, find_job):
+        find_job.return_value = None
+
+        self.assertEqual(handle_command_status('1234')[1], 404)
+
+    def test_handle_metrics_should_expose_prometheus_text_format(self):
+        body, status, headers = handle_metrics()
+
+        self.assertEqual(status, 200)
+        self.assertTrue(headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertTrue('# TYPE livestatus_service_request_seconds histogram' in body)
+
+    @patch('livestatus_service.webapp.REQUEST_SECONDS')
+    def test_should_measure_requests(self, request_seconds):
+        mock_request = Mock()
+        mock_request.args = {'q': 'GET hosts', 'handler': 'livestatus'}
+
+        validate_and_dispatch(mock_request, lambda query, **kwargs: '[]')
+
+        self.assertEqual(request_seconds.observe.call_args[1],
+                         {'endpoint': '<lambda>', 'handler': 'livestatus', 'outcome': 'ok'})
+
+    @patch('livestatus_service.webapp.perform_query')
+    def test_query_response_should_carry_server_timing_headers(self, mock_perform_query):
+        def perform_query(query, **kwargs):
+            server_timing.record_phase('connect', 0.002)
+            server_timing.record_phase('first_byte', 0.01)
+            server_timing.count('rows', 3)
+            return '[]'
+        mock_perform_query.side_effect = perform_query
+
+        response = application.test_client().get('/query?q=GET%20hosts')
+
+        self.assertTrue(response.headers['Server-Timing'].startswith(
+            'connect;desc="socket connect";dur=2.000, first_byte;desc="livestatus wait";dur=10.000, total;'))
+        self.assertEqual(response.headers['X-Livestatus-Rows'], '3')
+        self.assertFalse('X-Livestatus-Bytes' in response.headers)
+
+    @patch('livestatus_service.webapp.get_current_configuration')
+    def test_handle_slow_queries_should_refuse_non_admins(self, configuration):
+        configuration.return_value.admins = ['admin']
+
+        with application.test_request_context('/admin/slow_queries', headers={'Authorization': 'Basic ZnRwOnNlY3JldA=='}):
+            self.assertEqual(handle_slow_queries()[1], 403)
+
+    @patch('livestatus_service.webapp.CHANGE_FEED')
+    @patch('livestatus_service.webapp.subscribe_to_changes')
+    def test_handle_changes_should_stream_events_of_subscription(self, subscribe, change_feed):
+        change_feed.stream.return_value = iter(['event: snapshot\ndata: []\n\n'])
+
+        response = application.test_client().get('/changes?q=GET%20hosts%5CnColumns:%20name%20state&key=name')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        self.assertEqual(response.data, b'event: snapshot\ndata: []\n\n')
+        subscribe.assert_called_with('GET hosts\nColumns: name state', key='name', auth=None, handler=None)
+        change_feed.stream.assert_called_with(subscribe.return_value)
+
+    @patch('livestatus_service.webapp.subscribe_to_changes')
+    def test_handle_changes_should_reject_subscribers_above_maximum(self, subscribe):
+        subscribe.side_effect = TooManySubscribersException('too many')
+
+        response = application.test_client().get('/changes?q=GET%20hosts')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '10')
+
+    def test_handle_changes_should_reject_commands(self):
+        response = application.test_client().get('/changes?q=DISABLE_HOST_NOTIFICATIONS;devica01')
+
+        self.assertTrue(response.data.startswith(b'Error : The query must be a GET query.'))
+
+    def test_validate_perf_data_should_accept_known_outputs_only(self):
+        self.assertEqual(validate_perf_data(None), None)
+        self.assertEqual(validate_perf_data('columnar'), 'columnar')
+        self.assertRaises(ValueError, validate_perf_data, 'raw')
+
+    @patch('livestatus_service.webapp.perform_join_query')
+    def test_handle_hosts_with_services_should_stream_joined_hosts(self, join):
+        join.return_value = [{'name': 'alpha', 'services': [{'description': 'ping'}]}]
+
+        response = application.test_client().get('/hosts_with_services?host_columns=name&service_columns=description'
+                                                 '&service_filter=Filter:%20state%20=%202%5CnFilter:%20state%20=%203%5CnOr:%202')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/json')
+        self.assertEqual(response.data, b'[\n{"name": "alpha", "services": [{"description": "ping"}]}\n]\n')
+        join.assert_called_with(host_columns=['name'], service_columns=['description'], host_filter='',
+                                service_filter='Filter: state = 2\nFilter: state = 3\nOr: 2',
+                                key=None, auth=None, handler=None)
+
+    @patch('livestatus_service.webapp.TRAFFIC_RECORDER')
+    @patch('livestatus_service.webapp.REQUEST_SECONDS')
+    @patch('livestatus_service.webapp.perform_join_query')
+    def test_handle_hosts_with_services_should_measure_and_record_requests(self, join, request_seconds, traffic_recorder):
+        join.__name__ = 'perform_join_query'
+        join.return_value = []
+
+        application.test_client().get('/hosts_with_services?host_columns=name&service_columns=description&handler=livestatus')
+
+        self.assertEqual(request_seconds.observe.call_args[1],
+                         {'endpoint': 'perform_join_query', 'handler': 'livestatus', 'outcome': 'ok'})
+        traffic_recorder.record.assert_called_with('perform_join_query', None, None, None, 'livestatus',
+                                                   {'host_columns': 'name', 'service_columns': 'description',
+                                                    'host_filter': None, 'service_filter': None})
+
+    def test_handle_hosts_with_services_should_require_columns(self):
+        response = application.test_client().get('/hosts_with_services?host_columns=name')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.data.startswith(b'Error : The "service_columns" parameter is mandatory.'))
+
+    @patch('livestatus_service.webapp.perform_analytics')
+    def test_handle_analytics_should_pass_validated_analysis_parameters(self, analyse):
+        analyse.return_value = '{"rows": 0}'
+
+        response = application.test_client().get('/analytics?q=GET%20services&percentiles=latency,execution_time'
+                                                 '&percents=50%2099.9&top=execution_time&top_columns=host_name%20description')
+
+        self.assertEqual((response.status_code, response.data), (200, b'{"rows": 0}\n'))
+        analyse.assert_called_with('GET services', key=None, auth=None, handler=None,
+                                   percentiles=['latency', 'execution_time'], percents=[50.0, 99.9], histogram=[], bins=10,
+                                   group_by=[], top='execution_time', top_n=10, top_columns=['host_name', 'description'])
+
+    def test_handle_analytics_should_reject_invalid_parameters(self):
+        for parameters in ('percents=101', 'bins=0', 'top_n=many', 'top=latency%20state'):
+            response = application.test_client().get('/analytics?q=GET%20services&percentiles=latency&' + parameters)
+
+            self.assertEqual(response.status_code, 400, parameters)
+
+    @patch('livestatus_service.webapp.SLOW_QUERY_LOG')
+    @patch('livestatus_service.webapp.get_current_configuration')
+    def test_handle_slow_queries_should_show_summary_to_admins(self, configuration, slow_query_log):
+        configuration.return_value.admins = ['ftp']
+        slow_query_log.summary.return_value = [{'fingerprint': 'GET hosts', 'count': 1}]
+
+        with application.test_request_context('/admin/slow_queries', headers={'Authorization': 'Basic ZnRwOnNlY3JldA=='}):
+            body, status = handle_slow_queries()
+
+        self.assertEqual(status, 200)
+        self.assertTrue('"fingerprint": "GET hosts"' in body)
+
+    @patch('livestatus_service.webapp.TRAFFIC_RECORDER')
+    def test_should_record_dispatched_requests(self, traffic_recorder):
+        with application.test_request_context('/masscmd?q=DISABLE_HOST_NOTIFICATIONS;{host_name}&selector=GET%20hosts&handler=icinga'):
+            validate_and_dispatch(livestatus_service.webapp.request, lambda query, **kwargs: 'OK',
+                                  extra_parameters={'selector': lambda selector: selector})
+
+        traffic_recorder.record.assert_called_with('<lambda>', 'DISABLE_HOST_NOTIFICATIONS;{host_name}', None, None, 'icinga',
+                                                   {'selector': 'GET hosts'})
+
+    @patch('livestatus_service.webapp.REQUEST_PROFILER')
+    @patch('livestatus_service.webapp.get_current_configuration')
+    def test_should_profile_requests_of_admins_asking_for_it(self, configuration, profiler):
+        configuration.return_value.admins = ['ftp']
+        profiler.should_profile.side_effect = lambda requested_by_admin: requested_by_admin
+        profiler.run.return_value = (('[]\n', 200), 'profile.pstats')
+
+        with application.test_request_context('/query?q=GET%20hosts&profile=1', headers={'Authorization': 'Basic ZnRwOnNlY3JldA=='}):
+            response = validate_and_dispatch(livestatus_service.webapp.request, 'noodles')
+
+        self.assertEqual(response, ('[]\n', 200, {'X-Livestatus-Profile': 'profile.pstats'}))
+
+    @patch('livestatus_service.webapp.REQUEST_PROFILER')
+    @patch('livestatus_service.webapp.get_current_configuration')
+    def test_should_name_profile_of_streamed_response_in_header(self, configuration, profiler):
+        configuration.return_value.admins = ['ftp']
+        profiler.should_profile.side_effect = lambda requested_by_admin: requested_by_admin
+        profiler.run.side_effect = lambda name, function, *args, **kwargs: (function(*args, **kwargs), 'profile.pstats')
+
+        with application.test_request_context('/hosts_with_services?profile=1', headers={'Authorization': 'Basic ZnRwOnNlY3JldA=='}):
+            response = validate_and_dispatch(livestatus_service.webapp.request, lambda **kwargs: [], with_query=False, streamed=True)
+
+        self.assertEqual(response.headers['X-Livestatus-Profile'], 'profile.pstats')
+        self.assertEqual(response.mimetype, 'application/json')
+
+    @patch('livestatus_service.webapp.REQUEST_PROFILER')
+    @patch('livestatus_service.webapp.get_current_configuration')
+    def test_should_not_profile_requests_of_other_users(self, configuration, profiler):
+        configuration.return_value.admins = ['admin']
+        profiler.should_profile.side_effect = lambda requested_by_admin: requested_by_admin
+
+        with application.test_request_context('/query?q=GET%20hosts&profile=1', headers={'Authorization': 'Basic ZnRwOnNlY3JldA=='}):
+            response = validate_and_dispatch(livestatus_service.webapp.request, lambda query, **kwargs: '[]')
+
+        self.assertEqual(response, ('[]\n', 200))
+        self.assertFalse(profiler.run.called)
+
+    @patch('livestatus_service.webapp.REQUEST_PROFILER')
+    @patch('livestatus_service.webapp.get_current_configuration')
+    def test_handle_profile_download_should_return_profile_to_admins(self, configuration, profiler):
+        configuration.return_value.admins = ['ftp']
+        with tempfile.NamedTemporaryFile() as profile_file:
+            profile_file.write(b'profile')
+            profile_file.flush()
+            profiler.get_profile_path.return_value = profile_file.name
+
+            with application.test_request_context('/admin/profiles/x.pstats', headers={'Authorization': 'Basic ZnRwOnNlY3JldA=='}):
+                body, status, headers = handle_profile_download('x.pstats')
+
+        self.assertEqual((body, status), (b'profile', 200))
+        self.assertEqual(headers['Content-Disposition'], 'attachment; filename=x.pstats')
+
+    @patch('livestatus_service.webapp.REQUEST_PROFILER')
+    @patch('livestatus_service.webapp.get_current_configuration')
+    def test_handle_profile_download_should_return_not_found_for_unknown_profiles(self, configuration, profiler):
+        configuration.return_value.admins = ['ftp']
+        profiler.get_profile_path.return_value = None
+
+        with application.test_request_context('/admin/profiles/x.pstats', headers={'Authorization': 'Basic ZnRwOnNlY3JldA=='}):
+            self.assertEqual(handle_profile_download('x.pstats')[1], 404)
+
+    def test_index_response_should_not_carry_server_timing_header(self):
+        response = application.test_client().get('/')
+
+        self.assertFalse('Server-Timing' in response.headers)